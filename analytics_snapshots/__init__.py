@@ -0,0 +1,4 @@
+from .services import AnalyticsSnapshotService
+from .streaming import ReportStream
+
+__all__ = ['AnalyticsSnapshotService', 'ReportStream']
@@ -0,0 +1,172 @@
+from model import AnalyticsSnapshots
+from datetime import date, datetime
+from decimal import Decimal
+from extensions import db, scheduler
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+import threading
+import logging
+import json
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsSnapshotService:
+    """
+    نسخ محفوظة من التقارير التحليلية التي تحسب على كل الأجهزة
+
+    كل تقرير يسجل بدالة تحسب نتيجته، ومهمة مجدولة لكل تقرير تحفظ نسخة جديدة
+    برقم نسخة متزايد ووقت الإنشاء في جدول AnalyticsSnapshots. نقاط الوصول تعرض
+    آخر نسخة، ويمكن طلب تحديث فوري بـ refresh=true.
+    """
+
+    _reports = {}  # {report_name: builder}
+    _cache = {}  # {report_name: (version, generated_at, payload)}
+    _cache_lock = threading.Lock()
+    _keep = 5
+
+    @staticmethod
+    def register(report_name, builder):
+        """تسجيل تقرير بدالة تعيد نتيجة قابلة للتحويل إلى JSON"""
+        AnalyticsSnapshotService._reports[report_name] = builder
+        return builder
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('ANALYTICS_SNAPSHOT_MINUTES', 15)
+        # تعديل الفترة لتقرير معين: {"devices_replacement": 60}
+        app.config.setdefault('ANALYTICS_SNAPSHOT_SCHEDULE', {})
+        # عدد النسخ المحفوظة لكل تقرير
+        app.config.setdefault('ANALYTICS_SNAPSHOT_KEEP', 5)
+
+        AnalyticsSnapshotService._keep = int(app.config['ANALYTICS_SNAPSHOT_KEEP'])
+        schedule = app.config['ANALYTICS_SNAPSHOT_SCHEDULE']
+        for report_name in AnalyticsSnapshotService._reports:
+            minutes = int(schedule.get(report_name, app.config['ANALYTICS_SNAPSHOT_MINUTES']))
+            if minutes <= 0:
+                continue
+            scheduler.add_job(
+                id=f'analytics_snapshot_{report_name}',
+                func=_refresh_snapshot_job,
+                args=[report_name],
+                trigger='interval',
+                minutes=minutes,
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
+
+    @staticmethod
+    def _json_default(value):
+        if isinstance(value, Decimal):
+            return float(value)
+        if isinstance(value, (datetime, date)):
+            return value.isoformat()
+        raise TypeError(f"قيمة غير قابلة للتحويل إلى JSON: {type(value).__name__}")
+
+    @staticmethod
+    def refresh(report_name):
+        """
+        حساب التقرير الآن وحفظه كنسخة جديدة
+
+        :return: (version, generated_at, payload)
+        """
+        builder = AnalyticsSnapshotService._reports[report_name]
+        started = time.monotonic()
+        payload = builder()
+        duration_ms = int((time.monotonic() - started) * 1000)
+        # تخزين النتيجة كما ستعرض، والتحويل ذهاباً وإياباً يوحد شكل التواريخ والأرقام
+        payload_json = json.dumps(payload, ensure_ascii=False, default=AnalyticsSnapshotService._json_default)
+        generated_at = datetime.utcnow()
+
+        table = AnalyticsSnapshots.__table__
+        try:
+            version = (db.session.execute(
+                select(func.max(table.c.Version)).where(table.c.ReportName == report_name)
+            ).scalar() or 0) + 1
+            db.session.execute(table.insert().values(
+                ReportName=report_name,
+                Version=version,
+                GeneratedAt=generated_at,
+                DurationMs=duration_ms,
+                Payload=payload_json
+            ))
+            # حذف النسخ القديمة
+            db.session.execute(table.delete().where(
+                table.c.ReportName == report_name,
+                table.c.Version <= version - AnalyticsSnapshotService._keep
+            ))
+            db.session.commit()
+        except IntegrityError:
+            # نسخة أخرى حفظت بنفس الرقم في نفس اللحظة، نعرض الأحدث
+            db.session.rollback()
+            return AnalyticsSnapshotService.latest(report_name)
+        except Exception:
+            db.session.rollback()
+            raise
+
+        snapshot = (version, generated_at, json.loads(payload_json))
+        with AnalyticsSnapshotService._cache_lock:
+            AnalyticsSnapshotService._cache[report_name] = snapshot
+        return snapshot
+
+    @staticmethod
+    def latest(report_name, refresh=False):
+        """
+        آخر نسخة من التقرير، أو حسابه الآن إذا طلب ذلك أو لم توجد نسخة
+
+        رقم آخر نسخة يقرأ من الجدول في كل طلب (استعلام على الفهرس فقط)، ونص
+        النسخة لا يقرأ إلا إذا تغير الرقم عن المحفوظ في الذاكرة.
+        """
+        if refresh:
+            return AnalyticsSnapshotService.refresh(report_name)
+
+        table = AnalyticsSnapshots.__table__
+        version = db.session.execute(
+            select(func.max(table.c.Version)).where(table.c.ReportName == report_name)
+        ).scalar()
+        if version is None:
+            return AnalyticsSnapshotService.refresh(report_name)
+
+        cached = AnalyticsSnapshotService._cache.get(report_name)
+        if cached and cached[0] == version:
+            return cached
+
+        row = db.session.execute(
+            select(table.c.Version, table.c.GeneratedAt, table.c.Payload).where(
+                table.c.ReportName == report_name,
+                table.c.Version == version
+            )
+        ).first()
+        if row is None:
+            # حذفت بين الاستعلامين
+            return AnalyticsSnapshotService.refresh(report_name)
+
+        snapshot = (row.Version, row.GeneratedAt, json.loads(row.Payload))
+        with AnalyticsSnapshotService._cache_lock:
+            AnalyticsSnapshotService._cache[report_name] = snapshot
+        return snapshot
+
+    @staticmethod
+    def metadata(snapshot):
+        """بيانات النسخة التي تضاف للاستجابة"""
+        version, generated_at, _ = snapshot
+        return {
+            "version": version,
+            "generated_at": generated_at.strftime('%Y-%m-%dT%H:%M:%SZ')
+        }
+
+    @staticmethod
+    def wants_refresh(args):
+        return str(args.get('refresh', '')).lower() in ('1', 'true', 'yes')
+
+
+def _refresh_snapshot_job(report_name):
+    """مهمة الجدولة لحفظ نسخة جديدة من تقرير"""
+    with scheduler.app.app_context():
+        try:
+            version, _, _ = AnalyticsSnapshotService.refresh(report_name)
+            logger.info(f"تم حفظ النسخة {version} من التقرير {report_name}")
+        except Exception as e:
+            logger.error(f"خطأ أثناء تحديث التقرير {report_name}: {str(e)}")
@@ -0,0 +1,77 @@
+from flask import Response, current_app, stream_with_context
+from extensions import db
+from .services import AnalyticsSnapshotService
+import logging
+import json
+
+logger = logging.getLogger(__name__)
+
+
+class ReportStream:
+    """
+    بث التقارير التي تشمل كل الأجهزة بصيغة NDJSON (سطر JSON لكل جهاز)
+
+    الأجهزة تقرأ من قاعدة البيانات على دفعات بمفتاح رقم الجهاز (keyset) وكل نتيجة
+    تكتب في الاستجابة فور حسابها، وبعد كل دفعة تفرغ الجلسة (expunge_all) حتى
+    لا تتراكم الكائنات، فتبقى الذاكرة ثابتة مهما كان عدد الأجهزة.
+    """
+
+    MIMETYPE = 'application/x-ndjson'
+
+    @staticmethod
+    def init_app(app):
+        # عدد الأجهزة في كل دفعة، وحده الأعلى أقل من حد المعاملات في MSSQL (2100) لاستعلامات IN
+        app.config.setdefault('REPORT_STREAM_CHUNK_SIZE', 500)
+
+    @staticmethod
+    def chunk_size():
+        return max(1, min(int(current_app.config.get('REPORT_STREAM_CHUNK_SIZE', 500)), 2000))
+
+    @staticmethod
+    def wants_stream(args):
+        return str(args.get('stream', '')).lower() == 'ndjson'
+
+    @staticmethod
+    def wants_priority_order(args):
+        return str(args.get('order', '')).lower() == 'priority'
+
+    @staticmethod
+    def keyset_chunks(query, id_column, key=None, chunk_size=None):
+        """
+        قراءة نتائج الاستعلام على دفعات مرتبة حسب id_column
+
+        :param key: دالة تعيد قيمة id_column من الصف (افتراضياً الصف نفسه كائن له Id)
+        """
+        chunk_size = chunk_size or ReportStream.chunk_size()
+        key = key or (lambda row: row.Id)
+        last_id = None
+        while True:
+            chunk_query = query if last_id is None else query.filter(id_column > last_id)
+            rows = chunk_query.order_by(id_column).limit(chunk_size).all()
+            if not rows:
+                return
+            last_id = key(rows[-1])
+            yield rows
+            # الدفعة انتهت معالجتها، لا داعي لبقاء كائناتها في الجلسة
+            db.session.expunge_all()
+            if len(rows) < chunk_size:
+                return
+
+    @staticmethod
+    def response(records):
+        """استجابة تكتب كل عنصر كسطر JSON، والخطأ أثناء البث يكتب كسطر أخير"""
+        def generate():
+            try:
+                for record in records:
+                    yield json.dumps(
+                        record, ensure_ascii=False, default=AnalyticsSnapshotService._json_default
+                    ) + "\n"
+            except Exception as e:
+                # الحالة 200 أرسلت بالفعل، فالخطأ يبلغ كآخر سطر
+                logger.error(f"خطأ أثناء بث التقرير: {str(e)}")
+                yield json.dumps(
+                    {"success": False, "message": f"حدث خطأ أثناء بث التقرير: {str(e)}"},
+                    ensure_ascii=False
+                ) + "\n"
+
+        return Response(stream_with_context(generate()), mimetype=ReportStream.MIMETYPE)
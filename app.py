@@ -2,13 +2,20 @@ from flask import Flask, jsonify
 from flask_cors import CORS
 from flask_restful import Api
 from extensions import db, socketio, scheduler
-from reservations import ReservationListResource
+from reservations import ReservationListResource, BulkReservationResource, RejectionLog
 from reservations_update import ReservationResource
 from maintenance_needed import MaintenanceNeededResource
-from devices_suggestion import SuggestDeviceResource
+from devices_suggestion import SuggestDeviceResource, SuggestDeviceBatchResource, DeviceNameIndex
 from maintenance_prediction import DeviceMaintenancePredictionResource
 from devices_replacement import DevicesReplacementResource
 from future_needs import FutureNeedsResource
+from availability import AvailabilityIndex, AvailabilityResource, AvailabilityEvents
+from usage_counters import UsageCounterService
+from maintenance_status import MaintenanceStatusService
+from catalog import ExperimentDeviceIndex
+from analytics_snapshots import AnalyticsSnapshotService, ReportStream
+import migrations
+from migrations import MigrationRunner
 import signal
 import sys
 import os
@@ -62,6 +69,37 @@ def create_app(config_name='default'):
                      daemon=False)  
     scheduler.init_app(app)
     
+    # فهرس الإتاحة للمعامل والأجهزة
+    AvailabilityIndex.init_app(app)
+    
+    # نشر تغييرات الإتاحة عبر Socket.IO
+    AvailabilityEvents.init_app(app)
+    
+    # دمج عدادات الاستخدام بشكل دوري
+    UsageCounterService.init_app(app)
+    
+    # حالة صيانة الأجهزة المحسوبة مسبقاً
+    MaintenanceStatusService.init_app(app)
+    
+    # فهرس أسماء الأجهزة لاقتراح الأجهزة البديلة
+    DeviceNameIndex.init_app(app)
+    
+    # فهرس التجارب والأجهزة في الذاكرة
+    ExperimentDeviceIndex.init_app(app)
+    
+    # نسخ التقارير التحليلية المحسوبة بشكل دوري
+    AnalyticsSnapshotService.init_app(app)
+    
+    # بث التقارير الكاملة بصيغة NDJSON على دفعات
+    ReportStream.init_app(app)
+    
+    # تسجيل محاولات الحجز المرفوضة في الخلفية
+    RejectionLog.init_app(app)
+    
+    # أوامر migrations وفحص الفهارس
+    app.config.setdefault('SCHEMA_AUTO_UPGRADE', os.environ.get('SCHEMA_AUTO_UPGRADE', '1') != '0')
+    migrations.init_app(app)
+    
     # إضافة نقطة وصول للتحقق من صحة التطبيق
     @app.route('/health')
     def health_check():
@@ -97,8 +135,11 @@ def create_app(config_name='default'):
             "status": "online",
             "endpoints": [
                 "/reservations", 
+                "/reservations/bulk",
+                "/availability",
                 "/devices/maintenance-needed",
                 "/devices/suggest/<device_id>",
+                "/devices/suggest/batch",
                 "/api/devices-maintenance-prediction",
                 "/devices-replacement",
                 "/future-spare-parts-needs"
@@ -108,13 +149,18 @@ def create_app(config_name='default'):
     api = Api(app)
     # Reservation List Resource
     api.add_resource(ReservationListResource, '/reservations')
+    api.add_resource(BulkReservationResource, '/reservations/bulk')
     api.add_resource(ReservationResource, '/reservations/<int:reservation_id>')
 
+    # الفترات المتاحة للمعمل والأجهزة
+    api.add_resource(AvailabilityResource, '/availability')
+
     # Maintenance Needed Resource
     api.add_resource(MaintenanceNeededResource, '/devices/maintenance-needed')
 
     # Suggest Device Resource
     api.add_resource(SuggestDeviceResource, '/devices/suggest/<int:device_id>')
+    api.add_resource(SuggestDeviceBatchResource, '/devices/suggest/batch')
     
     # توقعات الصيانة للأجهزة المتاحة
     api.add_resource(DeviceMaintenancePredictionResource, '/api/devices-maintenance-prediction')
@@ -129,10 +175,35 @@ def create_app(config_name='default'):
 
 app = create_app()  # Create the app instance globally
 
+def init_runtime():
+    """تهيئة ما يحتاج اتصالاً بقاعدة البيانات قبل استقبال الطلبات"""
+    with app.app_context():
+        try:
+            # جداول الخدمة والفهارس، يمكن تعطيلها وتطبيقها يدوياً بـ flask schema upgrade
+            if app.config['SCHEMA_AUTO_UPGRADE']:
+                applied = MigrationRunner.upgrade()
+                if applied:
+                    print(f'Applied schema migrations: {applied}')
+        except Exception as e:
+            print(f'Error applying schema migrations: {str(e)}')
+        try:
+            AvailabilityIndex.rebuild()
+        except Exception as e:
+            print(f'Error building availability index: {str(e)}')
+        try:
+            MaintenanceStatusService.refresh()
+        except Exception as e:
+            print(f'Error refreshing maintenance status: {str(e)}')
+        try:
+            DeviceNameIndex.rebuild()
+        except Exception as e:
+            print(f'Error building device name index: {str(e)}')
+
 def cleanup_resources():
     with app.app_context():
         try:
             scheduler.shutdown()
+            RejectionLog.flush()
             db.session.remove()
             db.engine.dispose()
         except Exception as e:
@@ -149,6 +220,7 @@ signal.signal(signal.SIGTERM, signal_handler)
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     try:
+        init_runtime()
         scheduler.start()
         print(f'Starting app on port {port}')
         socketio.run(app, host='0.0.0.0', port=port, debug=False, use_reloader=False)
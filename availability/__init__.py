@@ -0,0 +1,5 @@
+from .index import AvailabilityIndex
+from .resources import AvailabilityResource
+from .events import AvailabilityEvents
+
+__all__ = ['AvailabilityIndex', 'AvailabilityResource', 'AvailabilityEvents']
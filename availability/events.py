@@ -0,0 +1,191 @@
+from flask_socketio import join_room, leave_room
+from datetime import datetime, date, timedelta
+from extensions import socketio
+from .index import AvailabilityIndex
+from .services import AvailabilityService
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityEvents:
+    """
+    نشر تغييرات الإتاحة عبر Socket.IO
+
+    الغرف: lab:{id} و device:{id} لكل الأيام، و lab:{id}:{date} و
+    device:{id}:{date} لمن اشترك في فترة محددة. كل حدث يحمل الحالة الكاملة
+    لليوم المتغير (الفترات المشغولة) وليس الحجز نفسه، لذلك يكفي العميل أن
+    يستبدل بيانات اليوم بما وصله.
+    """
+
+    EVENT_NAME = "availability"
+    MAX_SUBSCRIBE_DAYS = 62
+
+    @staticmethod
+    def init_app(app):
+        socketio.on_event('subscribe', _on_subscribe)
+        socketio.on_event('unsubscribe', _on_unsubscribe)
+        AvailabilityIndex.on_change(AvailabilityEvents.publish)
+
+    @staticmethod
+    def _busy_ranges(mask):
+        # الفترات المشغولة هي الفترات "الحرة" داخل mask عندما لا يوجد شيء محجوز
+        return [
+            {
+                "start_time": AvailabilityService._format_slot(first_slot),
+                "end_time": AvailabilityService._format_slot(last_slot)
+            }
+            for first_slot, last_slot in AvailabilityService.free_windows_for_day(0, mask, 1)
+        ]
+
+    @staticmethod
+    def _maintenance_days(windows):
+        """الأيام التي تكون بدايتها داخل نافذة صيانة، خلال فترة الاشتراك القصوى"""
+        today = date.today()
+        last_day = today + timedelta(days=AvailabilityEvents.MAX_SUBSCRIBE_DAYS)
+        days = set()
+        for start_at, end_at in windows:
+            first = start_at.date() if start_at.time() == datetime.min.time() else start_at.date() + timedelta(days=1)
+            current = max(first, today)
+            while current <= min(end_at.date(), last_day):
+                days.add(current)
+                current += timedelta(days=1)
+        return sorted(days)
+
+    @staticmethod
+    def lab_payload(lab_id, day):
+        return {
+            "type": "lab",
+            "lab_id": lab_id,
+            "date": day.strftime("%Y-%m-%d"),
+            "slot_minutes": AvailabilityIndex.slot_minutes(),
+            "busy": AvailabilityEvents._busy_ranges(AvailabilityIndex.lab_mask(lab_id, day))
+        }
+
+    @staticmethod
+    def device_payload(device_id, day):
+        return {
+            "type": "device",
+            "device_id": device_id,
+            "date": day.strftime("%Y-%m-%d"),
+            "slot_minutes": AvailabilityIndex.slot_minutes(),
+            "busy": AvailabilityEvents._busy_ranges(AvailabilityIndex.device_mask(device_id, day)),
+            "in_maintenance": AvailabilityIndex.device_in_maintenance(device_id, day)
+        }
+
+    @staticmethod
+    def publish(lab_keys, device_keys, maintenance_device_ids):
+        """إرسال حالة كل يوم تغير إلى غرف المعمل أو الجهاز وغرفة اليوم"""
+        for lab_id, day in sorted(lab_keys, key=str):
+            socketio.emit(
+                AvailabilityEvents.EVENT_NAME,
+                AvailabilityEvents.lab_payload(lab_id, day),
+                to=[f"lab:{lab_id}", f"lab:{lab_id}:{day.strftime('%Y-%m-%d')}"]
+            )
+
+        for device_id, day in sorted(device_keys, key=str):
+            socketio.emit(
+                AvailabilityEvents.EVENT_NAME,
+                AvailabilityEvents.device_payload(device_id, day),
+                to=[f"device:{device_id}", f"device:{device_id}:{day.strftime('%Y-%m-%d')}"]
+            )
+
+        for device_id in sorted(maintenance_device_ids, key=str):
+            windows = AvailabilityIndex.maintenance_windows(device_id)
+            days = AvailabilityEvents._maintenance_days(windows)
+            socketio.emit(
+                AvailabilityEvents.EVENT_NAME,
+                {
+                    "type": "maintenance",
+                    "device_id": device_id,
+                    "windows": [
+                        {
+                            "start_at": start_at.strftime("%Y-%m-%d %H:%M"),
+                            "end_at": end_at.strftime("%Y-%m-%d %H:%M")
+                        }
+                        for start_at, end_at in windows
+                    ],
+                    "maintenance_days": [day.strftime("%Y-%m-%d") for day in days]
+                },
+                to=[f"device:{device_id}"] + [f"device:{device_id}:{day.strftime('%Y-%m-%d')}" for day in days]
+            )
+
+    @staticmethod
+    def resolve_rooms(data):
+        """
+        تحديد الغرف المطلوبة من رسالة الاشتراك
+
+        :return: (True, (الغرف, الأيام)) أو (False, رسالة الخطأ)
+        """
+        if not isinstance(data, dict):
+            return False, "بيانات الاشتراك غير صحيحة"
+
+        try:
+            lab_id = int(data['lab_id']) if data.get('lab_id') is not None else None
+            device_id = int(data['device_id']) if data.get('device_id') is not None else None
+        except (TypeError, ValueError):
+            return False, "رقم المعمل أو الجهاز يجب أن يكون عدداً صحيحاً"
+
+        if lab_id is None and device_id is None:
+            return False, "يجب تحديد lab_id أو device_id"
+
+        prefixes = []
+        if lab_id is not None:
+            prefixes.append(f"lab:{lab_id}")
+        if device_id is not None:
+            prefixes.append(f"device:{device_id}")
+
+        if not data.get('date_from') and not data.get('date_to'):
+            return True, (prefixes, [])
+
+        try:
+            start_date = datetime.strptime(data.get('date_from') or data.get('date_to'), "%Y-%m-%d").date()
+            end_date = datetime.strptime(data.get('date_to') or data.get('date_from'), "%Y-%m-%d").date()
+        except (TypeError, ValueError):
+            return False, "صيغة التاريخ غير صحيحة"
+
+        if start_date > end_date:
+            return False, "تاريخ البداية يجب أن يكون قبل تاريخ النهاية"
+
+        if (end_date - start_date).days + 1 > AvailabilityEvents.MAX_SUBSCRIBE_DAYS:
+            return False, f"أقصى مدة للاشتراك {AvailabilityEvents.MAX_SUBSCRIBE_DAYS} يوماً"
+
+        days = [start_date + timedelta(days=offset) for offset in range((end_date - start_date).days + 1)]
+        rooms = [f"{prefix}:{day.strftime('%Y-%m-%d')}" for prefix in prefixes for day in days]
+        return True, (rooms, days)
+
+
+def _on_subscribe(data):
+    """
+    الاشتراك في تغييرات معمل و/أو جهاز، لكل الأيام أو لفترة محددة
+
+    يعاد للعميل الحالة الحالية للأيام المطلوبة حتى يبدأ منها ثم يطبق الأحداث.
+    """
+    success, result = AvailabilityEvents.resolve_rooms(data)
+    if not success:
+        return {"success": False, "message": result}
+
+    rooms, days = result
+    for room in rooms:
+        join_room(room)
+
+    snapshot = []
+    if days and AvailabilityIndex.ensure_loaded():
+        if data.get('lab_id') is not None:
+            snapshot.extend(AvailabilityEvents.lab_payload(int(data['lab_id']), day) for day in days)
+        if data.get('device_id') is not None:
+            snapshot.extend(AvailabilityEvents.device_payload(int(data['device_id']), day) for day in days)
+
+    return {"success": True, "rooms": rooms, "snapshot": snapshot}
+
+
+def _on_unsubscribe(data):
+    success, result = AvailabilityEvents.resolve_rooms(data)
+    if not success:
+        return {"success": False, "message": result}
+
+    rooms, _ = result
+    for room in rooms:
+        leave_room(room)
+
+    return {"success": True, "rooms": rooms}
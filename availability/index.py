@@ -0,0 +1,420 @@
+from model import Users, Reservations, Maintenances
+from datetime import datetime, date
+from extensions import db, scheduler
+from sqlalchemy import select
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class AvailabilityIndex:
+    """
+    فهرس الإتاحة في الذاكرة
+
+    يحتفظ بـ bitset لكل معمل ولكل جهاز في كل يوم، كل bit يمثل فترة زمنية
+    بطول AVAILABILITY_SLOT_MINUTES. الفترات تقرب للخارج لذلك الفهرس متحفظ.
+
+    يبنى الفهرس من جداول Reservations و Maintenances عند التشغيل ويعاد بناؤه
+    دورياً لالتقاط أي تعديلات تمت خارج هذه الخدمة، لذلك قد يتأخر عن قاعدة
+    البيانات حتى إعادة البناء التالية: يستخدم لعرض الفترات المتاحة فقط، أما
+    التحقق عند الحجز فيتم دائماً من قاعدة البيانات داخل القفل.
+    """
+
+    _lock = threading.RLock()
+    _slot_minutes = 15
+    _loaded = False
+    _rebuilding = False
+    _pending_during_rebuild = []
+
+    # (lab_id, date) -> {reservation_id: (user_type, mask)}
+    _lab_entries = {}
+    # (device_id, date) -> {reservation_id: mask}
+    _device_entries = {}
+    # reservation_id -> (lab_id, device_id, date)
+    _reservation_keys = {}
+    # device_id -> [(StartAt, EndAt)]
+    _maintenance_windows = {}
+
+    _change_listeners = []
+
+    @staticmethod
+    def init_app(app):
+        """قراءة الإعدادات وتسجيل مهمة إعادة البناء الدورية"""
+        app.config.setdefault('AVAILABILITY_SLOT_MINUTES', 15)
+        app.config.setdefault('AVAILABILITY_INDEX_REBUILD_MINUTES', 10)
+
+        slot_minutes = int(app.config['AVAILABILITY_SLOT_MINUTES'])
+        if slot_minutes <= 0 or (24 * 60) % slot_minutes != 0:
+            raise ValueError("AVAILABILITY_SLOT_MINUTES يجب أن يقسم اليوم بالتساوي")
+        AvailabilityIndex._slot_minutes = slot_minutes
+
+        rebuild_minutes = int(app.config['AVAILABILITY_INDEX_REBUILD_MINUTES'])
+        if rebuild_minutes > 0:
+            scheduler.add_job(
+                id='rebuild_availability_index',
+                func=_rebuild_job,
+                trigger='interval',
+                minutes=rebuild_minutes,
+                replace_existing=True
+            )
+
+    # ------------------------------------------------------------------
+    # تحويل الأوقات إلى bits
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def slot_minutes():
+        return AvailabilityIndex._slot_minutes
+
+    @staticmethod
+    def slots_per_day():
+        return (24 * 60) // AvailabilityIndex._slot_minutes
+
+    @staticmethod
+    def full_day_mask():
+        return (1 << AvailabilityIndex.slots_per_day()) - 1
+
+    @staticmethod
+    def time_mask(start_time, end_time):
+        """bitset يغطي الفترة من start_time إلى end_time مع التقريب للخارج"""
+        slot = AvailabilityIndex._slot_minutes
+        start_minutes = start_time.hour * 60 + start_time.minute
+        end_minutes = end_time.hour * 60 + end_time.minute
+        if end_time.second or end_time.microsecond:
+            end_minutes += 1
+
+        first_slot = start_minutes // slot
+        last_slot = -(-end_minutes // slot)
+        if last_slot <= first_slot:
+            return 0
+        return ((1 << (last_slot - first_slot)) - 1) << first_slot
+
+    @staticmethod
+    def on_change(listener):
+        """
+        تسجيل دالة تستدعى بعد كل تغيير في الفهرس
+
+        تستقبل (مفاتيح (معمل, يوم), مفاتيح (جهاز, يوم), أرقام أجهزة تغيرت صيانتها).
+        """
+        AvailabilityIndex._change_listeners.append(listener)
+        return listener
+
+    @staticmethod
+    def _notify(lab_keys, device_keys, maintenance_device_ids):
+        if not (lab_keys or device_keys or maintenance_device_ids):
+            return
+        for listener in AvailabilityIndex._change_listeners:
+            try:
+                listener(lab_keys, device_keys, maintenance_device_ids)
+            except Exception as e:
+                logger.error(f"خطأ أثناء نشر تغييرات الإتاحة: {str(e)}")
+
+    @staticmethod
+    def _changed_keys(old_entries, new_entries):
+        return {
+            key for key in set(old_entries) | set(new_entries)
+            if old_entries.get(key) != new_entries.get(key)
+        }
+
+    @staticmethod
+    def _key(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    # ------------------------------------------------------------------
+    # البناء والتحديث
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def ensure_loaded():
+        """بناء الفهرس عند أول استخدام إذا لم يبن عند التشغيل"""
+        if AvailabilityIndex._loaded:
+            return True
+        try:
+            AvailabilityIndex.rebuild()
+        except Exception as e:
+            logger.warning(f"تعذر بناء فهرس الإتاحة: {str(e)}")
+        return AvailabilityIndex._loaded
+
+    @staticmethod
+    def rebuild():
+        """إعادة بناء الفهرس بالكامل من الحجوزات والصيانات الحالية والمستقبلية"""
+        with AvailabilityIndex._lock:
+            AvailabilityIndex._rebuilding = True
+            AvailabilityIndex._pending_during_rebuild = []
+
+        try:
+            today = date.today()
+
+            reservations = db.session.query(
+                Reservations.Id,
+                Reservations.LabId,
+                Reservations.DeviceId,
+                Reservations.Date,
+                Reservations.StartTime,
+                Reservations.EndTime,
+                Users.UserType
+            ).join(Users, Users.Id == Reservations.UserId).filter(
+                Reservations.IsAllowed == True,
+                Reservations.Date >= today
+            ).all()
+
+            maintenances = db.session.query(
+                Maintenances.DeviceId,
+                Maintenances.StartAt,
+                Maintenances.EndAt
+            ).filter(
+                Maintenances.DeviceId.isnot(None),
+                Maintenances.StartAt.isnot(None),
+                Maintenances.EndAt.isnot(None),
+                Maintenances.EndAt >= datetime.combine(today, datetime.min.time()),
+                Maintenances.Status != "مكتملة"
+            ).all()
+
+            lab_entries = {}
+            device_entries = {}
+            reservation_keys = {}
+            for row in reservations:
+                AvailabilityIndex._insert(
+                    lab_entries, device_entries, reservation_keys,
+                    row.Id, row.LabId, row.DeviceId, row.Date,
+                    row.StartTime, row.EndTime, row.UserType
+                )
+
+            maintenance_windows = {}
+            for row in maintenances:
+                maintenance_windows.setdefault(row.DeviceId, []).append((row.StartAt, row.EndAt))
+        except Exception:
+            with AvailabilityIndex._lock:
+                AvailabilityIndex._rebuilding = False
+                AvailabilityIndex._pending_during_rebuild = []
+            raise
+
+        with AvailabilityIndex._lock:
+            was_loaded = AvailabilityIndex._loaded
+            lab_keys = AvailabilityIndex._changed_keys(AvailabilityIndex._lab_entries, lab_entries)
+            device_keys = AvailabilityIndex._changed_keys(AvailabilityIndex._device_entries, device_entries)
+            maintenance_device_ids = AvailabilityIndex._changed_keys(
+                AvailabilityIndex._maintenance_windows, maintenance_windows
+            )
+
+            AvailabilityIndex._lab_entries = lab_entries
+            AvailabilityIndex._device_entries = device_entries
+            AvailabilityIndex._reservation_keys = reservation_keys
+            AvailabilityIndex._maintenance_windows = maintenance_windows
+
+            # إعادة تطبيق الحجوزات التي حفظت أثناء إعادة البناء
+            pending = AvailabilityIndex._pending_during_rebuild
+            AvailabilityIndex._pending_during_rebuild = []
+            AvailabilityIndex._rebuilding = False
+            AvailabilityIndex._loaded = True
+            for args in pending:
+                AvailabilityIndex._apply(*args)
+
+        # التغييرات التي تمت خارج الخدمة تظهر فقط عند إعادة البناء
+        if was_loaded:
+            AvailabilityIndex._notify(lab_keys, device_keys, maintenance_device_ids)
+
+        logger.info(f"تم بناء فهرس الإتاحة: {len(reservations)} حجز و {len(maintenances)} صيانة")
+
+    @staticmethod
+    def _insert(lab_entries, device_entries, reservation_keys,
+                reservation_id, lab_id, device_id, reservation_date, start_time, end_time, user_type):
+        mask = AvailabilityIndex.time_mask(start_time, end_time)
+        if not mask:
+            return
+        if lab_id is not None:
+            lab_entries.setdefault((lab_id, reservation_date), {})[reservation_id] = (user_type, mask)
+        if device_id is not None:
+            device_entries.setdefault((device_id, reservation_date), {})[reservation_id] = mask
+        reservation_keys[reservation_id] = (lab_id, device_id, reservation_date)
+
+    @staticmethod
+    def _remove(reservation_id):
+        keys = AvailabilityIndex._reservation_keys.pop(reservation_id, None)
+        if not keys:
+            return
+        lab_id, device_id, reservation_date = keys
+
+        entries = AvailabilityIndex._lab_entries.get((lab_id, reservation_date))
+        if entries is not None:
+            entries.pop(reservation_id, None)
+            if not entries:
+                del AvailabilityIndex._lab_entries[(lab_id, reservation_date)]
+
+        entries = AvailabilityIndex._device_entries.get((device_id, reservation_date))
+        if entries is not None:
+            entries.pop(reservation_id, None)
+            if not entries:
+                del AvailabilityIndex._device_entries[(device_id, reservation_date)]
+
+    @staticmethod
+    def _apply(action, reservation_id, values):
+        AvailabilityIndex._remove(reservation_id)
+        if action == "add":
+            AvailabilityIndex._insert(
+                AvailabilityIndex._lab_entries,
+                AvailabilityIndex._device_entries,
+                AvailabilityIndex._reservation_keys,
+                reservation_id, *values
+            )
+
+    @staticmethod
+    def capture_changes(reservations, user_type):
+        """
+        قراءة قيم الحجوزات قبل commit لتطبيقها على الفهرس بعده
+
+        يستدعى بعد flush حتى تكون أرقام الحجوزات معروفة، ويتجنب إعادة تحميل
+        الكائنات من قاعدة البيانات بعد commit.
+        """
+        changes = []
+        for reservation in reservations:
+            if reservation.Id is None:
+                continue
+            if not reservation.IsAllowed:
+                changes.append(("remove", reservation.Id, None))
+            else:
+                changes.append(("add", reservation.Id, (
+                    reservation.LabId,
+                    reservation.DeviceId,
+                    reservation.Date,
+                    reservation.StartTime,
+                    reservation.EndTime,
+                    user_type
+                )))
+        return changes
+
+    @staticmethod
+    def _collect_keys(reservation_id, lab_keys, device_keys):
+        keys = AvailabilityIndex._reservation_keys.get(reservation_id)
+        if keys:
+            lab_id, device_id, reservation_date = keys
+            if lab_id is not None:
+                lab_keys.add((lab_id, reservation_date))
+            if device_id is not None:
+                device_keys.add((device_id, reservation_date))
+
+    @staticmethod
+    def apply_changes(changes):
+        """تطبيق تغييرات تم حفظها على الفهرس، يستدعى بعد commit"""
+        lab_keys = set()
+        device_keys = set()
+        with AvailabilityIndex._lock:
+            for args in changes:
+                action, reservation_id, values = args
+                if AvailabilityIndex._rebuilding:
+                    AvailabilityIndex._pending_during_rebuild.append(args)
+                if AvailabilityIndex._loaded:
+                    # المفاتيح القديمة والجديدة حتى يصل التغيير لليوم الذي انتقل منه الحجز
+                    AvailabilityIndex._collect_keys(reservation_id, lab_keys, device_keys)
+                    AvailabilityIndex._apply(*args)
+                    AvailabilityIndex._collect_keys(reservation_id, lab_keys, device_keys)
+                elif action == "add":
+                    lab_id, device_id, reservation_date = values[0], values[1], values[2]
+                    if lab_id is not None:
+                        lab_keys.add((lab_id, reservation_date))
+                    if device_id is not None:
+                        device_keys.add((device_id, reservation_date))
+
+        AvailabilityIndex._notify(lab_keys, device_keys, set())
+
+    @staticmethod
+    def refresh_maintenance(device_ids):
+        """
+        إعادة تحميل نوافذ الصيانة المفتوحة لأجهزة محددة
+
+        الصيانات يسجلها التطبيق الآخر، فيستدعيها فحص الصيانات الدوري في
+        maintenance_status بالأجهزة التي وجدها. قبل أول بناء لا شيء لتحديثه.
+        """
+        device_ids = {AvailabilityIndex._key(device_id) for device_id in device_ids if device_id is not None}
+        if not device_ids or not AvailabilityIndex._loaded:
+            return
+
+        table = Maintenances.__table__
+        day_start = datetime.combine(date.today(), datetime.min.time())
+        statement = select(table.c.DeviceId, table.c.StartAt, table.c.EndAt).where(
+            table.c.DeviceId.in_(list(device_ids)),
+            table.c.StartAt.isnot(None),
+            table.c.EndAt.isnot(None),
+            table.c.EndAt >= day_start,
+            table.c.Status != "مكتملة"
+        )
+        with db.engine.connect() as connection:
+            rows = connection.execute(statement).all()
+
+        windows = {}
+        for row in rows:
+            windows.setdefault(row.DeviceId, []).append((row.StartAt, row.EndAt))
+
+        changed = set()
+        with AvailabilityIndex._lock:
+            for device_id in device_ids:
+                new_windows = windows.get(device_id)
+                if AvailabilityIndex._maintenance_windows.get(device_id) == new_windows:
+                    continue
+                if new_windows:
+                    AvailabilityIndex._maintenance_windows[device_id] = new_windows
+                else:
+                    AvailabilityIndex._maintenance_windows.pop(device_id, None)
+                changed.add(device_id)
+
+        AvailabilityIndex._notify(set(), set(), changed)
+
+    # ------------------------------------------------------------------
+    # الاستعلام
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def lab_mask(lab_id, reservation_date, user_types=None):
+        """bitset الفترات المحجوزة في المعمل، اختيارياً لأنواع مستخدمين محددة"""
+        with AvailabilityIndex._lock:
+            entries = AvailabilityIndex._lab_entries.get((AvailabilityIndex._key(lab_id), reservation_date), {})
+            mask = 0
+            for user_type, entry_mask in entries.values():
+                if user_types is None or user_type in user_types:
+                    mask |= entry_mask
+            return mask
+
+    @staticmethod
+    def device_mask(device_id, reservation_date):
+        """bitset الفترات المحجوزة للجهاز"""
+        with AvailabilityIndex._lock:
+            entries = AvailabilityIndex._device_entries.get((AvailabilityIndex._key(device_id), reservation_date), {})
+            mask = 0
+            for entry_mask in entries.values():
+                mask |= entry_mask
+            return mask
+
+    @staticmethod
+    def devices_mask(device_ids, reservation_date):
+        """اتحاد الفترات المحجوزة لمجموعة أجهزة"""
+        mask = 0
+        for device_id in device_ids:
+            mask |= AvailabilityIndex.device_mask(device_id, reservation_date)
+        return mask
+
+    @staticmethod
+    def device_in_maintenance(device_id, reservation_date):
+        """هل الجهاز في صيانة غير مكتملة تغطي بداية هذا اليوم"""
+        day_start = datetime.combine(reservation_date, datetime.min.time())
+        with AvailabilityIndex._lock:
+            windows = AvailabilityIndex._maintenance_windows.get(AvailabilityIndex._key(device_id), [])
+            return any(start_at <= day_start <= end_at for start_at, end_at in windows)
+
+    @staticmethod
+    def maintenance_windows(device_id):
+        """نوافذ الصيانة المفتوحة للجهاز [(StartAt, EndAt)]"""
+        with AvailabilityIndex._lock:
+            return list(AvailabilityIndex._maintenance_windows.get(AvailabilityIndex._key(device_id), []))
+
+
+def _rebuild_job():
+    """مهمة الجدولة لإعادة بناء فهرس الإتاحة"""
+    with scheduler.app.app_context():
+        try:
+            AvailabilityIndex.rebuild()
+        except Exception as e:
+            logger.error(f"خطأ أثناء إعادة بناء فهرس الإتاحة: {str(e)}")
@@ -0,0 +1,54 @@
+from flask_restful import Resource, request
+from .services import AvailabilityService
+
+
+class AvailabilityResource(Resource):
+    def get(self):
+        try:
+            # التحقق من المعلمات المطلوبة
+            required_args = ['lab_id', 'date_from', 'date_to']
+            for arg in required_args:
+                if not request.args.get(arg):
+                    return {"success": False, "message": f"المعلمة {arg} مطلوبة"}, 400
+
+            if not request.args.get('user_id') and not request.args.get('user_type'):
+                return {"success": False, "message": "المعلمة user_id أو user_type مطلوبة"}, 400
+
+            try:
+                lab_id = int(request.args['lab_id'])
+                experiment_id = int(request.args['experiment_id']) if request.args.get('experiment_id') else None
+                user_id = int(request.args['user_id']) if request.args.get('user_id') else None
+                device_ids = [
+                    int(device_id) for device_id in request.args.get('device_ids', '').split(',')
+                    if device_id.strip()
+                ]
+            except ValueError:
+                return {"success": False, "message": "أرقام المعمل والتجربة والمستخدم والأجهزة يجب أن تكون أعداداً صحيحة"}, 400
+
+            success, result = AvailabilityService.search(
+                lab_id,
+                request.args['date_from'],
+                request.args['date_to'],
+                min_duration=request.args.get('min_duration'),
+                experiment_id=experiment_id,
+                device_ids=device_ids,
+                user_id=user_id,
+                user_type=request.args.get('user_type'),
+                day_start=request.args.get('day_start'),
+                day_end=request.args.get('day_end')
+            )
+
+            if not success:
+                return {"success": False, "message": result}, 400
+
+            return {
+                "success": True,
+                "message": "تم جلب الفترات المتاحة بنجاح",
+                **result
+            }, 200
+
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء البحث عن الفترات المتاحة: {str(e)}"
+            }, 500
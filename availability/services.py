@@ -0,0 +1,205 @@
+from model import Users, Laboratories, Experiments, Devices, ExperimentDevices
+from datetime import datetime, timedelta
+from extensions import db
+from catalog import DeviceStatus
+from .index import AvailabilityIndex
+
+
+class AvailabilityService:
+    """البحث عن الفترات المتاحة لمعمل ومجموعة أجهزة خلال فترة زمنية"""
+
+    MAX_RANGE_DAYS = 93
+
+    @staticmethod
+    def resolve_user_type(user_id=None, user_type=None):
+        if user_id is not None:
+            user = Users.query.get(user_id)
+            if not user:
+                return False, "المستخدم غير موجود"
+            user_type = user.UserType
+
+        if user_type not in ["دكتور", "باحث"]:
+            return False, "نوع المستخدم غير مصرح له بالحجز"
+
+        return True, user_type
+
+    @staticmethod
+    def resolve_lab(lab_id, user_type):
+        lab = Laboratories.query.get(lab_id)
+        if not lab:
+            return False, "المعمل غير موجود"
+
+        if lab.Status != "متاح":
+            return False, f"المعمل غير متاح حالياً. الحالة: {lab.Status}"
+
+        # التحقق من نوع المعمل
+        if user_type == "دكتور" and lab.Type != "أكاديمي":
+            return False, "هذا المعمل مخصص للأبحاث فقط"
+        elif user_type == "باحث" and lab.Type != "بحثي":
+            return False, "هذا المعمل مخصص للتدريس فقط"
+
+        return True, lab
+
+    @staticmethod
+    def resolve_devices(lab_id, user_type, experiment_id=None, device_ids=None):
+        """تحديد الأجهزة المطلوبة من التجربة و/أو القائمة المرسلة"""
+        requested_ids = set(device_ids or [])
+
+        if experiment_id is not None:
+            experiment = Experiments.query.get(experiment_id)
+            if not experiment:
+                return False, "التجربة غير موجودة"
+
+            if experiment.LabId != lab_id:
+                return False, "التجربة غير متوفرة في هذا المعمل"
+
+            if user_type == "دكتور" and experiment.Type != "أكاديمية":
+                return False, "هذه التجربة مخصصة للأبحاث فقط"
+            elif user_type == "باحث" and experiment.Type != "بحثية":
+                return False, "هذه التجربة مخصصة للتدريس فقط"
+
+            experiment_device_ids = {
+                row[0] for row in db.session.query(ExperimentDevices.DeviceId).filter(
+                    ExperimentDevices.ExperimentId == experiment_id
+                ).all()
+            }
+
+            for device_id in requested_ids:
+                if device_id not in experiment_device_ids:
+                    return False, f"الجهاز رقم {device_id} غير مرتبط بهذه التجربة"
+
+            if not requested_ids:
+                requested_ids = experiment_device_ids
+
+        if not requested_ids:
+            return True, []
+
+        devices = Devices.query.filter(Devices.Id.in_(list(requested_ids))).all()
+        found_ids = {device.Id for device in devices}
+        for device_id in sorted(requested_ids):
+            if device_id not in found_ids:
+                return False, f"الجهاز رقم {device_id} غير موجود"
+
+        for device in devices:
+            if not DeviceStatus.is_available(device.Status):
+                return False, f"الجهاز {device.Name} غير متاح حالياً. الحالة: {device.Status}"
+
+        return True, sorted(devices, key=lambda d: d.Id)
+
+    @staticmethod
+    def _format_slot(slot_index):
+        minutes = min(slot_index * AvailabilityIndex.slot_minutes(), 24 * 60 - 1)
+        return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+    @staticmethod
+    def free_windows_for_day(busy_mask, allowed_mask, min_slots):
+        """استخراج الفترات المتتالية الخالية التي لا تقل عن min_slots"""
+        free_mask = allowed_mask & ~busy_mask
+        windows = []
+        slot = 0
+        total_slots = AvailabilityIndex.slots_per_day()
+        while free_mask and slot < total_slots:
+            # القفز مباشرة إلى أول bit حر
+            lowest = free_mask & -free_mask
+            slot = lowest.bit_length() - 1
+            run_end = slot
+            while run_end < total_slots and (free_mask >> run_end) & 1:
+                run_end += 1
+            if run_end - slot >= min_slots:
+                windows.append((slot, run_end))
+            free_mask &= ~(((1 << (run_end - slot)) - 1) << slot)
+            slot = run_end
+        return windows
+
+    @staticmethod
+    def search(lab_id, date_from, date_to, min_duration=None, experiment_id=None, device_ids=None,
+               user_id=None, user_type=None, day_start=None, day_end=None):
+        try:
+            # التحقق من صحة المدخلات
+            try:
+                start_date = datetime.strptime(date_from, "%Y-%m-%d").date()
+                end_date = datetime.strptime(date_to, "%Y-%m-%d").date()
+                window_start = datetime.strptime(day_start, "%H:%M").time() if day_start else None
+                window_end = datetime.strptime(day_end, "%H:%M").time() if day_end else None
+            except ValueError:
+                return False, "صيغة التاريخ أو الوقت غير صحيحة"
+
+            if start_date > end_date:
+                return False, "تاريخ البداية يجب أن يكون قبل تاريخ النهاية"
+
+            if (end_date - start_date).days + 1 > AvailabilityService.MAX_RANGE_DAYS:
+                return False, f"أقصى مدة للبحث {AvailabilityService.MAX_RANGE_DAYS} يوماً"
+
+            slot_minutes = AvailabilityIndex.slot_minutes()
+            min_duration = int(min_duration) if min_duration else slot_minutes
+            if min_duration <= 0:
+                return False, "المدة الدنيا يجب أن تكون أكبر من صفر"
+            min_slots = -(-min_duration // slot_minutes)
+
+            user_valid, user_result = AvailabilityService.resolve_user_type(user_id, user_type)
+            if not user_valid:
+                return False, user_result
+            user_type = user_result
+
+            lab_valid, lab = AvailabilityService.resolve_lab(lab_id, user_type)
+            if not lab_valid:
+                return False, lab
+
+            devices_valid, devices = AvailabilityService.resolve_devices(
+                lab_id, user_type, experiment_id, device_ids
+            )
+            if not devices_valid:
+                return False, devices
+
+            if not AvailabilityIndex.ensure_loaded():
+                return False, "فهرس الإتاحة غير جاهز حالياً"
+
+            # الفترة المسموح بها داخل اليوم، تقرب للداخل حتى لا تتجاوز الفترات حدود اليوم
+            window_start_minutes = window_start.hour * 60 + window_start.minute if window_start else 0
+            window_end_minutes = window_end.hour * 60 + window_end.minute if window_end else 24 * 60
+            first_allowed = -(-window_start_minutes // slot_minutes)
+            last_allowed = window_end_minutes // slot_minutes
+            if last_allowed <= first_allowed:
+                return False, "وقت البداية يجب أن يكون قبل وقت النهاية"
+            allowed_mask = ((1 << (last_allowed - first_allowed)) - 1) << first_allowed
+
+            device_id_list = [device.Id for device in devices]
+            now = datetime.now()
+            today = now.date()
+            # الفترات التي بدأت بالفعل اليوم لا يمكن حجزها
+            first_future_slot = -(-(now.hour * 60 + now.minute) // slot_minutes)
+            today_allowed_mask = allowed_mask & ~((1 << first_future_slot) - 1)
+            free_windows = []
+            maintenance_days = []
+
+            current = max(start_date, today)
+            while current <= end_date:
+                if any(AvailabilityIndex.device_in_maintenance(device_id, current) for device_id in device_id_list):
+                    maintenance_days.append(current.strftime("%Y-%m-%d"))
+                else:
+                    busy_mask = AvailabilityIndex.lab_mask(lab.LabId, current)
+                    busy_mask |= AvailabilityIndex.devices_mask(device_id_list, current)
+                    day_allowed_mask = today_allowed_mask if current == today else allowed_mask
+                    for first_slot, last_slot in AvailabilityService.free_windows_for_day(
+                        busy_mask, day_allowed_mask, min_slots
+                    ):
+                        free_windows.append({
+                            "date": current.strftime("%Y-%m-%d"),
+                            "start_time": AvailabilityService._format_slot(first_slot),
+                            "end_time": AvailabilityService._format_slot(last_slot),
+                            "duration_minutes": (last_slot - first_slot) * slot_minutes
+                        })
+                current += timedelta(days=1)
+
+            return True, {
+                "lab_id": lab.LabId,
+                "lab_name": lab.LabName,
+                "device_ids": device_id_list,
+                "slot_minutes": slot_minutes,
+                "min_duration_minutes": min_duration,
+                "free_windows": free_windows,
+                "maintenance_days": maintenance_days
+            }
+
+        except Exception as e:
+            return False, f"حدث خطأ أثناء البحث عن الفترات المتاحة: {str(e)}"
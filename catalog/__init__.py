@@ -0,0 +1,7 @@
+from .experiment_index import ExperimentDeviceIndex
+from .normalization import DeviceStatus, fold, status_key, category_key, job_description_key
+
+__all__ = [
+    'ExperimentDeviceIndex', 'DeviceStatus',
+    'fold', 'status_key', 'category_key', 'job_description_key'
+]
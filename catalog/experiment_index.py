@@ -0,0 +1,93 @@
+from model import ExperimentDevices
+from extensions import db
+from flask import current_app
+from sqlalchemy import select
+import threading
+import time
+
+
+class ExperimentDeviceIndex:
+    """
+    فهرس عكسي في الذاكرة بين التجارب والأجهزة من جدول ExperimentDevices
+
+    يحفظ لكل تجربة مجموعة أجهزتها ولكل جهاز مجموعة تجاربه، فالتجارب المشتركة
+    بين جهازين تقاطع مجموعتين بدلاً من استعلام لكل جهاز. الارتباطات يكتبها التطبيق
+    الآخر، فيعاد تحميل الفهرس بعد انتهاء مدة صلاحيته، ولذلك يستخدم لاقتراح الأجهزة
+    فقط أما التحقق من الحجوزات فيقرأ الارتباط من قاعدة البيانات.
+    """
+
+    _lock = threading.Lock()
+    _loaded_at = None
+    _devices_by_experiment = {}
+    _experiments_by_device = {}
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('EXPERIMENT_INDEX_TTL_SECONDS', 300)
+
+    @staticmethod
+    def rebuild():
+        devices_by_experiment = {}
+        experiments_by_device = {}
+        for experiment_id, device_id in db.session.execute(
+            select(ExperimentDevices.ExperimentId, ExperimentDevices.DeviceId)
+        ).all():
+            devices_by_experiment.setdefault(experiment_id, set()).add(device_id)
+            experiments_by_device.setdefault(device_id, set()).add(experiment_id)
+
+        with ExperimentDeviceIndex._lock:
+            ExperimentDeviceIndex._devices_by_experiment = {
+                key: frozenset(values) for key, values in devices_by_experiment.items()
+            }
+            ExperimentDeviceIndex._experiments_by_device = {
+                key: frozenset(values) for key, values in experiments_by_device.items()
+            }
+            ExperimentDeviceIndex._loaded_at = time.monotonic()
+
+    @staticmethod
+    def _ensure_loaded():
+        loaded_at = ExperimentDeviceIndex._loaded_at
+        ttl = float(current_app.config.get('EXPERIMENT_INDEX_TTL_SECONDS', 300))
+        if loaded_at is None or time.monotonic() - loaded_at > ttl:
+            ExperimentDeviceIndex.rebuild()
+
+    @staticmethod
+    def _as_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    @staticmethod
+    def devices_for(experiment_id):
+        """أرقام الأجهزة المرتبطة بالتجربة"""
+        ExperimentDeviceIndex._ensure_loaded()
+        return ExperimentDeviceIndex._devices_by_experiment.get(
+            ExperimentDeviceIndex._as_id(experiment_id), frozenset()
+        )
+
+    @staticmethod
+    def experiments_for(device_id):
+        """أرقام التجارب التي يستخدم فيها الجهاز"""
+        ExperimentDeviceIndex._ensure_loaded()
+        return ExperimentDeviceIndex._experiments_by_device.get(
+            ExperimentDeviceIndex._as_id(device_id), frozenset()
+        )
+
+    @staticmethod
+    def common_experiments(device_id, candidate_ids):
+        """
+        التجارب المشتركة بين جهاز ومجموعة أجهزة
+
+        :return: {candidate_id: قائمة التجارب المشتركة مرتبة} للأجهزة التي لها تجارب مشتركة فقط
+        """
+        source = ExperimentDeviceIndex.experiments_for(device_id)
+        if not source:
+            return {}
+        experiments_by_device = ExperimentDeviceIndex._experiments_by_device
+        result = {}
+        for candidate_id in candidate_ids:
+            common = source & experiments_by_device.get(candidate_id, frozenset())
+            if common:
+                result[candidate_id] = sorted(common)
+        return result
@@ -0,0 +1,69 @@
+from model import Devices, TEXT_KEY_REPLACEMENTS
+
+
+def fold(value, length=None):
+    """
+    المفتاح الموحد لنص بنفس قواعد الأعمدة المحسوبة في قاعدة البيانات
+
+    استبدال أشكال الألف والياء والواو والتاء المربوطة وحذف التطويل والتشكيل
+    والمسافات المكررة، ثم حذف المسافات الطرفية و lower، ثم القص لطول العمود.
+    كل توحيد للنصوص العربية في الخدمة (مثل فهرس أسماء الأجهزة) يبدأ من هنا.
+    """
+    if value is None:
+        return None
+    for old, new in TEXT_KEY_REPLACEMENTS:
+        value = value.replace(old, new)
+    value = value.strip(' ').lower()
+    return value[:length] if length else value
+
+
+def _key_length(column):
+    return Devices.__table__.c[column].type.length
+
+
+def status_key(status):
+    return fold(status, _key_length('StatusKey'))
+
+
+def category_key(category_name):
+    return fold(category_name, _key_length('CategoryKey'))
+
+
+def job_description_key(job_description):
+    return fold(job_description, _key_length('JobDescriptionKey'))
+
+
+class DeviceStatus:
+    """حالات الجهاز المعتمدة، وأي صيغة أخرى لها (مسافات أو ى بدل ي) تطابقها بالمفتاح"""
+
+    AVAILABLE = "متاح"
+    UNDER_MAINTENANCE = "قيد الصيانة"
+    IN_MAINTENANCE = "في الصيانة"
+    UNAVAILABLE = "غير متاح"
+
+    ALL = [AVAILABLE, UNDER_MAINTENANCE, IN_MAINTENANCE, UNAVAILABLE]
+
+    # الأجهزة خارج الخدمة لا تقترح كبديل ولا يتوقع لها صيانة
+    OUT_OF_SERVICE = [UNDER_MAINTENANCE, IN_MAINTENANCE, UNAVAILABLE]
+
+    @staticmethod
+    def key(status):
+        return status_key(status)
+
+    @staticmethod
+    def keys(statuses):
+        """المفاتيح لاستخدامها في IN على Devices.StatusKey"""
+        return [status_key(status) for status in statuses]
+
+    @staticmethod
+    def canonical(status):
+        """الصيغة المعتمدة للحالة، أو الحالة كما هي إذا لم تكن من الحالات المعروفة"""
+        key = status_key(status)
+        for known in DeviceStatus.ALL:
+            if status_key(known) == key:
+                return known
+        return status
+
+    @staticmethod
+    def is_available(status):
+        return status_key(status) == status_key(DeviceStatus.AVAILABLE)
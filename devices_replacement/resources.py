@@ -1,26 +1,43 @@
 
-from flask import jsonify
+from flask import jsonify, request
 from flask_restful import Resource
+from analytics_snapshots import AnalyticsSnapshotService, ReportStream
 from .services import DevicesReplacementService
 
+REPORT_NAME = "devices_replacement"
+AnalyticsSnapshotService.register(REPORT_NAME, DevicesReplacementService.get_devices_for_replacement)
+
 class DevicesReplacementResource(Resource):
     """مورد API للأجهزة التي تحتاج إلى استبدال"""
     
     def get(self):
         """
         الحصول على قائمة بالأجهزة التي تحتاج إلى استبدال
+
+        تعرض آخر نسخة محفوظة من التقرير، و refresh=true يعيد حسابه الآن.
+        stream=ndjson يحسب التقرير الآن ويبثه جهازاً بجهاز حسب رقم الجهاز،
+        ومع order=priority يرتب حسب الأولوية في مرور ثان.
         ---
         responses:
           200:
             description: قائمة بالأجهزة التي تحتاج إلى استبدال مع تحليل لكل جهاز
         """
         try:
-            devices_for_replacement = DevicesReplacementService.get_devices_for_replacement()
+            if ReportStream.wants_stream(request.args):
+                return ReportStream.response(DevicesReplacementService.iter_devices_for_replacement(
+                    order_by_priority=ReportStream.wants_priority_order(request.args)
+                ))
+
+            snapshot = AnalyticsSnapshotService.latest(
+                REPORT_NAME, refresh=AnalyticsSnapshotService.wants_refresh(request.args)
+            )
+            devices_for_replacement = snapshot[2]
             
             return jsonify({
                 "status": "نجاح",
                 "data": devices_for_replacement,
-                "message": "تم استرجاع قائمة الأجهزة التي تحتاج إلى استبدال بنجاح"
+                "message": "تم استرجاع قائمة الأجهزة التي تحتاج إلى استبدال بنجاح",
+                "snapshot": AnalyticsSnapshotService.metadata(snapshot)
             })
         except Exception as e:
             return jsonify({
@@ -1,33 +1,152 @@
 from datetime import datetime, timedelta
-from sqlalchemy import func, not_, or_
+from sqlalchemy import and_, case, func, not_, or_, select
 from extensions import db
 from model import Devices, Maintenances, SpareParts
+from analytics_snapshots import ReportStream
 
 class DevicesReplacementService:
     """خدمة لتقييم الأجهزة التي تحتاج إلى استبدال"""
     
+    # ترتيب الأولويات في النتائج
+    PRIORITY_ORDER = {"طارئة": 0, "عالية": 1, "متوسطه": 2, "ضعيفه": 3}
+    
+    # إحصاءات جهاز ليس له صيانات ولا قطع غيار
+    EMPTY_STATISTICS = {
+        "repair_count": 0,
+        "periodic_count": 0,
+        "maintenance_cost": 0,
+        "spare_parts_count": 0,
+        "spare_parts_value": 0
+    }
+    
+    @staticmethod
+    def load_statistics(device_ids=None):
+        """
+        مدخلات معايير التقييم لكل الأجهزة في استعلامين مجمعين حسب الجهاز
+
+        - Maintenances: عدد صيانات الإصلاح خلال آخر 6 أشهر وعدد الصيانات الدورية
+          خلال آخر سنة (تجميع شرطي بـ CASE) وإجمالي تكلفة الصيانات
+        - SpareParts: عدد قطع الغيار وقيمتها الإجمالية
+
+        :param device_ids: حصر الإحصاءات في هذه الأجهزة (اختياري، افتراضياً كل الأجهزة)
+        :return: {device_id: إحصاءات الجهاز}
+        """
+        now = datetime.now()
+        six_months_ago = now - timedelta(days=180)
+        one_year_ago = now - timedelta(days=365)
+
+        maintenance_query = select(
+            Maintenances.DeviceId,
+            func.sum(case(
+                (and_(Maintenances.Type == "إصلاح", Maintenances.SchedulingAt > six_months_ago), 1),
+                else_=0
+            )),
+            func.sum(case(
+                (and_(Maintenances.Type == "دورية", Maintenances.SchedulingAt > one_year_ago), 1),
+                else_=0
+            )),
+            func.sum(Maintenances.Cost)
+        ).where(
+            Maintenances.DeviceId.isnot(None)
+        ).group_by(Maintenances.DeviceId)
+
+        spare_parts_query = select(
+            SpareParts.DeviceId,
+            func.count(SpareParts.PartId),
+            func.sum(SpareParts.Cost * SpareParts.Quantity)
+        ).group_by(SpareParts.DeviceId)
+
+        if device_ids is not None:
+            device_ids = list(device_ids)
+            if not device_ids:
+                return {}
+            maintenance_query = maintenance_query.where(Maintenances.DeviceId.in_(device_ids))
+            spare_parts_query = spare_parts_query.where(SpareParts.DeviceId.in_(device_ids))
+
+        statistics = {}
+        for device_id, repair_count, periodic_count, maintenance_cost in db.session.execute(maintenance_query):
+            statistics[device_id] = dict(
+                DevicesReplacementService.EMPTY_STATISTICS,
+                repair_count=int(repair_count or 0),
+                periodic_count=int(periodic_count or 0),
+                maintenance_cost=maintenance_cost or 0
+            )
+        for device_id, parts_count, parts_value in db.session.execute(spare_parts_query):
+            device_statistics = statistics.setdefault(device_id, dict(DevicesReplacementService.EMPTY_STATISTICS))
+            device_statistics["spare_parts_count"] = int(parts_count or 0)
+            device_statistics["spare_parts_value"] = parts_value or 0
+
+        return statistics
+    
     @staticmethod
     def get_devices_for_replacement():
-        """الحصول على قائمة بالأجهزة التي قد تحتاج إلى استبدال مع تحليل لكل جهاز"""
+        """
+        الحصول على قائمة بالأجهزة التي قد تحتاج إلى استبدال مع تحليل لكل جهاز
+
+        إحصاءات الصيانات وقطع الغيار تحمل لكل الأجهزة مرة واحدة، ثم تطبق
+        المعايير على كل جهاز في الذاكرة بدون استعلامات إضافية.
+        """
         # الحصول على كل الأجهزة
         all_devices = Devices.query.all()
+        statistics = DevicesReplacementService.load_statistics()
         
         results = []
         for device in all_devices:
-            evaluation = DevicesReplacementService.evaluate_device_replacement(device)
+            evaluation = DevicesReplacementService.evaluate_device_replacement(
+                device, statistics.get(device.Id, DevicesReplacementService.EMPTY_STATISTICS)
+            )
             # لإظهار جميع الأجهزة التي تم تقييمها (سواء كانت بحاجة للاستبدال أو لا)
             # قم بتعليق الشرط التالي إذا كنت تريد رؤية كل الأجهزة
             if evaluation["should_retire"]:  # فقط الأجهزة التي تحتاج للاستبدال
                 results.append(evaluation)
                 
         # ترتيب النتائج حسب الأولوية
-        priority_order = {"طارئة": 0, "عالية": 1, "متوسطه": 2, "ضعيفه": 3}
-        results.sort(key=lambda x: priority_order.get(x["priority"], 4))
+        priority_order = DevicesReplacementService.PRIORITY_ORDER
+        results.sort(key=lambda x: priority_order.get(x["priority"], len(priority_order)))
                 
         return results
     
     @staticmethod
-    def evaluate_device_replacement(device):
+    def _evaluate_chunk(devices):
+        """تقييم دفعة أجهزة مع إحصاءاتها، وإرجاع التي تحتاج للاستبدال فقط"""
+        statistics = DevicesReplacementService.load_statistics([device.Id for device in devices])
+        for device in devices:
+            evaluation = DevicesReplacementService.evaluate_device_replacement(
+                device, statistics.get(device.Id, DevicesReplacementService.EMPTY_STATISTICS)
+            )
+            if evaluation["should_retire"]:
+                yield evaluation
+    
+    @staticmethod
+    def iter_devices_for_replacement(order_by_priority=False):
+        """
+        نفس نتائج get_devices_for_replacement كمولد على دفعات بذاكرة ثابتة
+
+        الأجهزة تقرأ على دفعات حسب رقم الجهاز، وكل دفعة تحمل إحصاءاتها في
+        استعلامين. عند order_by_priority يحفظ المرور الأول أرقام الأجهزة فقط لكل
+        أولوية، ثم يعيد المرور الثاني تقييمها أولوية بعد أخرى.
+        """
+        if not order_by_priority:
+            for devices in ReportStream.keyset_chunks(Devices.query, Devices.Id):
+                yield from DevicesReplacementService._evaluate_chunk(devices)
+            return
+
+        priority_order = DevicesReplacementService.PRIORITY_ORDER
+        buckets = [[] for _ in range(len(priority_order) + 1)]
+        for evaluation in DevicesReplacementService.iter_devices_for_replacement():
+            buckets[priority_order.get(evaluation["priority"], len(priority_order))].append(evaluation["device_id"])
+
+        chunk_size = ReportStream.chunk_size()
+        for device_ids in buckets:
+            for start in range(0, len(device_ids), chunk_size):
+                devices = Devices.query.filter(
+                    Devices.Id.in_(device_ids[start:start + chunk_size])
+                ).order_by(Devices.Id).all()
+                yield from DevicesReplacementService._evaluate_chunk(devices)
+                db.session.expunge_all()
+    
+    @staticmethod
+    def evaluate_device_replacement(device, statistics=None):
         """
         تقييم ما إذا كان الجهاز بحاجة إلى الاستبدال
         
@@ -35,7 +154,14 @@ class DevicesReplacementService:
         1. العمر الافتراضي للجهاز (Lifespan) بالسنوات
         2. تكرار الصيانات في فترة قصيرة
         3. تكلفة الصيانة مقارنة بتكلفة الشراء
+        
+        :param statistics: إحصاءات الجهاز من load_statistics (تحمل للجهاز وحده إذا لم ترسل)
         """
+        if statistics is None:
+            statistics = DevicesReplacementService.load_statistics([device.Id]).get(
+                device.Id, DevicesReplacementService.EMPTY_STATISTICS
+            )
+        
         # البدء بافتراض عدم الحاجة للاستبدال
         result = {
             "device_id": device.Id,
@@ -56,14 +182,14 @@ class DevicesReplacementService:
                 result["should_retire"] = True
         
         # المعيار 2: تكرار الصيانات في فترة قصيرة
-        maintenance_score = DevicesReplacementService._evaluate_by_maintenance_frequency(device)
+        maintenance_score = DevicesReplacementService._evaluate_by_maintenance_frequency(device, statistics)
         if maintenance_score:
             result["reasons"].append(maintenance_score["reason"])
             if maintenance_score["retire"]:
                 result["should_retire"] = True
         
         # المعيار 3: تكلفة الصيانة مقارنة بتكلفة الشراء
-        cost_score = DevicesReplacementService._evaluate_by_maintenance_cost(device)
+        cost_score = DevicesReplacementService._evaluate_by_maintenance_cost(device, statistics)
         if cost_score:
             result["reasons"].append(cost_score["reason"])
             result["financial_analysis"] = cost_score["financial_analysis"]
@@ -96,7 +222,7 @@ class DevicesReplacementService:
                 result["priority"] = "ضعيفه"
         
         # إضافة نصائح وتوصيات
-        result["recommendations"] = DevicesReplacementService._get_recommendations(device, result)
+        result["recommendations"] = DevicesReplacementService._get_recommendations(device, result, statistics)
         
         return result
     
@@ -149,28 +275,11 @@ class DevicesReplacementService:
         return result
     
     @staticmethod
-    def _evaluate_by_maintenance_frequency(device):
+    def _evaluate_by_maintenance_frequency(device, statistics):
         """تقييم بناء على تكرار الصيانات في فترة قصيرة"""
-        # الحصول على تاريخ صيانات الجهاز 
-        six_months_ago = datetime.now() - timedelta(days=180)
-        one_year_ago = datetime.now() - timedelta(days=365)
-        
-        # البحث عن صيانات الإصلاح خلال آخر 6 أشهر
-        repair_maintenances = Maintenances.query.filter(
-            Maintenances.DeviceId == device.Id,
-            Maintenances.SchedulingAt > six_months_ago,
-            Maintenances.Type == "إصلاح"
-        ).all()
-        
-        # البحث عن صيانات الدورية خلال آخر سنة
-        periodic_maintenances = Maintenances.query.filter(
-            Maintenances.DeviceId == device.Id,
-            Maintenances.SchedulingAt > one_year_ago,
-            Maintenances.Type == "دورية"
-        ).all()
-        
-        repair_count = len(repair_maintenances)
-        periodic_count = len(periodic_maintenances)
+        # صيانات الإصلاح خلال آخر 6 أشهر والصيانات الدورية خلال آخر سنة
+        repair_count = statistics["repair_count"]
+        periodic_count = statistics["periodic_count"]
         
         result = {
             "retire": False,
@@ -223,15 +332,13 @@ class DevicesReplacementService:
         return None
     
     @staticmethod
-    def _evaluate_by_maintenance_cost(device):
+    def _evaluate_by_maintenance_cost(device, statistics):
         """تقييم بناء على تكلفة الصيانة مقارنة بتكلفة الشراء"""
         if device.PurchaseCost <= 0:
             return None
         
-        # حساب إجمالي تكاليف الصيانة
-        maintenance_costs = db.session.query(func.sum(Maintenances.Cost)).filter(
-            Maintenances.DeviceId == device.Id
-        ).scalar() or 0
+        # إجمالي تكاليف الصيانة
+        maintenance_costs = statistics["maintenance_cost"]
         
         # حساب نسبة تكاليف الصيانة إلى تكلفة الشراء
         cost_ratio = (float(maintenance_costs) / float(device.PurchaseCost)) * 100
@@ -277,7 +384,7 @@ class DevicesReplacementService:
         return result
     
     @staticmethod
-    def _get_recommendations(device, evaluation_result):
+    def _get_recommendations(device, evaluation_result, statistics):
         """توليد نصائح وتوصيات بناء على نتائج التقييم"""
         recommendations = []
         
@@ -285,9 +392,8 @@ class DevicesReplacementService:
             recommendations.append("يوصى باستبدال الجهاز بدلاً من إجراء المزيد من الصيانات")
             
             # تحقق من قطع الغيار المتبقية
-            spare_parts = SpareParts.query.filter_by(DeviceId=device.Id).all()
-            if spare_parts:
-                total_parts_value = sum(float(part.Cost) * part.Quantity for part in spare_parts)
+            if statistics["spare_parts_count"]:
+                total_parts_value = float(statistics["spare_parts_value"])
                 # تقريب قيمة قطع الغيار لأقرب رقمين عشريين
                 total_parts_value = round(total_parts_value, 2)
                 recommendations.append(f"يرجى ملاحظة أن هناك قطع غيار متبقية للجهاز بقيمة إجمالية {total_parts_value:.2f}")
@@ -1,3 +1,4 @@
-from devices_suggestion.resources import SuggestDeviceResource
+from devices_suggestion.resources import SuggestDeviceResource, SuggestDeviceBatchResource
+from devices_suggestion.name_index import DeviceNameIndex
  
-__all__ = ['SuggestDeviceResource'] 
\ No newline at end of file
+__all__ = ['SuggestDeviceResource', 'SuggestDeviceBatchResource', 'DeviceNameIndex'] 
\ No newline at end of file
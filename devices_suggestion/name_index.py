@@ -0,0 +1,163 @@
+from model import Devices
+from extensions import db
+from catalog import fold
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from sqlalchemy.orm import Session
+import threading
+import time
+import re
+
+
+class DeviceNameIndex:
+    """
+    فهرس ثلاثيات الحروف (trigrams) لأسماء الأجهزة
+
+    كل اسم يوحد بنفس قواعد catalog.fold (حذف التشكيل والتطويل وتوحيد أشكال
+    الألف والياء والواو والتاء المربوطة) مع الأرقام والرموز، ثم يقسم إلى ثلاثيات حروف، والفهرس العكسي يحفظ لكل ثلاثية
+    الأجهزة التي تحتويها. التشابه بين اسمين هو معامل Dice على الثلاثيات:
+    2 * المشترك / (عدد ثلاثيات الأول + عدد ثلاثيات الثاني)، وحد 0.5 قريب من
+    نتيجة difflib السابقة للأسماء المتشابهة.
+
+    يبنى الفهرس عند أول استخدام ويعاد بناؤه بعد DEVICE_NAME_INDEX_TTL_SECONDS
+    لالتقاط الأجهزة التي يضيفها أو يعيد تسميتها التطبيق الآخر، ويحدث فوراً بعد
+    حفظ أي جهاز من داخل الخدمة.
+    """
+
+    THRESHOLD = 0.5
+
+    _lock = threading.Lock()
+    _loaded_at = None
+    _grams = {}  # {device_id: frozenset(trigrams)}
+    _postings = {}  # {trigram: set(device_ids)}
+
+    _NON_WORD = re.compile(r'[^\w]+')
+    _SYMBOLS = str.maketrans({
+        '٠': '0', '١': '1', '٢': '2', '٣': '3', '٤': '4',
+        '٥': '5', '٦': '6', '٧': '7', '٨': '8', '٩': '9',
+        '_': ' '
+    })
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('DEVICE_NAME_INDEX_TTL_SECONDS', 300)
+        if not event.contains(Session, 'after_flush', _track_device_names):
+            event.listen(Session, 'after_flush', _track_device_names)
+            event.listen(Session, 'after_commit', _apply_tracked_names)
+            event.listen(Session, 'after_rollback', _discard_tracked_names)
+
+    @staticmethod
+    def normalize(name):
+        """توحيد الاسم قبل التقسيم"""
+        name = fold(name or '').translate(DeviceNameIndex._SYMBOLS)
+        return DeviceNameIndex._NON_WORD.sub(' ', name).strip()
+
+    @staticmethod
+    def trigrams(name):
+        """ثلاثيات الحروف للاسم مع مسافة في بدايته ونهايته"""
+        normalized = DeviceNameIndex.normalize(name)
+        if not normalized:
+            return frozenset()
+        padded = f"  {normalized} "
+        return frozenset(padded[position:position + 3] for position in range(len(padded) - 2))
+
+    @staticmethod
+    def rebuild():
+        rows = db.session.execute(select(Devices.Id, Devices.Name)).all()
+        grams = {}
+        postings = {}
+        for device_id, name in rows:
+            device_grams = DeviceNameIndex.trigrams(name)
+            grams[device_id] = device_grams
+            for gram in device_grams:
+                postings.setdefault(gram, set()).add(device_id)
+
+        with DeviceNameIndex._lock:
+            DeviceNameIndex._grams = grams
+            DeviceNameIndex._postings = postings
+            DeviceNameIndex._loaded_at = time.monotonic()
+
+    @staticmethod
+    def ensure_loaded():
+        loaded_at = DeviceNameIndex._loaded_at
+        ttl = float(current_app.config.get('DEVICE_NAME_INDEX_TTL_SECONDS', 300))
+        if loaded_at is None or time.monotonic() - loaded_at > ttl:
+            DeviceNameIndex.rebuild()
+
+    @staticmethod
+    def apply_changes(names):
+        """تحديث الفهرس بأسماء {device_id: name}، والاسم None يعني أن الجهاز حذف"""
+        if DeviceNameIndex._loaded_at is None:
+            return
+        with DeviceNameIndex._lock:
+            for device_id, name in names.items():
+                for gram in DeviceNameIndex._grams.pop(device_id, ()):
+                    device_ids = DeviceNameIndex._postings.get(gram)
+                    if device_ids is not None:
+                        device_ids.discard(device_id)
+                        if not device_ids:
+                            del DeviceNameIndex._postings[gram]
+                if name is None:
+                    continue
+                device_grams = DeviceNameIndex.trigrams(name)
+                DeviceNameIndex._grams[device_id] = device_grams
+                for gram in device_grams:
+                    DeviceNameIndex._postings.setdefault(gram, set()).add(device_id)
+
+    @staticmethod
+    def similar(name, candidate_ids=None, threshold=None):
+        """
+        الأجهزة ذات الأسماء المشابهة مرتبة حسب درجة التشابه
+
+        :param name: الاسم المطلوب مقارنته
+        :param candidate_ids: حصر النتائج في هذه الأجهزة (اختياري)
+        :param threshold: أقل درجة تشابه (افتراضياً أكبر من 0.5)
+        :return: قائمة [(device_id, score)] تنازلياً حسب الدرجة
+        """
+        DeviceNameIndex.ensure_loaded()
+        threshold = DeviceNameIndex.THRESHOLD if threshold is None else threshold
+        source_grams = DeviceNameIndex.trigrams(name)
+        if not source_grams:
+            return []
+        candidates = set(candidate_ids) if candidate_ids is not None else None
+
+        # عدد الثلاثيات المشتركة لكل جهاز من الفهرس العكسي
+        shared = {}
+        with DeviceNameIndex._lock:
+            for gram in source_grams:
+                for device_id in DeviceNameIndex._postings.get(gram, ()):
+                    if candidates is None or device_id in candidates:
+                        shared[device_id] = shared.get(device_id, 0) + 1
+            sizes = {device_id: len(DeviceNameIndex._grams[device_id]) for device_id in shared}
+
+        matches = []
+        for device_id, count in shared.items():
+            score = 2 * count / (len(source_grams) + sizes[device_id])
+            if score > threshold:
+                matches.append((device_id, score))
+        matches.sort(key=lambda match: (-match[1], match[0]))
+        return matches
+
+
+def _track_device_names(session, flush_context):
+    """جمع الأجهزة الجديدة والتي تغير اسمها أو حذفت في هذه المعاملة"""
+    names = session.info.setdefault('device_name_changes', {})
+    for instance in session.new:
+        if isinstance(instance, Devices):
+            names[instance.Id] = instance.Name
+    for instance in session.dirty:
+        if isinstance(instance, Devices) and inspect(instance).attrs.Name.history.has_changes():
+            names[instance.Id] = instance.Name
+    for instance in session.deleted:
+        if isinstance(instance, Devices):
+            names[instance.Id] = None
+
+
+def _apply_tracked_names(session):
+    names = session.info.pop('device_name_changes', None)
+    if names:
+        DeviceNameIndex.apply_changes(names)
+
+
+def _discard_tracked_names(session):
+    session.info.pop('device_name_changes', None)
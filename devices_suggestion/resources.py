@@ -1,11 +1,87 @@
+from flask import request
 from flask_restful import Resource
+from datetime import datetime
 from devices_suggestion.services import DeviceSuggestionService
 
+
+def parse_slot(values):
+    """
+    قراءة الفترة الاختيارية date و start_time و end_time
+
+    :return: (slot أو None, رسالة الخطأ أو None)
+    """
+    date_str = values.get('date')
+    start_time_str = values.get('start_time')
+    end_time_str = values.get('end_time')
+
+    if not any([date_str, start_time_str, end_time_str]):
+        return None, None
+    if not all([date_str, start_time_str, end_time_str]):
+        return None, "يجب إرسال date و start_time و end_time معاً"
+
+    try:
+        reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+        start_time = datetime.strptime(start_time_str, "%H:%M").time()
+        end_time = datetime.strptime(end_time_str, "%H:%M").time()
+    except (TypeError, ValueError):
+        return None, "صيغة التاريخ يجب أن تكون YYYY-MM-DD والوقت HH:MM"
+
+    if start_time >= end_time:
+        return None, "وقت البداية يجب أن يكون قبل وقت النهاية"
+
+    return (reservation_date, start_time, end_time), None
+
+
 class SuggestDeviceResource(Resource):
     def get(self, device_id):
-        success, result = DeviceSuggestionService.get_device_suggestions(device_id)
+        # الفترة اختيارية: عند إرسالها تقترح الأجهزة الفارغة فيها فقط
+        slot, error = parse_slot(request.args)
+        if error:
+            return {"message": error}, 400
+
+        success, result = DeviceSuggestionService.get_device_suggestions(device_id, slot=slot)
         
         if not success:
             return {"message": result}, 404 if "غير موجود" in result else 500
             
         return result, 200
+
+
+class SuggestDeviceBatchResource(Resource):
+    def post(self):
+        try:
+            data = request.get_json() or {}
+
+            device_ids = data.get('device_ids')
+            if not isinstance(device_ids, list) or not device_ids:
+                return {"success": False, "message": "الحقل device_ids يجب أن يكون قائمة غير فارغة"}, 400
+            if len(device_ids) > DeviceSuggestionService.MAX_BATCH_SIZE:
+                return {
+                    "success": False,
+                    "message": f"أقصى عدد للأجهزة في الطلب الواحد {DeviceSuggestionService.MAX_BATCH_SIZE}"
+                }, 400
+            try:
+                device_ids = [int(device_id) for device_id in device_ids]
+            except (TypeError, ValueError):
+                return {"success": False, "message": "أرقام الأجهزة يجب أن تكون أرقاماً صحيحة"}, 400
+
+            unique = data.get('unique', False)
+            if not isinstance(unique, bool):
+                return {"success": False, "message": "الحقل unique يجب أن يكون true أو false"}, 400
+
+            slot, error = parse_slot(data)
+            if error:
+                return {"success": False, "message": error}, 400
+
+            # unique: عدم تعيين نفس الجهاز البديل لأكثر من جهاز
+            success, result = DeviceSuggestionService.get_batch_suggestions(
+                device_ids, unique=unique, slot=slot
+            )
+
+            if not success:
+                return {"success": False, "message": result}, 500
+
+            return result, 200
+
+        except Exception as e:
+            return {"success": False, "message": f"حدث خطأ أثناء البحث عن أجهزة مماثلة: {str(e)}"}, 500
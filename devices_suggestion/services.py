@@ -1,126 +1,292 @@
-from model import Devices, ExperimentDevices
-from sqlalchemy import and_, func, not_, or_
+from model import Devices, Reservations, Maintenances
+from datetime import datetime
+from sqlalchemy import and_, case, func, literal, not_, or_, select, union_all
 from extensions import db
-import difflib  #
+from catalog import ExperimentDeviceIndex, DeviceStatus, category_key, job_description_key
+from reservations.validation import overlapping_time_filter, reservation_minutes
+from .name_index import DeviceNameIndex
 
 class DeviceSuggestionService:
+    MAX_BATCH_SIZE = 200
+
+    @staticmethod
+    def _excluded_status_keys():
+        # المفاتيح الموحدة تغطي اختلاف المسافات والحروف في الحالة والفئة والوصف
+        return DeviceStatus.keys(DeviceStatus.OUT_OF_SERVICE)
+
+    @staticmethod
+    def _group_key(device):
+        return category_key(device.CategoryName), job_description_key(device.JobDescription)
+
+    @staticmethod
+    def load_candidates(source_devices):
+        """
+        الأجهزة البديلة لمجموعة أجهزة في استعلام واحد
+
+        :return: {(مفتاح الفئة, مفتاح الوصف الوظيفي): [الأجهزة]}
+        """
+        group_keys = {DeviceSuggestionService._group_key(device) for device in source_devices}
+        if not group_keys:
+            return {}
+
+        candidates = Devices.query.filter(
+            or_(*[
+                and_(Devices.CategoryKey == category, Devices.JobDescriptionKey == job_description)
+                for category, job_description in group_keys
+            ]),
+            Devices.StatusKey.notin_(DeviceSuggestionService._excluded_status_keys())
+        ).order_by(Devices.Id).all()
+
+        groups = {}
+        for candidate in candidates:
+            groups.setdefault(DeviceSuggestionService._group_key(candidate), []).append(candidate)
+        return groups
+
+    @staticmethod
+    def _device_info(d):
+        return {
+            "id": d.Id,
+            "name": d.Name,
+            "category": d.CategoryName,
+            "job_description": d.JobDescription,
+            "status": d.Status,
+            "use_recommendations": d.UseRecommendations,
+            "safety_recommendations": d.SafetyRecommendations
+        }
+
+    @staticmethod
+    def rank_suggestions(device, similar_devices):
+        """
+        ترتيب الأجهزة البديلة لجهاز واحد
+
+        الأجهزة المتشابهة في الاسم أولاً حسب درجة التشابه، ثم الأجهزة التي تشترك
+        معه في تجارب، ثم الباقي إذا كان للجهاز تجارب.
+
+        :return: (رسالة أو None, قائمة الأجهزة المقترحة)
+        """
+        if not similar_devices:
+            return "لا توجد أجهزة مماثلة بنفس الوصف الوظيفي والفئة", []
+
+        # تشابه الأسماء من فهرس ثلاثيات الحروف، مرتب تنازلياً
+        devices_by_id = {d.Id: d for d in similar_devices}
+        name_similarity_matches = [
+            {"device": devices_by_id[similar_id], "similarity": similarity}
+            for similar_id, similarity in DeviceNameIndex.similar(device.Name, devices_by_id.keys())
+        ]
+        matched_ids = {match["device"].Id for match in name_similarity_matches}
+        other_similar_devices = [d for d in similar_devices if d.Id not in matched_ids]
+
+        device_experiment_map = {}
+        all_suggested_devices = []
+
+        # التجارب المشتركة من الفهرس العكسي بتقاطع المجموعات
+        has_experiments = bool(ExperimentDeviceIndex.experiments_for(device.Id))
+
+        if has_experiments:
+            device_experiment_map = ExperimentDeviceIndex.common_experiments(device.Id, devices_by_id.keys())
+
+        for match in name_similarity_matches:
+            d = match["device"]
+            device_info = DeviceSuggestionService._device_info(d)
+            device_info["name_similarity"] = round(match["similarity"] * 100)
+
+            if d.Id in device_experiment_map:
+                device_info["common_experiments"] = device_experiment_map[d.Id]
+
+            all_suggested_devices.append(device_info)
+
+        for d in other_similar_devices:
+            if d.Id in device_experiment_map:
+                device_info = DeviceSuggestionService._device_info(d)
+                device_info["common_experiments"] = device_experiment_map[d.Id]
+                all_suggested_devices.append(device_info)
+
+        if has_experiments:
+            for d in other_similar_devices:
+                if d.Id not in device_experiment_map:
+                    all_suggested_devices.append(DeviceSuggestionService._device_info(d))
+
+        if not all_suggested_devices:
+            return "لا توجد أجهزة مماثلة مناسبة", []
+
+        return None, all_suggested_devices
+
+    @staticmethod
+    def _order_by_free_time(suggested_devices, conflicts, busy_minutes):
+        """
+        حذف الأجهزة المشغولة في الفترة المطلوبة وترتيب الباقي حسب الوقت الفارغ
+
+        الترتيب يبقى حسب المجموعة (تشابه الاسم، ثم التجارب المشتركة، ثم الباقي)،
+        وداخل كل مجموعة الأجهزة الأقل حجزاً في ذلك اليوم أولاً.
+        """
+        def group(suggestion):
+            if "name_similarity" in suggestion:
+                return 0
+            return 1 if "common_experiments" in suggestion else 2
+
+        free_devices = []
+        for suggestion in suggested_devices:
+            if suggestion["id"] in conflicts:
+                continue
+            free_devices.append(dict(suggestion, booked_minutes=busy_minutes.get(suggestion["id"], 0)))
+        free_devices.sort(key=lambda suggestion: (group(suggestion), suggestion["booked_minutes"]))
+        return free_devices
+
+    @staticmethod
+    def _apply_batch_slot(results, slot):
+        candidate_ids = {
+            suggestion["id"] for result in results for suggestion in result["suggested_devices"]
+        }
+        conflicts, busy_minutes = DeviceSuggestionService.busy_devices(candidate_ids, *slot)
+        for result in results:
+            if not result["suggested_devices"]:
+                continue
+            result["suggested_devices"] = DeviceSuggestionService._order_by_free_time(
+                result["suggested_devices"], conflicts, busy_minutes
+            )
+            if not result["suggested_devices"]:
+                result["message"] = "لا توجد أجهزة مماثلة متاحة في هذا الوقت"
+
+    @staticmethod
+    def busy_devices(device_ids, reservation_date, start_time, end_time):
+        """
+        انشغال الأجهزة في يوم معين باستعلام واحد (UNION للحجوزات والصيانات المفتوحة)
+
+        :return: (الأجهزة المشغولة في الفترة المطلوبة, {device_id: دقائق الحجز في اليوم})
+        """
+        device_ids = list(device_ids)
+        if not device_ids:
+            return set(), {}
+
+        day_start = datetime.combine(reservation_date, datetime.min.time())
+        reservations = select(
+            Reservations.DeviceId.label('DeviceId'),
+            case(
+                (overlapping_time_filter(Reservations.StartTime, Reservations.EndTime, start_time, end_time), 1),
+                else_=0
+            ).label('Conflict'),
+            reservation_minutes().label('BusyMinutes')
+        ).where(
+            Reservations.DeviceId.in_(device_ids),
+            Reservations.Date == reservation_date,
+            Reservations.IsAllowed == True
+        )
+        # نفس شرط الصيانة المستخدم عند التحقق من الحجز: الجهاز مشغول اليوم كله
+        maintenances = select(
+            Maintenances.DeviceId.label('DeviceId'),
+            literal(1).label('Conflict'),
+            literal(24 * 60).label('BusyMinutes')
+        ).where(
+            Maintenances.DeviceId.in_(device_ids),
+            Maintenances.StartAt <= day_start,
+            Maintenances.EndAt >= day_start,
+            Maintenances.Status != "مكتملة"
+        )
+        busy = union_all(reservations, maintenances).subquery()
+
+        rows = db.session.execute(
+            select(busy.c.DeviceId, func.max(busy.c.Conflict), func.sum(busy.c.BusyMinutes))
+            .group_by(busy.c.DeviceId)
+        ).all()
+
+        conflicts = {device_id for device_id, conflict, _ in rows if conflict}
+        busy_minutes = {device_id: int(minutes or 0) for device_id, _, minutes in rows}
+        return conflicts, busy_minutes
+
     @staticmethod
-    def get_device_suggestions(device_id):
+    def get_device_suggestions(device_id, slot=None):
+        """
+        :param slot: (التاريخ, وقت البداية, وقت النهاية) لاقتراح الأجهزة الفارغة فقط (اختياري)
+        """
         try:
             device = Devices.query.get(device_id)
             
             if not device:
                 return False, "الجهاز غير موجود"
             
-            excluded_statuses = [
-                "قيد الصيانة", " قيد الصيانة", "قيد الصيانة ", " قيد الصيانة ",
-                "غير متاح", " غير متاح", "غير متاح ", " غير متاح ",
-                "في الصيانة", " في الصيانة", "في الصيانة ", " في الصيانة ",
-                "فى الصيانة", " فى الصيانة", "فى الصيانة ", " فى الصيانة "
-            ]
-            
-            similar_devices = Devices.query.filter(
-                and_(
-                    func.lower(Devices.CategoryName) == func.lower(device.CategoryName),
-                    func.lower(Devices.JobDescription) == func.lower(device.JobDescription),
-                    Devices.Id != device_id,
-                    ~Devices.Status.in_(excluded_statuses)
-                )
-            ).all()
-            
-            if not similar_devices:
-                return True, {"message": "لا توجد أجهزة مماثلة بنفس الوصف الوظيفي والفئة", "suggested_devices": []}
-            
-            name_similarity_matches = []
-            other_similar_devices = []
-            
-            for d in similar_devices:
-                name_similarity = difflib.SequenceMatcher(None, device.Name, d.Name).ratio()
-                
-                if name_similarity > 0.5:
-                    name_similarity_matches.append({
-                        "device": d,
-                        "similarity": name_similarity
-                    })
-                else:
-                    other_similar_devices.append(d)
-            
-            name_similarity_matches.sort(key=lambda x: x["similarity"], reverse=True)
-            
-            device_experiment_map = {}
-            all_suggested_devices = []
-            
-            source_device_experiments = db.session.query(ExperimentDevices.ExperimentId).filter(
-                ExperimentDevices.DeviceId == device_id
-            ).all()
-            
-            source_experiment_ids = [exp[0] for exp in source_device_experiments]
-            has_experiments = len(source_experiment_ids) > 0
-            
-            if has_experiments:
-                for d in name_similarity_matches + other_similar_devices:
-                    device_to_check = d["device"] if isinstance(d, dict) else d
-                    device_experiments = db.session.query(ExperimentDevices.ExperimentId).filter(
-                        ExperimentDevices.DeviceId == device_to_check.Id
-                    ).all()
-                    
-                    device_experiment_ids = [exp[0] for exp in device_experiments]
-                    common_experiments = [exp_id for exp_id in device_experiment_ids if exp_id in source_experiment_ids]
-                    
-                    if common_experiments:
-                        device_experiment_map[device_to_check.Id] = common_experiments
-            
-            
-            for match in name_similarity_matches:
-                d = match["device"]
-                device_info = {
-                    "id": d.Id,
-                    "name": d.Name,
-                    "category": d.CategoryName,
-                    "job_description": d.JobDescription,
-                    "status": d.Status,
-                    "use_recommendations": d.UseRecommendations,
-                    "safety_recommendations": d.SafetyRecommendations,
-                    "name_similarity": round(match["similarity"] * 100)  
-                }
-                
-                if d.Id in device_experiment_map:
-                    device_info["common_experiments"] = device_experiment_map[d.Id]
-                
-                all_suggested_devices.append(device_info)
-            
-            for d in other_similar_devices:
-                device_info = {
-                    "id": d.Id,
-                    "name": d.Name,
-                    "category": d.CategoryName,
-                    "job_description": d.JobDescription,
-                    "status": d.Status,
-                    "use_recommendations": d.UseRecommendations,
-                    "safety_recommendations": d.SafetyRecommendations
-                }
-                
-                if d.Id in device_experiment_map:
-                    device_info["common_experiments"] = device_experiment_map[d.Id]
-                    all_suggested_devices.append(device_info)
+            candidates = DeviceSuggestionService.load_candidates([device]).get(
+                DeviceSuggestionService._group_key(device), []
+            )
+            similar_devices = [d for d in candidates if d.Id != device.Id]
             
-            if has_experiments:
-                for d in other_similar_devices:
-                    if d.Id not in device_experiment_map:
-                        all_suggested_devices.append({
-                            "id": d.Id,
-                            "name": d.Name,
-                            "category": d.CategoryName,
-                            "job_description": d.JobDescription,
-                            "status": d.Status,
-                            "use_recommendations": d.UseRecommendations,
-                            "safety_recommendations": d.SafetyRecommendations
-                        })
+            message, suggested_devices = DeviceSuggestionService.rank_suggestions(device, similar_devices)
+            if message:
+                return True, {"message": message, "suggested_devices": []}
             
-            if not all_suggested_devices:
-                return True, {"message": "لا توجد أجهزة مماثلة مناسبة", "suggested_devices": []}
+            if slot:
+                conflicts, busy_minutes = DeviceSuggestionService.busy_devices(
+                    [suggestion["id"] for suggestion in suggested_devices], *slot
+                )
+                suggested_devices = DeviceSuggestionService._order_by_free_time(
+                    suggested_devices, conflicts, busy_minutes
+                )
+                if not suggested_devices:
+                    return True, {"message": "لا توجد أجهزة مماثلة متاحة في هذا الوقت", "suggested_devices": []}
             
-            return True, {"suggested_devices": all_suggested_devices}
+            return True, {"suggested_devices": suggested_devices}
             
         except Exception as e:
             return False, f"حدث خطأ أثناء البحث عن أجهزة مماثلة: {str(e)}"
+
+    @staticmethod
+    def get_batch_suggestions(device_ids, unique=False, slot=None):
+        """
+        اقتراح بدائل لمجموعة أجهزة (مثلاً عند تعطل معمل كامل)
+
+        الأجهزة البديلة تحمل في استعلام واحد للدفعة كلها، والتجارب من فهرس التجارب
+        المشترك، ولا يقترح جهاز من الأجهزة المطلوب استبدالها. عند unique يتم
+        تعيين بديل واحد مختلف لكل جهاز: الأجهزة ذات البدائل الأقل تختار أولاً.
+        عند إرسال slot يحسب انشغال كل البدائل في استعلام واحد للدفعة.
+        """
+        try:
+            requested_ids = list(dict.fromkeys(device_ids))
+            sources = {
+                device.Id: device
+                for device in Devices.query.filter(Devices.Id.in_(requested_ids)).all()
+            }
+            groups = DeviceSuggestionService.load_candidates(sources.values())
+
+            results = []
+            for device_id in requested_ids:
+                device = sources.get(device_id)
+                if not device:
+                    results.append({"device_id": device_id, "message": "الجهاز غير موجود", "suggested_devices": []})
+                    continue
+
+                similar_devices = [
+                    d for d in groups.get(DeviceSuggestionService._group_key(device), [])
+                    if d.Id not in sources
+                ]
+                message, suggested_devices = DeviceSuggestionService.rank_suggestions(device, similar_devices)
+                result = {"device_id": device_id, "suggested_devices": suggested_devices}
+                if message:
+                    result["message"] = message
+                results.append(result)
+
+            if slot:
+                DeviceSuggestionService._apply_batch_slot(results, slot)
+
+            if unique:
+                DeviceSuggestionService._assign_unique(results)
+
+            return True, {"results": results}
+
+        except Exception as e:
+            return False, f"حدث خطأ أثناء البحث عن أجهزة مماثلة: {str(e)}"
+
+    @staticmethod
+    def _assign_unique(results):
+        """تعيين أفضل بديل متاح لكل جهاز بدون تكرار نفس البديل"""
+        assigned = set()
+        order = sorted(
+            (index for index, result in enumerate(results) if result["suggested_devices"]),
+            key=lambda index: (len(results[index]["suggested_devices"]), index)
+        )
+        for result in results:
+            result["assigned_device_id"] = None
+        for index in order:
+            for suggestion in results[index]["suggested_devices"]:
+                if suggestion["id"] not in assigned:
+                    assigned.add(suggestion["id"])
+                    results[index]["assigned_device_id"] = suggestion["id"]
+                    break
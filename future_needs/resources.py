@@ -1,7 +1,11 @@
 from flask_restful import Resource, reqparse
 from flask import jsonify, make_response, request
+from analytics_snapshots import AnalyticsSnapshotService
 from .services import FutureNeedsService
 
+REPORT_NAME = "future_needs"
+AnalyticsSnapshotService.register(REPORT_NAME, FutureNeedsService.get_future_spare_parts_needs)
+
 
 class FutureNeedsResource(Resource):
     """واجهة API للاحتياجات المستقبلية من قطع الغيار"""
@@ -13,19 +17,23 @@ class FutureNeedsResource(Resource):
         يمكن تصفية النتائج باستخدام المعلمات التالية:
         - priority: الأولوية (عالية، متوسطة، منخفضة)
         - reason: سبب الاحتياج (منخفض المخزون، قرب انتهاء الصلاحية، معدل استهلاك عالي، مطلوبة للصيانة القادمة)
+        - refresh: true لإعادة حساب التقرير الآن بدلاً من آخر نسخة محفوظة
         """
         # استخدام args بدلاً من RequestParser
         priority = request.args.get('priority')
         reason = request.args.get('reason')
+        refresh = AnalyticsSnapshotService.wants_refresh(request.args)
         
         # إذا تم تحديد معلمة الأولوية
         if priority:
             if priority not in ["عالية", "متوسطة", "منخفضة"]:
                 return {'status': 'error', 'message': "الأولوية غير صالحة"}, 400
             
-            result = FutureNeedsService.get_parts_by_priority(priority)
+            snapshot = AnalyticsSnapshotService.latest(REPORT_NAME, refresh=refresh)
+            result = FutureNeedsService.get_parts_by_priority(priority, all_needs=snapshot[2])
             if 'error' in result:
                 return {'status': 'error', 'message': result['error']}, 400
+            result["snapshot"] = AnalyticsSnapshotService.metadata(snapshot)
             
             response = make_response(jsonify(result))
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
@@ -37,16 +45,19 @@ class FutureNeedsResource(Resource):
             if reason not in valid_reasons:
                 return {'status': 'error', 'message': "السبب غير صالح"}, 400
             
-            result = FutureNeedsService.get_parts_by_reason(reason)
+            snapshot = AnalyticsSnapshotService.latest(REPORT_NAME, refresh=refresh)
+            result = FutureNeedsService.get_parts_by_reason(reason, all_needs=snapshot[2])
             if 'error' in result:
                 return {'status': 'error', 'message': result['error']}, 400
+            result["snapshot"] = AnalyticsSnapshotService.metadata(snapshot)
             
             response = make_response(jsonify(result))
             response.headers['Content-Type'] = 'application/json; charset=utf-8'
             return response
         
         # بدون تصفية، استرجاع كل الاحتياجات
-        result = FutureNeedsService.get_future_spare_parts_needs()
+        snapshot = AnalyticsSnapshotService.latest(REPORT_NAME, refresh=refresh)
+        result = dict(snapshot[2], snapshot=AnalyticsSnapshotService.metadata(snapshot))
         response = make_response(jsonify(result))
         response.headers['Content-Type'] = 'application/json; charset=utf-8'
         return response
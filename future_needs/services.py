@@ -257,12 +257,13 @@ class FutureNeedsService:
         return device.Name if device else "غير معروف"
     
     @staticmethod
-    def get_parts_by_priority(priority):
-        """استرجاع قطع الغيار المطلوبة حسب الأولوية"""
+    def get_parts_by_priority(priority, all_needs=None):
+        """استرجاع قطع الغيار المطلوبة حسب الأولوية (من نتيجة محسوبة مسبقاً إذا مررت)"""
         if priority not in ["عالية", "متوسطة", "منخفضة"]:
             return {"error": "الأولوية غير صالحة"}
         
-        all_needs = FutureNeedsService.get_future_spare_parts_needs()
+        if all_needs is None:
+            all_needs = FutureNeedsService.get_future_spare_parts_needs()
         filtered_parts = [part for part in all_needs["parts_to_purchase"] if part["priority"] == priority]
         
         # تحديث الملخص
@@ -282,14 +283,15 @@ class FutureNeedsService:
         return result
     
     @staticmethod
-    def get_parts_by_reason(reason):
-        """استرجاع قطع الغيار المطلوبة حسب السبب"""
+    def get_parts_by_reason(reason, all_needs=None):
+        """استرجاع قطع الغيار المطلوبة حسب السبب (من نتيجة محسوبة مسبقاً إذا مررت)"""
         valid_reasons = ["منخفض المخزون", "قرب انتهاء الصلاحية", "معدل استهلاك عالي", "مطلوبة للصيانة القادمة"]
         
         if reason not in valid_reasons:
             return {"error": "السبب غير صالح"}
         
-        all_needs = FutureNeedsService.get_future_spare_parts_needs()
+        if all_needs is None:
+            all_needs = FutureNeedsService.get_future_spare_parts_needs()
         filtered_parts = [part for part in all_needs["parts_to_purchase"] if part["reason"] == reason]
         
         # تحديث الملخص
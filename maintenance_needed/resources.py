@@ -1,11 +1,66 @@
-from flask_restful import Resource
+from flask_restful import Resource, request
+from analytics_snapshots import AnalyticsSnapshotService, ReportStream
 from .services import MaintenanceService
 
+REPORT_NAME = "maintenance_needed"
+AnalyticsSnapshotService.register(REPORT_NAME, MaintenanceService.build_report)
+
 
 class MaintenanceNeededResource(Resource):
+    MAX_LIMIT = 500
+
     def get(self):
         try:
-            success, result = MaintenanceService.get_devices_needing_maintenance()
+            # فلاتر اختيارية وتقسيم صفحات اختياري
+            try:
+                lab_id = int(request.args['lab_id']) if request.args.get('lab_id') else None
+                limit = int(request.args['limit']) if request.args.get('limit') else None
+            except ValueError:
+                return {"success": False, "message": "قيمة lab_id و limit يجب أن تكون أرقاماً"}, 400
+
+            if limit is not None and (limit <= 0 or limit > self.MAX_LIMIT):
+                return {"success": False, "message": f"قيمة limit يجب أن تكون بين 1 و {self.MAX_LIMIT}"}, 400
+
+            priority = request.args.get('priority')
+            if priority is not None and priority not in MaintenanceService.PRIORITY_RANKS:
+                return {"success": False, "message": f"قيمة الأولوية غير صحيحة: {priority}"}, 400
+
+            cursor = request.args.get('cursor')
+            if cursor and not MaintenanceService.decode_cursor(cursor):
+                return {"success": False, "message": "مؤشر الصفحة غير صالح"}, 400
+
+            category = request.args.get('category')
+
+            # البث يشمل كل الصفحات على دفعات، مرتبة حسب الأولوية من الجدول مباشرة
+            if ReportStream.wants_stream(request.args):
+                if limit is not None:
+                    return {"success": False, "message": "لا يمكن استخدام limit مع stream"}, 400
+                return ReportStream.response(MaintenanceService.iter_devices_needing_maintenance(
+                    priority=priority,
+                    lab_id=lab_id,
+                    category=category,
+                    cursor=cursor
+                ))
+
+            # القائمة الكاملة بدون فلاتر تعرض من آخر نسخة محفوظة
+            if lab_id is None and limit is None and priority is None and not cursor and not category:
+                snapshot = AnalyticsSnapshotService.latest(
+                    REPORT_NAME, refresh=AnalyticsSnapshotService.wants_refresh(request.args)
+                )
+                return {
+                    "success": True,
+                    "message": "تم جلب بيانات الأجهزة وأولويات الصيانة بنجاح",
+                    "devices": snapshot[2],
+                    "snapshot": AnalyticsSnapshotService.metadata(snapshot)
+                }, 200
+
+            success, result = MaintenanceService.get_devices_needing_maintenance(
+                priority=priority,
+                lab_id=lab_id,
+                category=category,
+                limit=limit,
+                cursor=cursor
+            )
             
             if not success:
                 return {
@@ -13,14 +68,18 @@ class MaintenanceNeededResource(Resource):
                     "message": result
                 }, 500
 
-            return {
+            response = {
                 "success": True,
                 "message": "تم جلب بيانات الأجهزة وأولويات الصيانة بنجاح",
-                "devices": result
-            }, 200
+                "devices": result["devices"]
+            }
+            if limit is not None:
+                response["next_cursor"] = result["next_cursor"]
+
+            return response, 200
 
         except Exception as e:
             return {
                 "success": False,
                 "message": f"حدث خطأ أثناء جلب بيانات الأجهزة: {str(e)}"
-            }, 500 
\ No newline at end of file
+            }, 500
\ No newline at end of file
@@ -1,143 +1,144 @@
-from model import Devices, Laboratories, Maintenances
+from model import Devices, DeviceLabs, DeviceMaintenanceStatus
 from sqlalchemy import or_, and_, select
-from datetime import datetime
 from extensions import db
+from maintenance_status import MaintenanceStatusService
+from catalog import DeviceStatus, category_key
+from analytics_snapshots import ReportStream
+import base64
+import json
 
 
 class MaintenanceService:
-    @staticmethod
-    def calculate_periodic_maintenance_priority(current_hours, max_hours):
-        percentage = (current_hours / max_hours) * 100
-        if current_hours >= max_hours:
-            return "طارئة"
-        elif percentage >= 90:
-            return "عالية"
-        elif 60 <= percentage < 90:
-            return "متوسطة"
-        else:
-            return "ضعيفة"
+    # ترتيب الأولويات كما في جدول حالة الصيانة
+    PRIORITY_RANKS = MaintenanceStatusService.PRIORITY_RANKS
 
     @staticmethod
-    def calculate_months_between_dates(start_date, end_date):
-        # حساب عدد الشهور بين تاريخين
-        months = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
-        if end_date.day < start_date.day:
-            months -= 1
-        return months
+    def encode_cursor(rank, device_id):
+        return base64.urlsafe_b64encode(json.dumps([rank, device_id]).encode('utf-8')).decode('ascii')
 
     @staticmethod
-    def calculate_calibration_priority(device_id, calibration_interval):
-        if not calibration_interval:
-            return "غير محدد"
-
-        # استخدام select لتحديد الأعمدة المطلوبة فقط
-        stmt = select(Maintenances.EndAt).where(
-            and_(
-                Maintenances.DeviceId == device_id,
-                Maintenances.Type == "معايرة"
-            )
-        ).order_by(Maintenances.EndAt.desc())
-        
-        last_calibration = db.session.execute(stmt).first()
-
-        if not last_calibration or not last_calibration[0]:
-            return "غير محدد"
-
-        # حساب عدد الشهور منذ آخر معايرة
-        months_since_calibration = MaintenanceService.calculate_months_between_dates(
-            last_calibration[0],
-            datetime.now()
-        )
-        
-        # حساب النسبة المئوية من فترة المعايرة التي مرت
-        percentage = (months_since_calibration / calibration_interval) * 100
-        
-        if months_since_calibration >= calibration_interval:
-            return "طارئة"
-        elif percentage >= 90:
-            return "عالية"
-        elif 60 <= percentage < 90:
-            return "متوسطة"
-        else:
-            return "ضعيفة"
+    def decode_cursor(cursor):
+        try:
+            rank, device_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return int(rank), int(device_id)
+        except (ValueError, TypeError, UnicodeError):
+            return None
 
     @staticmethod
-    def get_last_calibration_date(device_id):
-        # استخدام select لتحديد الأعمدة المطلوبة فقط
-        stmt = select(Maintenances.EndAt).where(
-            and_(
-                Maintenances.DeviceId == device_id,
-                Maintenances.Type == "معايرة"
-            )
-        ).order_by(Maintenances.EndAt.desc())
-        
-        result = db.session.execute(stmt).first()
-        return result[0] if result else None
+    def get_devices_needing_maintenance(priority=None, lab_id=None, category=None, limit=None, cursor=None):
+        """
+        الأجهزة مرتبة حسب أولوية الصيانة
 
-    @staticmethod
-    def get_devices_needing_maintenance():
+        الأولويات تقرأ من جدول DeviceMaintenanceStatus المحسوب مسبقاً، والفلترة
+        والترتيب وتقسيم الصفحات (بمفتاح (الأولوية, رقم الجهاز)) تتم في قاعدة البيانات.
+        """
         try:
-            # نجلب كل الأجهزة أولاً للتحقق
-            all_devices = Devices.query.all()
-            print(f"Total devices found: {len(all_devices)}")
-            
-            # نطبع حالة كل جهاز للتحقق
-            for device in all_devices:
-                print(f"Device ID: {device.Id}, Name: {device.Name}, Status: {device.Status}")
+            if priority is not None and priority not in MaintenanceService.PRIORITY_RANKS:
+                return False, f"قيمة الأولوية غير صحيحة: {priority}"
 
-            # نجلب الأجهزة المتاحة فقط
-            devices = Devices.query.filter(
-                Devices.Status != ["في الصيانة", "غير متاح"]
-            ).all()
-            print(f"Available devices: {len(devices)}")
+            MaintenanceStatusService.ensure_populated()
 
-            devices_data = []
-            for device in devices:
-                # حساب أولوية الصيانة الدورية
-                periodic_priority = MaintenanceService.calculate_periodic_maintenance_priority(
-                    device.CurrentHour,
-                    device.MaximumHour
-                )
+            # نجلب الأجهزة المتاحة فقط
+            query = db.session.query(DeviceMaintenanceStatus, Devices).join(
+                Devices, Devices.Id == DeviceMaintenanceStatus.DeviceId
+            ).filter(
+                Devices.StatusKey.notin_(DeviceStatus.keys([DeviceStatus.IN_MAINTENANCE, DeviceStatus.UNAVAILABLE]))
+            )
 
-                # حساب أولوية صيانة المعايرة
-                calibration_priority = MaintenanceService.calculate_calibration_priority(
-                    device.Id,
-                    device.CalibrationInterval
+            if priority is not None:
+                query = query.filter(
+                    DeviceMaintenanceStatus.PriorityRank == MaintenanceService.PRIORITY_RANKS[priority]
                 )
+            if lab_id is not None:
+                query = query.filter(DeviceMaintenanceStatus.DeviceId.in_(
+                    select(DeviceLabs.DeviceId).where(DeviceLabs.LabId == lab_id)
+                ))
+            if category:
+                query = query.filter(Devices.CategoryKey == category_key(category))
+
+            if cursor:
+                key = MaintenanceService.decode_cursor(cursor)
+                if not key:
+                    return False, "مؤشر الصفحة غير صالح"
+                last_rank, last_device_id = key
+                query = query.filter(or_(
+                    DeviceMaintenanceStatus.PriorityRank < last_rank,
+                    and_(
+                        DeviceMaintenanceStatus.PriorityRank == last_rank,
+                        DeviceMaintenanceStatus.DeviceId > last_device_id
+                    )
+                ))
 
-                # تحديد الأولوية النهائية (نأخذ الأعلى أولوية)
-                priority_order = {"طارئة": 4, "عالية": 3, "متوسطة": 2, "ضعيفة": 1, "غير محدد": 0}
-                final_priority = (
-                    periodic_priority if priority_order[periodic_priority] > priority_order[calibration_priority]
-                    else calibration_priority
-                )
+            # ترتيب الأجهزة حسب الأولوية
+            query = query.order_by(DeviceMaintenanceStatus.PriorityRank.desc(), DeviceMaintenanceStatus.DeviceId)
+            if limit is not None:
+                query = query.limit(limit + 1)
+            rows = query.all()
 
-                # الحصول على تاريخ آخر معايرة
-                last_calibration_date = MaintenanceService.get_last_calibration_date(device.Id)
+            next_cursor = None
+            if limit is not None and len(rows) > limit:
+                rows = rows[:limit]
+                last_status = rows[-1][0]
+                next_cursor = MaintenanceService.encode_cursor(last_status.PriorityRank, last_status.DeviceId)
 
+            devices_data = []
+            for status, device in rows:
                 devices_data.append({
                     "device_id": device.Id,
                     "device_name": device.Name,
                     "last_maintenance_date": device.LastMaintenanceDate.strftime("%Y-%m-%d") if device.LastMaintenanceDate else None,
-                    "current_hours": device.CurrentHour,
-                    "priority": final_priority,
+                    "current_hours": status.CurrentHour,
+                    "priority": status.Priority,
+                    "next_due_date": status.NextDueDate.strftime("%Y-%m-%d") if status.NextDueDate else None,
+                    "reason": status.Reason,
                     "periodic_maintenance_details": {
-                        "current_hours": device.CurrentHour,
-                        "maximum_hours": device.MaximumHour,
-                        "priority": periodic_priority
+                        "current_hours": status.CurrentHour,
+                        "maximum_hours": status.MaximumHour,
+                        "priority": status.PeriodicPriority
                     },
                     "calibration_maintenance_details": {
-                        "last_calibration_date": last_calibration_date.strftime("%Y-%m-%d") if last_calibration_date else None,
-                        "calibration_interval_months": device.CalibrationInterval,
-                        "priority": calibration_priority
+                        "last_calibration_date": status.LastCalibrationAt.strftime("%Y-%m-%d") if status.LastCalibrationAt else None,
+                        "calibration_interval_months": status.CalibrationInterval,
+                        "priority": status.CalibrationPriority
                     }
                 })
 
-            # ترتيب الأجهزة حسب الأولوية
-            priority_order = {"طارئة": 4, "عالية": 3, "متوسطة": 2, "ضعيفة": 1, "غير محدد": 0}
-            devices_data.sort(key=lambda x: priority_order[x["priority"]], reverse=True)
-
-            return True, devices_data
+            return True, {"devices": devices_data, "next_cursor": next_cursor}
 
         except Exception as e:
-            return False, f"حدث خطأ أثناء جلب بيانات الأجهزة: {str(e)}" 
\ No newline at end of file
+            return False, f"حدث خطأ أثناء جلب بيانات الأجهزة: {str(e)}"
+
+    @staticmethod
+    def iter_devices_needing_maintenance(priority=None, lab_id=None, category=None, cursor=None):
+        """
+        كل الأجهزة بنفس ترتيب get_devices_needing_maintenance كمولد على دفعات
+
+        كل دفعة صفحة بمؤشر (الأولوية, رقم الجهاز) على الفهرس، فالذاكرة ثابتة
+        مهما كان عدد الأجهزة، والترتيب حسب الأولوية لا يحتاج مروراً ثانياً.
+        """
+        chunk_size = ReportStream.chunk_size()
+        while True:
+            success, result = MaintenanceService.get_devices_needing_maintenance(
+                priority=priority,
+                lab_id=lab_id,
+                category=category,
+                limit=chunk_size,
+                cursor=cursor
+            )
+            if not success:
+                raise RuntimeError(result)
+            db.session.expunge_all()
+
+            yield from result["devices"]
+
+            cursor = result["next_cursor"]
+            if not cursor:
+                return
+
+    @staticmethod
+    def build_report():
+        """كل الأجهزة بدون فلاتر، لحفظها كنسخة من التقرير"""
+        success, result = MaintenanceService.get_devices_needing_maintenance()
+        if not success:
+            raise RuntimeError(result)
+        return result["devices"]
@@ -0,0 +1,85 @@
+from sqlalchemy import func, or_, select
+from model import Devices, Maintenances
+from extensions import db
+
+
+class MaintenanceCostModel:
+    """
+    جداول التكلفة المتوقعة للصيانة، تبنى في استعلام واحد لكل طلب
+
+    - (الجهاز, النوع): تكلفة آخر صيانة للجهاز من نفس النوع
+    - (الفئة, النوع): تكلفة آخر صيانة لأي جهاز من نفس الفئة ومن نفس النوع
+    - (النوع): متوسط تكلفة كل الصيانات من نفس النوع
+
+    بعد البناء كل توقع هو بحث في قاموس بدلاً من عدة استعلامات لكل جهاز.
+    """
+
+    # قيمة افتراضية معقولة للصيانة إذا لم توجد أي صيانات سابقة
+    DEFAULT_COST = 500.0
+
+    def __init__(self, device_costs, category_costs, type_costs):
+        self.device_costs = device_costs
+        self.category_costs = category_costs
+        self.type_costs = type_costs
+
+    @staticmethod
+    def load(maintenance_types):
+        """
+        بناء الجداول لأنواع الصيانة المطلوبة
+
+        row_number حسب (الجهاز, النوع) وحسب (الفئة, النوع) مرتبة بتاريخ الانتهاء
+        تختار آخر صيانة في كل مجموعة، و avg حسب النوع تعطي المتوسط في نفس الاستعلام.
+        الصيانات بدون جهاز تدخل في متوسط النوع فقط.
+        """
+        maintenance_types = list(maintenance_types)
+        if not maintenance_types:
+            return MaintenanceCostModel({}, {}, {})
+
+        latest_first = (Maintenances.EndAt.desc(), Maintenances.Id.desc())
+        ranked = select(
+            Maintenances.DeviceId,
+            Devices.CategoryName,
+            Maintenances.Type,
+            Maintenances.Cost,
+            func.row_number().over(
+                partition_by=(Maintenances.DeviceId, Maintenances.Type),
+                order_by=latest_first
+            ).label('DeviceRank'),
+            func.row_number().over(
+                partition_by=(Devices.CategoryName, Maintenances.Type),
+                order_by=latest_first
+            ).label('CategoryRank'),
+            func.avg(Maintenances.Cost).over(partition_by=Maintenances.Type).label('TypeAverage')
+        ).outerjoin(
+            Devices, Devices.Id == Maintenances.DeviceId
+        ).where(
+            Maintenances.Type.in_(maintenance_types),
+            Maintenances.Cost.isnot(None)
+        ).subquery()
+
+        rows = db.session.execute(
+            select(ranked).where(or_(ranked.c.DeviceRank == 1, ranked.c.CategoryRank == 1))
+        ).all()
+
+        device_costs = {}
+        category_costs = {}
+        type_costs = {}
+        for row in rows:
+            if row.DeviceRank == 1 and row.DeviceId is not None:
+                device_costs[(row.DeviceId, row.Type)] = float(row.Cost)
+            if row.CategoryRank == 1 and row.CategoryName is not None:
+                category_costs[(row.CategoryName, row.Type)] = float(row.Cost)
+            if row.TypeAverage:
+                type_costs[row.Type] = float(row.TypeAverage)
+
+        return MaintenanceCostModel(device_costs, category_costs, type_costs)
+
+    def expected_cost(self, device_id, category_name, maintenance_type):
+        """التكلفة المتوقعة: آخر تكلفة للجهاز، ثم للفئة، ثم متوسط النوع، ثم القيمة الافتراضية"""
+        cost = self.device_costs.get((device_id, maintenance_type))
+        if cost is not None:
+            return cost
+        cost = self.category_costs.get((category_name, maintenance_type))
+        if cost is not None:
+            return cost
+        return self.type_costs.get(maintenance_type, MaintenanceCostModel.DEFAULT_COST)
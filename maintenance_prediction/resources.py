@@ -3,22 +3,32 @@ from flask_restful import Resource
 from datetime import datetime
 from .services import MaintenancePredictionService
 from model import Devices, DeviceLabs, Laboratories
+from analytics_snapshots import AnalyticsSnapshotService
+
+REPORT_NAME = "maintenance_prediction"
+AnalyticsSnapshotService.register(REPORT_NAME, MaintenancePredictionService.predict_device_maintenance)
 
 class DeviceMaintenancePredictionResource(Resource):
     def get(self):
         """
         الحصول على قائمة بالأجهزة المتاحة التي تحتاج إلى صيانة متوقعة
+
+        تعرض آخر نسخة محفوظة من التقرير، و refresh=true يعيد حسابه الآن
         ---
         responses:
           200:
             description: قائمة بتوقعات الصيانة للأجهزة المتاحة
         """
         try:
-            maintenance_predictions = MaintenancePredictionService.predict_device_maintenance()
+            snapshot = AnalyticsSnapshotService.latest(
+                REPORT_NAME, refresh=AnalyticsSnapshotService.wants_refresh(request.args)
+            )
+            maintenance_predictions = snapshot[2]
             return jsonify({
                 "status": "success",
                 "data": maintenance_predictions,
-                "message": "تم استرجاع توقعات الصيانة بنجاح"
+                "message": "تم استرجاع توقعات الصيانة بنجاح",
+                "snapshot": AnalyticsSnapshotService.metadata(snapshot)
             })
         except Exception as e:
             return jsonify({
@@ -0,0 +1,4 @@
+from .services import MaintenanceStatusService
+from .usage_rates import UsageRateService
+
+__all__ = ['MaintenanceStatusService', 'UsageRateService']
@@ -0,0 +1,179 @@
+from datetime import datetime, timedelta
+import numpy as np
+
+
+class MaintenanceScoring:
+    """
+    حساب أولويات الصيانة لكل الأسطول دفعة واحدة باستخدام NumPy
+
+    المدخلات مصفوفات بطول عدد الأجهزة، والقيم الفارغة تمثل بـ NaN للأرقام
+    و NaT للتواريخ. القواعد نفسها المستخدمة سابقاً لكل جهاز:
+    - الدورية: طارئة إذا وصلت الساعات للحد الأقصى، عالية من 90%، متوسطة من 60%
+    - المعايرة: بنفس النسب على عدد الشهور منذ آخر معايرة مقارنة بفترة المعايرة
+    - الأولوية النهائية هي الأعلى من الاثنتين
+    """
+
+    # رقم الأولوية هو موقعها في القائمة
+    PRIORITIES = ["غير محدد", "ضعيفة", "متوسطة", "عالية", "طارئة"]
+
+    # أنواع الصيانة المتوقعة، 0 تعني لا توجد صيانة متوقعة
+    NO_MAINTENANCE = 0
+    PERIODIC = 1
+    CALIBRATION = 2
+    CALIBRATION_OVERDUE = 3
+    MAINTENANCE_TYPES = [None, "صيانة دورية", "معايرة", "معايرة متأخرة"]
+
+    HOURS_PER_DAY = 8
+    DAYS_PER_MONTH = 30
+    CALIBRATION_WINDOW_DAYS = 30
+    # التواريخ الأبعد من ذلك تترك فارغة، لأن datetime لا يتجاوز سنة 9999
+    MAX_HORIZON_DAYS = 100 * 365
+
+    _EPOCH = datetime(1970, 1, 1)
+    _MICROSECOND = timedelta(microseconds=1)
+    _NAT = np.iinfo(np.int64).min
+
+    @staticmethod
+    def to_datetime64(values):
+        """تحويل قائمة datetime (أو None) إلى datetime64 عبر أرقام صحيحة، أسرع من التحويل عنصراً عنصراً"""
+        epoch = MaintenanceScoring._EPOCH
+        microsecond = MaintenanceScoring._MICROSECOND
+        nat = MaintenanceScoring._NAT
+        return np.array(
+            [nat if value is None else (value - epoch) // microsecond for value in values],
+            dtype=np.int64
+        ).view('datetime64[us]')
+
+    @staticmethod
+    def _bucket(value, limit, percentage):
+        """طارئة/عالية/متوسطة/ضعيفة كأرقام 4..1"""
+        return np.select(
+            [value >= limit, percentage >= 90, percentage >= 60],
+            [4, 3, 2],
+            default=1
+        )
+
+    @staticmethod
+    def _date_parts(values):
+        years = values.astype('datetime64[Y]').astype(np.int64) + 1970
+        months = values.astype('datetime64[M]').astype(np.int64) % 12 + 1
+        days = (values.astype('datetime64[D]') - values.astype('datetime64[M]')).astype(np.int64) + 1
+        return years, months, days
+
+    @staticmethod
+    def _add_days(start, days, valid):
+        with np.errstate(invalid='ignore'):
+            valid = valid & np.isfinite(days) & (np.abs(days) <= MaintenanceScoring.MAX_HORIZON_DAYS)
+        offsets = np.where(valid, days, 0) * 86400 * 1000000
+        return np.where(valid, start + offsets.astype('timedelta64[us]'), np.datetime64('NaT'))
+
+    @staticmethod
+    def score(current_hours, maximum_hours, calibration_interval, last_calibration, has_last_maintenance, now,
+              hours_per_day=None):
+        """
+        :param current_hours: ساعات التشغيل الحالية (float)
+        :param maximum_hours: الحد الأقصى للساعات (float)
+        :param calibration_interval: فترة المعايرة بالشهور (float، NaN إذا لم تحدد)
+        :param last_calibration: آخر معايرة (datetime64، NaT إذا لم توجد)
+        :param has_last_maintenance: هل للجهاز LastMaintenanceDate (bool)
+        :param now: الوقت الحالي (datetime)
+        :param hours_per_day: معدل تشغيل كل جهاز بالساعات في اليوم (افتراضياً 8 لكل الأجهزة)
+        :return: قاموس مصفوفات بنفس طول المدخلات
+        """
+        current_hours = np.asarray(current_hours, dtype=np.float64)
+        maximum_hours = np.asarray(maximum_hours, dtype=np.float64)
+        calibration_interval = np.asarray(calibration_interval, dtype=np.float64)
+        last_calibration = np.asarray(last_calibration, dtype='datetime64[us]')
+        has_last_maintenance = np.asarray(has_last_maintenance, dtype=bool)
+        if hours_per_day is None:
+            hours_per_day = MaintenanceScoring.HOURS_PER_DAY
+        hours_per_day = np.asarray(hours_per_day, dtype=np.float64)
+        now64 = np.datetime64(now, 'us')
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # 1. الصيانة الدورية
+            hours_percentage = current_hours * 100 / maximum_hours
+            periodic_rank = MaintenanceScoring._bucket(current_hours, maximum_hours, hours_percentage)
+
+            # 2. المعايرة: عدد الشهور منذ آخر معايرة
+            has_calibration = ~np.isnat(last_calibration)
+            years, months, days = MaintenanceScoring._date_parts(np.where(has_calibration, last_calibration, now64))
+            months_since_calibration = (
+                (now.year - years) * 12 + (now.month - months) - (now.day < days).astype(np.int64)
+            )
+
+            interval_defined = ~np.isnan(calibration_interval)
+            calibration_defined = interval_defined & (calibration_interval != 0) & has_calibration
+            safe_interval = np.where(calibration_defined, calibration_interval, 1)
+            calibration_percentage = months_since_calibration * 100 / safe_interval
+            calibration_rank = np.where(
+                calibration_defined,
+                MaintenanceScoring._bucket(months_since_calibration, safe_interval, calibration_percentage),
+                0
+            )
+
+        # 3. الأولوية النهائية (نأخذ الأعلى أولوية)
+        priority_rank = np.maximum(periodic_rank, calibration_rank)
+
+        # 4. تواريخ الاستحقاق
+        with np.errstate(divide='ignore', invalid='ignore'):
+            periodic_due = MaintenanceScoring._add_days(
+                now64, (maximum_hours - current_hours) / hours_per_day,
+                (maximum_hours != 0) & ~np.isnan(maximum_hours)
+            )
+        calibration_due = MaintenanceScoring._add_days(
+            last_calibration, calibration_interval * MaintenanceScoring.DAYS_PER_MONTH,
+            interval_defined & has_calibration
+        )
+        # التاريخ الأبعد من الحد يعامل كغير محدد
+        periodic_due_valid = ~np.isnat(periodic_due)
+        calibration_due_valid = ~np.isnat(calibration_due)
+        next_due = np.where(
+            periodic_due_valid & calibration_due_valid,
+            np.minimum(periodic_due, calibration_due),
+            np.where(periodic_due_valid, periodic_due, calibration_due)
+        )
+
+        # 5. نوع الصيانة المتوقعة وتاريخها
+        periodic_expected = current_hours >= maximum_hours * 0.9
+        maintenance_type = np.where(periodic_expected, MaintenanceScoring.PERIODIC, MaintenanceScoring.NO_MAINTENANCE)
+        expected_date = np.where(
+            periodic_expected,
+            np.where(periodic_due_valid, periodic_due, now64),
+            np.datetime64('NaT')
+        )
+
+        calibration_candidate = calibration_due_valid & has_last_maintenance
+        days_until_calibration = np.where(
+            calibration_candidate,
+            (np.where(calibration_candidate, calibration_due, now64) - now64) // np.timedelta64(1, 'D'),
+            0
+        )
+        upcoming_calibration = (
+            calibration_candidate
+            & (days_until_calibration > 0)
+            & (days_until_calibration <= MaintenanceScoring.CALIBRATION_WINDOW_DAYS)
+        )
+        # المعايرة فقط إذا لم تكن هناك صيانة دورية متوقعة أو إذا كانت المعايرة قبلها
+        expected_day = expected_date.astype('datetime64[D]').astype('datetime64[us]')
+        take_calibration = upcoming_calibration & (
+            (maintenance_type == MaintenanceScoring.NO_MAINTENANCE) | (expected_day > calibration_due)
+        )
+        overdue_calibration = calibration_candidate & (days_until_calibration <= 0)
+
+        maintenance_type = np.where(take_calibration, MaintenanceScoring.CALIBRATION, maintenance_type)
+        maintenance_type = np.where(overdue_calibration, MaintenanceScoring.CALIBRATION_OVERDUE, maintenance_type)
+        expected_date = np.where(take_calibration | overdue_calibration, calibration_due, expected_date)
+
+        return {
+            "periodic_rank": periodic_rank,
+            "calibration_rank": calibration_rank,
+            "priority_rank": priority_rank,
+            "hours_percentage": hours_percentage,
+            "months_since_calibration": np.where(has_calibration, months_since_calibration, 0),
+            "periodic_due": periodic_due,
+            "calibration_due": calibration_due,
+            "next_due": next_due,
+            "maintenance_type": maintenance_type,
+            "expected_date": expected_date
+        }
@@ -0,0 +1,390 @@
+from model import Devices, Maintenances, DeviceMaintenanceStatus
+from datetime import datetime
+from extensions import db, scheduler
+from sqlalchemy import func, or_, and_, select
+from usage_counters import UsageCounterService
+from availability import AvailabilityIndex
+from .scoring import MaintenanceScoring
+from .usage_rates import UsageRateService
+import numpy as np
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MaintenanceStatusService:
+    """
+    حالة الصيانة المحسوبة مسبقاً لكل جهاز في جدول DeviceMaintenanceStatus
+
+    الأولوية تعتمد فقط على CurrentHour و MaximumHour و CalibrationInterval وآخر
+    معايرة، وتاريخ الصيانة الدورية على معدل تشغيل الجهاز من حجوزاته، لذلك يعاد
+    حساب صف الجهاز عند دمج ساعات الحجوزات في عداداته، أو عندما يجد الفحص الدوري
+    لجدول Maintenances صيانة جديدة أو منتهية له، أو يجد في Devices جهازاً بلا صف
+    أو تغيرت مدخلاته عن المحفوظة (الأجهزة والصيانات يسجلها التطبيق الآخر)،
+    وتقوم مهمة ليلية بإعادة حساب الكل لأن الأولوية تتغير مع الوقت.
+    نقاط الوصول تقرأ من هذا الجدول فقط.
+    """
+
+    PRIORITY_RANKS = {"طارئة": 4, "عالية": 3, "متوسطة": 2, "ضعيفة": 1, "غير محدد": 0}
+    RANK_PRIORITIES = {rank: priority for priority, rank in PRIORITY_RANKS.items()}
+
+    CHUNK_SIZE = 1000
+
+    _pending_lock = threading.Lock()
+    _pending_device_ids = set()
+    _populated = False
+    # (آخر رقم صيانة, وقت آخر فحص) لفحص الصيانات الجديدة والمنتهية
+    _maintenance_watermark = None
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('MAINTENANCE_STATUS_PENDING_SECONDS', 10)
+        app.config.setdefault('MAINTENANCE_STATUS_NIGHTLY_HOUR', 2)
+        app.config.setdefault('MAINTENANCE_STATUS_POLL_SECONDS', 60)
+        UsageRateService.init_app(app)
+
+        # ساعات الحجوزات تصل للأجهزة عند دمج العدادات
+        UsageCounterService.on_fold(MaintenanceStatusService._on_counters_folded)
+
+        # الأجهزة والصيانات يسجلها التطبيق الآخر، لذلك تفحص الجداول دورياً
+        poll_seconds = int(app.config['MAINTENANCE_STATUS_POLL_SECONDS'])
+        if poll_seconds > 0:
+            scheduler.add_job(
+                id='poll_maintenance_changes',
+                func=_poll_maintenance_changes_job,
+                trigger='interval',
+                seconds=poll_seconds,
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
+
+        scheduler.add_job(
+            id='refresh_pending_maintenance_status',
+            func=_refresh_pending_job,
+            trigger='interval',
+            seconds=int(app.config['MAINTENANCE_STATUS_PENDING_SECONDS']),
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+        # إعادة الحساب الكاملة ليلاً لتقادم تواريخ المعايرة والتواريخ المتوقعة
+        scheduler.add_job(
+            id='refresh_all_maintenance_status',
+            func=_refresh_all_job,
+            trigger='cron',
+            hour=int(app.config['MAINTENANCE_STATUS_NIGHTLY_HOUR']),
+            minute=0,
+            max_instances=1,
+            coalesce=True,
+            replace_existing=True
+        )
+
+    # ------------------------------------------------------------------
+    # الحساب
+    # ------------------------------------------------------------------
+
+    # الأعمدة التي يحتاجها الحساب فقط، بدون تحميل كائنات Devices
+    DEVICE_COLUMNS = (
+        Devices.Id, Devices.Status, Devices.CategoryName, Devices.CurrentHour,
+        Devices.MaximumHour, Devices.CalibrationInterval, Devices.LastMaintenanceDate
+    )
+
+    @staticmethod
+    def _reason(current_hour, maximum_hour, hours_percentage, hours_per_day, calibration_interval,
+                last_calibration_date, months):
+        reasons = []
+        if maximum_hour:
+            reasons.append(
+                f"ساعات التشغيل {current_hour} من {maximum_hour} ({round(hours_percentage)}%) "
+                f"بمعدل {round(hours_per_day, 1)} ساعة يومياً"
+            )
+        if calibration_interval is not None and last_calibration_date:
+            reasons.append(f"مرت {months} شهراً من فترة معايرة {calibration_interval} شهراً")
+        return "، ".join(reasons)[:500] or None
+
+    @staticmethod
+    def compute_rows(devices, last_calibrations, now):
+        """
+        حساب صفوف الحالة لمجموعة أجهزة دفعة واحدة
+
+        :param devices: صفوف (Id, Status, CategoryName, CurrentHour, MaximumHour, CalibrationInterval, LastMaintenanceDate)
+        :param last_calibrations: {device_id: آخر معايرة}
+        :return: قائمة قواميس جاهزة للإدخال في DeviceMaintenanceStatus
+        """
+        if not devices:
+            return []
+
+        last_calibration_dates = [last_calibrations.get(device[0]) for device in devices]
+        hours_per_day = [UsageRateService.hours_per_day(device[0], device[2]) for device in devices]
+        scores = MaintenanceScoring.score(
+            current_hours=[device[3] for device in devices],
+            maximum_hours=[device[4] for device in devices],
+            calibration_interval=[np.nan if device[5] is None else device[5] for device in devices],
+            last_calibration=MaintenanceScoring.to_datetime64(last_calibration_dates),
+            has_last_maintenance=[device[6] is not None for device in devices],
+            now=now,
+            hours_per_day=hours_per_day
+        )
+
+        # تحويل النتائج لقيم Python مرة واحدة لكل عمود
+        periodic_ranks = scores["periodic_rank"].tolist()
+        calibration_ranks = scores["calibration_rank"].tolist()
+        priority_ranks = scores["priority_rank"].tolist()
+        hours_percentages = scores["hours_percentage"].tolist()
+        months = scores["months_since_calibration"].tolist()
+        maintenance_types = scores["maintenance_type"].tolist()
+        periodic_due_dates = scores["periodic_due"].tolist()
+        calibration_due_dates = scores["calibration_due"].tolist()
+        next_due_dates = scores["next_due"].tolist()
+        expected_dates = scores["expected_date"].tolist()
+
+        priorities = MaintenanceScoring.PRIORITIES
+        types = MaintenanceScoring.MAINTENANCE_TYPES
+        updated_at = datetime.utcnow()
+
+        rows = []
+        for index, (device_id, status, category, current_hour, maximum_hour, interval, _) in enumerate(devices):
+            rows.append({
+                "DeviceId": device_id,
+                "DeviceStatus": status,
+                "CategoryName": category,
+                "CurrentHour": current_hour,
+                "MaximumHour": maximum_hour,
+                "CalibrationInterval": interval,
+                "LastCalibrationAt": last_calibration_dates[index],
+                "PeriodicPriority": priorities[periodic_ranks[index]],
+                "CalibrationPriority": priorities[calibration_ranks[index]],
+                "Priority": priorities[priority_ranks[index]],
+                "PriorityRank": priority_ranks[index],
+                "PeriodicDueDate": periodic_due_dates[index],
+                "CalibrationDueDate": calibration_due_dates[index],
+                "NextDueDate": next_due_dates[index],
+                "MaintenanceType": types[maintenance_types[index]],
+                "ExpectedDate": expected_dates[index],
+                "Reason": MaintenanceStatusService._reason(
+                    current_hour, maximum_hour, hours_percentages[index], hours_per_day[index],
+                    interval, last_calibration_dates[index], months[index]
+                ),
+                "UpdatedAt": updated_at
+            })
+        return rows
+
+    # ------------------------------------------------------------------
+    # التحديث
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _last_calibrations(device_ids=None):
+        """آخر معايرة لكل جهاز في استعلام واحد: {device_id: EndAt}"""
+        stmt = select(Maintenances.DeviceId, func.max(Maintenances.EndAt)).where(
+            Maintenances.DeviceId.isnot(None),
+            Maintenances.Type == "معايرة"
+        )
+        if device_ids is not None:
+            stmt = stmt.where(Maintenances.DeviceId.in_(device_ids))
+        stmt = stmt.group_by(Maintenances.DeviceId)
+        return {device_id: end_at for device_id, end_at in db.session.execute(stmt).all()}
+
+    @staticmethod
+    def refresh(device_ids=None):
+        """
+        إعادة حساب صفوف أجهزة محددة، أو كل الأجهزة إذا لم تحدد
+
+        :return: عدد الصفوف التي تم حسابها
+        """
+        now = datetime.now()
+        table = DeviceMaintenanceStatus.__table__
+        refreshed = 0
+
+        try:
+            # معدلات التشغيل تحدث تدريجياً قبل الحساب
+            UsageRateService.refresh()
+
+            if device_ids is None:
+                devices = db.session.execute(select(*MaintenanceStatusService.DEVICE_COLUMNS)).all()
+                last_calibrations = MaintenanceStatusService._last_calibrations()
+                rows = MaintenanceStatusService.compute_rows(devices, last_calibrations, now)
+                db.session.execute(table.delete())
+                for position in range(0, len(rows), MaintenanceStatusService.CHUNK_SIZE):
+                    db.session.execute(table.insert(), rows[position:position + MaintenanceStatusService.CHUNK_SIZE])
+                refreshed = len(rows)
+            else:
+                device_ids = sorted({device_id for device_id in device_ids if device_id is not None})
+                for position in range(0, len(device_ids), MaintenanceStatusService.CHUNK_SIZE):
+                    chunk = device_ids[position:position + MaintenanceStatusService.CHUNK_SIZE]
+                    devices = db.session.execute(
+                        select(*MaintenanceStatusService.DEVICE_COLUMNS).where(Devices.Id.in_(chunk))
+                    ).all()
+                    last_calibrations = MaintenanceStatusService._last_calibrations(chunk)
+                    rows = MaintenanceStatusService.compute_rows(devices, last_calibrations, now)
+                    # الأجهزة المحذوفة تحذف صفوفها أيضاً
+                    db.session.execute(table.delete().where(table.c.DeviceId.in_(chunk)))
+                    if rows:
+                        db.session.execute(table.insert(), rows)
+                    refreshed += len(rows)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        if device_ids is None:
+            MaintenanceStatusService._populated = True
+        return refreshed
+
+    @staticmethod
+    def mark_dirty(device_ids):
+        """إضافة أجهزة لقائمة إعادة الحساب التالية"""
+        with MaintenanceStatusService._pending_lock:
+            MaintenanceStatusService._pending_device_ids.update(
+                device_id for device_id in device_ids if device_id is not None
+            )
+
+    @staticmethod
+    def refresh_pending():
+        with MaintenanceStatusService._pending_lock:
+            device_ids = MaintenanceStatusService._pending_device_ids
+            MaintenanceStatusService._pending_device_ids = set()
+        if not device_ids:
+            return 0
+        try:
+            return MaintenanceStatusService.refresh(device_ids)
+        except Exception:
+            # إعادة الأجهزة للقائمة حتى تحاول المهمة التالية
+            MaintenanceStatusService.mark_dirty(device_ids)
+            raise
+
+    @staticmethod
+    def poll_maintenance_changes(now=None):
+        """
+        تعليم الأجهزة التي أضيفت لها صيانة أو انتهت صيانتها منذ آخر فحص
+
+        الصيانات الجديدة تعرف برقم أكبر من آخر رقم تم رؤيته، والمنتهية بتاريخ
+        انتهاء بين آخر فحص والآن. أول فحص يسجل نقطة البداية فقط لأن إعادة
+        الحساب الكاملة عند التشغيل تشمل كل ما قبله، والتعديلات بتاريخ سابق
+        تلتقطها إعادة الحساب الليلية.
+
+        :return: عدد الأجهزة التي تم تعليمها
+        """
+        now = now or datetime.now()
+        last_id = db.session.execute(select(func.max(Maintenances.Id))).scalar() or 0
+
+        watermark = MaintenanceStatusService._maintenance_watermark
+        MaintenanceStatusService._maintenance_watermark = (last_id, now)
+        if watermark is None:
+            return 0
+
+        previous_id, previous_poll = watermark
+        device_ids = {
+            row[0] for row in db.session.execute(
+                select(Maintenances.DeviceId).where(
+                    Maintenances.DeviceId.isnot(None),
+                    or_(
+                        Maintenances.Id > previous_id,
+                        Maintenances.EndAt.between(previous_poll, now)
+                    )
+                ).distinct()
+            ).all()
+        }
+        MaintenanceStatusService.mark_dirty(device_ids)
+        # نوافذ الصيانة في فهرس الإتاحة ودفع التغييرات للمتصفحات
+        AvailabilityIndex.refresh_maintenance(device_ids)
+        return len(device_ids)
+
+    @staticmethod
+    def _differs(stored_column, device_column):
+        """شرط اختلاف القيمة المحفوظة عن قيمة الجهاز مع اعتبار NULL قيمة"""
+        return or_(
+            stored_column != device_column,
+            and_(stored_column.is_(None), device_column.isnot(None)),
+            and_(stored_column.isnot(None), device_column.is_(None))
+        )
+
+    @staticmethod
+    def poll_device_changes():
+        """
+        تعليم الأجهزة الجديدة أو التي تغيرت مدخلات حسابها، والأجهزة المحذوفة
+
+        الجهاز بلا صف في DeviceMaintenanceStatus لا يظهر في نقاط الوصول لأنها
+        تربط الجدولين، لذلك يقارن كل جهاز بصفه المحفوظ بدلاً من انتظار الحساب الليلي.
+
+        :return: عدد الأجهزة التي تم تعليمها
+        """
+        status = DeviceMaintenanceStatus
+        differs = MaintenanceStatusService._differs
+        device_ids = {
+            row[0] for row in db.session.execute(
+                select(Devices.Id).outerjoin(status, status.DeviceId == Devices.Id).where(
+                    or_(
+                        status.DeviceId.is_(None),
+                        differs(status.DeviceStatus, Devices.Status),
+                        differs(status.CategoryName, Devices.CategoryName),
+                        differs(status.CurrentHour, Devices.CurrentHour),
+                        differs(status.MaximumHour, Devices.MaximumHour),
+                        differs(status.CalibrationInterval, Devices.CalibrationInterval)
+                    )
+                )
+            ).all()
+        }
+        # صفوف الأجهزة المحذوفة تحذفها إعادة الحساب
+        device_ids.update(
+            row[0] for row in db.session.execute(
+                select(status.DeviceId).outerjoin(Devices, Devices.Id == status.DeviceId).where(
+                    Devices.Id.is_(None)
+                )
+            ).all()
+        )
+        MaintenanceStatusService.mark_dirty(device_ids)
+        return len(device_ids)
+
+    @staticmethod
+    def ensure_populated():
+        """بناء الجدول عند أول قراءة إذا كان فارغاً"""
+        if MaintenanceStatusService._populated:
+            return
+        if db.session.query(DeviceMaintenanceStatus.DeviceId).first() is None:
+            MaintenanceStatusService.refresh()
+        MaintenanceStatusService._populated = True
+
+    @staticmethod
+    def _on_counters_folded(changed):
+        device_ids = [
+            entity_id for entity_type, entity_id in changed
+            if entity_type == UsageCounterService.DEVICE
+        ]
+        UsageRateService.invalidate(device_ids)
+        MaintenanceStatusService.mark_dirty(device_ids)
+
+
+def _poll_maintenance_changes_job():
+    """مهمة الجدولة لفحص الأجهزة والصيانات التي سجلها التطبيق الآخر"""
+    with scheduler.app.app_context():
+        try:
+            MaintenanceStatusService.poll_maintenance_changes()
+        except Exception as e:
+            logger.error(f"خطأ أثناء فحص تغييرات الصيانات: {str(e)}")
+        try:
+            MaintenanceStatusService.poll_device_changes()
+        except Exception as e:
+            logger.error(f"خطأ أثناء فحص تغييرات الأجهزة: {str(e)}")
+
+
+def _refresh_pending_job():
+    """مهمة الجدولة لإعادة حساب الأجهزة التي تغيرت"""
+    with scheduler.app.app_context():
+        try:
+            MaintenanceStatusService.refresh_pending()
+        except Exception as e:
+            logger.error(f"خطأ أثناء تحديث حالة صيانة الأجهزة: {str(e)}")
+
+
+def _refresh_all_job():
+    """المهمة الليلية لإعادة حساب حالة صيانة كل الأجهزة"""
+    with scheduler.app.app_context():
+        try:
+            count = MaintenanceStatusService.refresh()
+            logger.info(f"تم تحديث حالة الصيانة لـ {count} جهاز")
+        except Exception as e:
+            logger.error(f"خطأ أثناء التحديث الليلي لحالة صيانة الأجهزة: {str(e)}")
@@ -0,0 +1,163 @@
+from model import Devices, Reservations
+from datetime import date, timedelta
+from extensions import db
+from flask import current_app
+from sqlalchemy import func, select
+from reservations.validation import reservation_minutes
+import threading
+import time
+
+
+class UsageRateService:
+    """
+    معدل تشغيل كل جهاز بالساعات في اليوم من حجوزاته الفعلية
+
+    يحسب من مجموع ساعات الحجوزات المقبولة خلال نافذة الأيام الأخيرة، ويحفظ
+    المجموع لكل (جهاز, يوم) في الذاكرة. كل تحديث يقرأ فقط الأيام الجديدة
+    والأجهزة التي تغيرت حجوزاتها ويحذف الأيام التي خرجت من النافذة، وتعاد
+    قراءة النافذة كاملة كل USAGE_RATE_FULL_RELOAD_MINUTES لالتقاط تعديلات
+    التطبيق الآخر على الأيام السابقة.
+    الجهاز الذي حجز في أيام قليلة يأخذ متوسط فئته، وإذا لم يتوفر يبقى التقدير
+    الافتراضي 8 ساعات في اليوم. المعدل لا يقل عن USAGE_RATE_MIN_HOURS_PER_DAY
+    حتى لا تبعد التواريخ المتوقعة آلاف السنين للأجهزة قليلة الاستخدام.
+    """
+
+    DEFAULT_HOURS_PER_DAY = 8
+
+    _lock = threading.Lock()
+    _daily_hours = {}  # {device_id: {date: hours}}
+    _categories = {}  # {device_id: CategoryName}
+    _stale_device_ids = set()
+    _loaded_through = None
+    _full_loaded_at = None
+    _device_rates = {}
+    _category_rates = {}
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('USAGE_RATE_WINDOW_DAYS', 90)
+        # أقل عدد أيام حجز حتى يعتمد معدل الجهاز نفسه
+        app.config.setdefault('USAGE_RATE_MIN_DAYS', 5)
+        # أقل معدل تشغيل (ربع ساعة في اليوم)
+        app.config.setdefault('USAGE_RATE_MIN_HOURS_PER_DAY', 0.25)
+        app.config.setdefault('USAGE_RATE_FULL_RELOAD_MINUTES', 60)
+
+    @staticmethod
+    def _window_days():
+        return int(current_app.config.get('USAGE_RATE_WINDOW_DAYS', 90))
+
+    @staticmethod
+    def _needs_full_reload(loaded_through, start_date):
+        if loaded_through is None or loaded_through < start_date:
+            return True
+        reload_seconds = int(current_app.config.get('USAGE_RATE_FULL_RELOAD_MINUTES', 60)) * 60
+        full_loaded_at = UsageRateService._full_loaded_at
+        return full_loaded_at is None or time.monotonic() - full_loaded_at >= reload_seconds
+
+    @staticmethod
+    def _load(start_date, end_date, device_ids=None):
+        """مجموع ساعات الحجوزات لكل (جهاز, يوم) في استعلام واحد"""
+        stmt = select(
+            Reservations.DeviceId,
+            Devices.CategoryName,
+            Reservations.Date,
+            func.sum(reservation_minutes())
+        ).join(
+            Devices, Devices.Id == Reservations.DeviceId
+        ).where(
+            Reservations.IsAllowed == True,
+            Reservations.Date >= start_date,
+            Reservations.Date <= end_date
+        )
+        if device_ids is not None:
+            stmt = stmt.where(Reservations.DeviceId.in_(device_ids))
+        stmt = stmt.group_by(Reservations.DeviceId, Devices.CategoryName, Reservations.Date)
+        return db.session.execute(stmt).all()
+
+    @staticmethod
+    def invalidate(device_ids):
+        """إعادة قراءة نافذة هذه الأجهزة في التحديث التالي"""
+        with UsageRateService._lock:
+            UsageRateService._stale_device_ids.update(
+                device_id for device_id in device_ids if device_id is not None
+            )
+
+    @staticmethod
+    def refresh(today=None):
+        """تحديث المجاميع المحفوظة وإعادة حساب المعدلات"""
+        today = today or date.today()
+        window_days = UsageRateService._window_days()
+        start_date = today - timedelta(days=window_days - 1)
+
+        with UsageRateService._lock:
+            stale_device_ids = UsageRateService._stale_device_ids
+            UsageRateService._stale_device_ids = set()
+            loaded_through = UsageRateService._loaded_through
+
+            full_reload = UsageRateService._needs_full_reload(loaded_through, start_date)
+            try:
+                if full_reload:
+                    # أول تحميل أو توقف طويل أو انتهاء مدة إعادة القراءة: النافذة كاملة
+                    daily_hours = {}
+                    rows = UsageRateService._load(start_date, today)
+                else:
+                    daily_hours = UsageRateService._daily_hours
+                    for device_id in stale_device_ids:
+                        daily_hours.pop(device_id, None)
+                    # آخر يوم محمل يعاد لأنه ربما زادت حجوزاته
+                    rows = UsageRateService._load(loaded_through, today)
+                    if stale_device_ids:
+                        rows += UsageRateService._load(
+                            start_date, loaded_through - timedelta(days=1), sorted(stale_device_ids)
+                        )
+            except Exception:
+                UsageRateService._stale_device_ids.update(stale_device_ids)
+                raise
+
+            for device_id, category, day, minutes in rows:
+                daily_hours.setdefault(device_id, {})[day] = float(minutes or 0) / 60
+                UsageRateService._categories[device_id] = category
+
+            # حذف الأيام التي خرجت من النافذة
+            for device_id in list(daily_hours):
+                days = daily_hours[device_id]
+                for day in [day for day in days if day < start_date]:
+                    del days[day]
+                if not days:
+                    del daily_hours[device_id]
+
+            UsageRateService._daily_hours = daily_hours
+            UsageRateService._loaded_through = today
+            if full_reload:
+                UsageRateService._full_loaded_at = time.monotonic()
+            UsageRateService._compute_rates(window_days)
+
+    @staticmethod
+    def _compute_rates(window_days):
+        min_days = int(current_app.config.get('USAGE_RATE_MIN_DAYS', 5))
+        min_rate = float(current_app.config.get('USAGE_RATE_MIN_HOURS_PER_DAY', 0.25))
+        device_rates = {}
+        category_totals = {}
+
+        for device_id, days in UsageRateService._daily_hours.items():
+            hours = sum(days.values())
+            if len(days) < min_days or hours <= 0:
+                continue
+            rate = max(hours / window_days, min_rate)
+            device_rates[device_id] = rate
+            category = UsageRateService._categories.get(device_id)
+            total, count = category_totals.get(category, (0.0, 0))
+            category_totals[category] = (total + rate, count + 1)
+
+        UsageRateService._device_rates = device_rates
+        UsageRateService._category_rates = {
+            category: total / count for category, (total, count) in category_totals.items()
+        }
+
+    @staticmethod
+    def hours_per_day(device_id, category_name):
+        """معدل الجهاز، ثم متوسط فئته، ثم التقدير الافتراضي"""
+        rate = UsageRateService._device_rates.get(device_id)
+        if rate is None:
+            rate = UsageRateService._category_rates.get(category_name, UsageRateService.DEFAULT_HOURS_PER_DAY)
+        return rate
@@ -0,0 +1,11 @@
+from .runner import MigrationRunner
+from .check import IndexCheck
+from .cli import schema_cli
+
+
+def init_app(app):
+    """تسجيل أوامر flask schema"""
+    app.cli.add_command(schema_cli)
+
+
+__all__ = ['MigrationRunner', 'IndexCheck', 'init_app']
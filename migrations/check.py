@@ -0,0 +1,93 @@
+from extensions import db
+from sqlalchemy import inspect
+
+
+class IndexCheck:
+    """
+    التحقق من وجود فهارس تدعم شروط الاستعلامات التي تنفذها نقاط الوصول
+
+    كل استعلام يوصف بأعمدة المساواة وعمود المدى أو الترتيب (إن وجد). الاستعلام
+    مدعوم إذا وجد فهرس تبدأ أعمدته بأعمدة المساواة (بأي ترتيب) يليها عمود المدى،
+    وجزئياً إذا كان أول عمود في الفهرس من أعمدة الشرط.
+    """
+
+    INDEXED = "indexed"
+    PARTIAL = "partial"
+    MISSING = "missing"
+
+    # (نقطة الوصول, الوصف, الجدول, أعمدة المساواة, عمود المدى أو الترتيب)
+    ENDPOINT_QUERIES = [
+        ("POST /reservations", "تداخل حجوزات المعمل", "Reservations", ["LabId", "Date", "IsAllowed"], None),
+        ("POST /reservations", "تداخل حجوزات الجهاز", "Reservations", ["DeviceId", "Date"], "StartTime"),
+        ("POST /reservations", "أجهزة التجربة", "ExperimentDevices", ["ExperimentId", "DeviceId"], None),
+        ("POST /reservations", "صيانة الجهاز في يوم الحجز", "Maintenances", ["DeviceId"], None),
+        ("GET /reservations", "القائمة حسب المعمل", "Reservations", ["LabId"], "Date"),
+        ("GET /reservations", "القائمة حسب الجهاز", "Reservations", ["DeviceId"], "Date"),
+        ("GET /reservations", "القائمة حسب المستخدم", "Reservations", ["UserId"], "Date"),
+        ("GET /reservations", "القائمة حسب التاريخ", "Reservations", [], "Date"),
+        ("GET /availability", "بناء فهرس الإتاحة: الحجوزات", "Reservations", [], "Date"),
+        ("GET /availability", "بناء فهرس الإتاحة: الصيانات المفتوحة", "Maintenances", [], "EndAt"),
+        ("GET /devices/maintenance-needed", "الأجهزة حسب الأولوية", "DeviceMaintenanceStatus", [], "PriorityRank"),
+        ("GET /api/devices-maintenance-prediction", "جداول التكلفة: آخر صيانة لكل جهاز ونوع", "Maintenances",
+         ["DeviceId", "Type"], "EndAt"),
+        ("(refresh) DeviceMaintenanceStatus", "آخر معايرة للأجهزة", "Maintenances", ["DeviceId", "Type"], "EndAt"),
+        ("(poll) DeviceMaintenanceStatus", "الصيانات المنتهية منذ آخر فحص", "Maintenances", [], "EndAt"),
+        ("GET /devices/suggest/<id>", "أجهزة بنفس الفئة والوصف الوظيفي", "Devices",
+         ["CategoryKey", "JobDescriptionKey"], None),
+        ("GET /devices/suggest/<id>?date=", "حجوزات البدائل في اليوم", "Reservations", ["DeviceId", "Date"], None),
+        ("GET /devices/suggest/<id>?date=", "الصيانات المفتوحة للبدائل", "Maintenances", ["DeviceId"], None),
+        ("GET /devices-replacement", "تجميع الصيانات حسب الجهاز: العدد حسب النوع والتكلفة", "Maintenances",
+         ["DeviceId"], None),
+        ("GET /devices-replacement", "تجميع قيمة قطع الغيار حسب الجهاز", "SpareParts", ["DeviceId"], None),
+        ("GET /future-spare-parts-needs", "الصيانات القادمة", "Maintenances", [], "SchedulingAt"),
+        ("GET /future-spare-parts-needs", "قطع غيار الأجهزة", "SpareParts", ["DeviceId"], None),
+        ("(analytics) AnalyticsSnapshots", "آخر نسخة من التقرير", "AnalyticsSnapshots", ["ReportName"], "Version"),
+    ]
+
+    @staticmethod
+    def classify(index_columns_list, equality_columns, range_column):
+        """تصنيف دعم الفهارس لاستعلام واحد"""
+        equality = set(equality_columns)
+        best = IndexCheck.MISSING
+        for columns in index_columns_list:
+            prefix = columns[:len(equality)]
+            if equality and set(prefix) == equality:
+                if range_column is None or columns[len(equality):len(equality) + 1] == [range_column]:
+                    return IndexCheck.INDEXED
+                best = IndexCheck.PARTIAL
+            elif not equality and range_column is not None and columns[:1] == [range_column]:
+                return IndexCheck.INDEXED
+            elif columns and (columns[0] in equality or columns[0] == range_column):
+                best = IndexCheck.PARTIAL
+        return best
+
+    @staticmethod
+    def run():
+        """
+        :return: قائمة نتائج لكل استعلام مع حالة دعم الفهارس له
+        """
+        inspector = inspect(db.engine)
+        table_indexes = {}
+        results = []
+
+        for endpoint, description, table_name, equality_columns, range_column in IndexCheck.ENDPOINT_QUERIES:
+            if table_name not in table_indexes:
+                indexes = [
+                    [name for name in item['column_names'] if name]
+                    for item in inspector.get_indexes(table_name)
+                ]
+                # المفتاح الأساسي يعامل كفهرس أيضاً
+                primary_key = inspector.get_pk_constraint(table_name).get('constrained_columns') or []
+                if primary_key:
+                    indexes.append(list(primary_key))
+                table_indexes[table_name] = indexes
+
+            results.append({
+                "endpoint": endpoint,
+                "query": description,
+                "table": table_name,
+                "columns": list(equality_columns) + ([range_column] if range_column else []),
+                "status": IndexCheck.classify(table_indexes[table_name], equality_columns, range_column)
+            })
+
+        return results
@@ -0,0 +1,44 @@
+from flask.cli import AppGroup
+from .runner import MigrationRunner
+from .check import IndexCheck
+import click
+
+
+schema_cli = AppGroup('schema', help="إدارة تغييرات قاعدة البيانات والفهارس")
+
+
+@schema_cli.command('upgrade')
+@click.option('--target', type=int, default=None, help="آخر رقم migration يتم تطبيقه")
+def upgrade_command(target):
+    """تطبيق الـ migrations التي لم تطبق بعد"""
+    applied = MigrationRunner.upgrade(target)
+    if applied:
+        click.echo(f"تم تطبيق: {', '.join(str(version) for version in applied)}")
+    else:
+        click.echo("قاعدة البيانات محدثة")
+
+
+@schema_cli.command('status')
+def status_command():
+    """عرض الـ migrations المطبقة والمتبقية"""
+    for version, description, applied_at in MigrationRunner.status():
+        state = applied_at.strftime("%Y-%m-%d %H:%M") if applied_at else "لم تطبق"
+        click.echo(f"{version:>4}  {state:<16}  {description}")
+
+
+@schema_cli.command('check')
+@click.option('--strict', is_flag=True, help="الخروج بخطأ إذا وجد استعلام بدون فهرس")
+def check_command(strict):
+    """عرض استعلامات نقاط الوصول التي لا يدعمها فهرس"""
+    results = IndexCheck.run()
+    for result in results:
+        click.echo(
+            f"{result['status']:<8}  {result['endpoint']:<40}  "
+            f"{result['table']}({', '.join(result['columns'])})  {result['query']}"
+        )
+
+    missing = [result for result in results if result['status'] == IndexCheck.MISSING]
+    partial = [result for result in results if result['status'] == IndexCheck.PARTIAL]
+    click.echo(f"بدون فهرس: {len(missing)}، دعم جزئي: {len(partial)}، من أصل {len(results)}")
+    if strict and missing:
+        raise SystemExit(1)
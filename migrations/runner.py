@@ -0,0 +1,213 @@
+from model import SchemaVersions
+from datetime import datetime
+from extensions import db
+from sqlalchemy import inspect, select, text
+from sqlalchemy.types import String, LargeBinary
+from .versions import MIGRATIONS
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class MigrationRunner:
+    """
+    تطبيق تغييرات قاعدة البيانات بالترتيب وتسجيلها في جدول SchemaVersions
+
+    كل migration تطبق في معاملة مستقلة، وعلى SQL Server يؤخذ sp_getapplock
+    حتى لا تطبق نسختان من التطبيق نفس الـ migration في نفس الوقت.
+    """
+
+    @staticmethod
+    def _lock(connection):
+        if connection.dialect.name == 'mssql':
+            result = connection.execute(text(
+                "SET NOCOUNT ON; DECLARE @result INT; "
+                "EXEC @result = sp_getapplock @Resource = 'schema:migrations', @LockMode = 'Exclusive', "
+                "@LockOwner = 'Transaction', @LockTimeout = 60000; "
+                "SELECT @result"
+            )).scalar()
+            if result is None or result < 0:
+                raise RuntimeError("تعذر الحصول على قفل الـ migrations")
+
+    @staticmethod
+    def _applied_versions(connection):
+        table = SchemaVersions.__table__
+        table.create(connection, checkfirst=True)
+        return {row[0] for row in connection.execute(select(table.c.Version)).all()}
+
+    @staticmethod
+    def status():
+        """قائمة الـ migrations مع تاريخ تطبيق كل منها أو None"""
+        table = SchemaVersions.__table__
+        with db.engine.begin() as connection:
+            table.create(connection, checkfirst=True)
+            applied = {
+                row.Version: row.AppliedAt
+                for row in connection.execute(select(table.c.Version, table.c.AppliedAt)).all()
+            }
+        return [
+            (version, description, applied.get(version))
+            for version, description, _ in MIGRATIONS
+        ]
+
+    @staticmethod
+    def upgrade(target=None):
+        """
+        تطبيق الـ migrations التي لم تطبق حتى target (أو حتى آخرها)
+
+        :return: أرقام الـ migrations التي تم تطبيقها
+        """
+        applied_now = []
+        for version, description, migrate in MIGRATIONS:
+            if target is not None and version > target:
+                break
+
+            with db.engine.begin() as connection:
+                MigrationRunner._lock(connection)
+                if version in MigrationRunner._applied_versions(connection):
+                    continue
+
+                logger.info(f"تطبيق migration {version}: {description}")
+                migrate(MigrationRunner, connection)
+                connection.execute(SchemaVersions.__table__.insert().values(
+                    Version=version,
+                    Description=description,
+                    AppliedAt=datetime.utcnow()
+                ))
+            applied_now.append(version)
+
+        return applied_now
+
+    # ------------------------------------------------------------------
+    # أدوات تستخدمها الـ migrations
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def create_tables(connection, tables):
+        for table in tables:
+            table.create(connection, checkfirst=True)
+
+    @staticmethod
+    def column_exists(connection, column):
+        existing = inspect(connection).get_columns(column.table.name)
+        return any(item['name'] == column.name for item in existing)
+
+    @staticmethod
+    def drop_column(connection, table_name, column_name):
+        """حذف عمود إذا كان موجوداً (الفهارس عليه تحذف قبله)"""
+        existing = inspect(connection).get_columns(table_name)
+        if not any(item['name'] == column_name for item in existing):
+            return False
+        preparer = connection.dialect.identifier_preparer
+        connection.execute(text(
+            f"ALTER TABLE {preparer.quote(table_name)} DROP COLUMN {preparer.quote(column_name)}"
+        ))
+        return True
+
+    @staticmethod
+    def add_computed_column(connection, column):
+        """
+        إضافة عمود محسوب معرف في model.py إذا لم يكن موجوداً
+
+        على SQL Server يضاف كعمود PERSISTED، وعلى SQLite كعمود VIRTUAL لأن
+        ALTER TABLE لا يسمح بإضافة عمود STORED، وكلاهما يمكن فهرسته.
+        """
+        if MigrationRunner.column_exists(connection, column):
+            return False
+
+        dialect = connection.dialect
+        expression = column.computed.sqltext.compile(dialect=dialect, compile_kwargs={"literal_binds": True})
+        preparer = dialect.identifier_preparer
+        table_name = preparer.quote(column.table.name)
+        column_name = preparer.quote(column.name)
+
+        if dialect.name == 'mssql':
+            statement = f"ALTER TABLE {table_name} ADD {column_name} AS ({expression}) PERSISTED"
+        else:
+            column_type = column.type.compile(dialect=dialect)
+            statement = (
+                f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type} "
+                f"GENERATED ALWAYS AS ({expression}) VIRTUAL"
+            )
+        connection.execute(text(statement))
+        return True
+
+    @staticmethod
+    def index_exists(connection, index):
+        existing = inspect(connection).get_indexes(index.table.name)
+        return any(item['name'] == index.name for item in existing)
+
+    @staticmethod
+    def drop_index(connection, table_name, index_name):
+        """حذف فهرس إذا كان موجوداً، لتغيير أعمدته في migration جديدة"""
+        existing = inspect(connection).get_indexes(table_name)
+        if not any(item['name'] == index_name for item in existing):
+            return False
+        preparer = connection.dialect.identifier_preparer
+        if connection.dialect.name == 'mssql':
+            statement = f"DROP INDEX {preparer.quote(index_name)} ON {preparer.quote(table_name)}"
+        else:
+            statement = f"DROP INDEX {preparer.quote(index_name)}"
+        connection.execute(text(statement))
+        return True
+
+    @staticmethod
+    def create_index(connection, index):
+        """إنشاء فهرس (معرف داخل الـ migration) إذا لم يكن موجوداً"""
+        if MigrationRunner.index_exists(connection, index):
+            return False
+
+        if connection.dialect.name == 'mssql':
+            MigrationRunner._create_mssql_index(connection, index)
+        else:
+            index.create(connection)
+        return True
+
+    @staticmethod
+    def _is_max_type(column_type):
+        # أعمدة nvarchar(max) لا يمكن أن تكون مفتاحاً في فهرس على SQL Server
+        return isinstance(column_type, (String, LargeBinary)) and getattr(column_type, 'length', None) is None
+
+    @staticmethod
+    def _create_mssql_index(connection, index):
+        """
+        إنشاء الفهرس على SQL Server مع نقل أعمدة (max) إلى INCLUDE
+
+        جداول التطبيق الأساسي تستخدم nvarchar(max) لأغلب النصوص، لذلك عمود مثل
+        Maintenances.Type يصبح عموداً مضمناً بدلاً من أن يكون جزءاً من المفتاح.
+        """
+        table_name = index.table.name
+        column_types = {
+            column['name']: column['type']
+            for column in inspect(connection).get_columns(table_name)
+        }
+
+        key_columns = []
+        include_columns = []
+        for column in index.columns:
+            if MigrationRunner._is_max_type(column_types.get(column.name)):
+                include_columns.append(column.name)
+            else:
+                key_columns.append(column.name)
+
+        for name in index.dialect_options['mssql']['include'] or []:
+            name = getattr(name, 'name', name)
+            if name not in key_columns and name not in include_columns:
+                include_columns.append(name)
+
+        if not key_columns:
+            logger.warning(f"تم تخطي الفهرس {index.name}: لا توجد أعمدة صالحة كمفتاح")
+            return
+
+        missing_columns = [name for name in include_columns if name not in column_types]
+        if missing_columns:
+            logger.warning(f"الفهرس {index.name}: أعمدة غير موجودة في الجدول {missing_columns}")
+            include_columns = [name for name in include_columns if name in column_types]
+
+        statement = "CREATE {}NONCLUSTERED INDEX [{}] ON [{}] ({})".format(
+            "UNIQUE " if index.unique else "", index.name, table_name, ", ".join(f"[{name}]" for name in key_columns)
+        )
+        if include_columns:
+            statement += " INCLUDE ({})".format(", ".join(f"[{name}]" for name in include_columns))
+
+        connection.execute(text(statement))
@@ -0,0 +1,224 @@
+from sqlalchemy import (
+    BigInteger, Column, Computed, Date, DateTime, Float, Index, Integer, MetaData, String, Table, Time,
+    Unicode, UnicodeText, cast, func, literal, select
+)
+
+
+# كل migration: (الرقم, الوصف, دالة تستقبل (runner, connection))
+# لا يتم تعديل migration بعد تطبيقها، أي تغيير جديد يضاف برقم جديد.
+# الجداول والأعمدة المحسوبة والفهارس تعرف داخل كل migration كما كانت وقت كتابتها
+# ولا تقرأ من model.py، فتعديل model.py لاحقاً يحتاج migration جديدة تطبقه
+# (مثلاً runner.drop_index ثم إنشاء الفهرس، أو runner.drop_column ثم إضافة العمود).
+
+def _index(table_name, name, columns, include=(), unique=False):
+    """فهرس ثابت على جدول مستقل عن model.py"""
+    table = Table(table_name, MetaData(), *[Column(column) for column in columns])
+    return Index(name, *[table.c[column] for column in columns], unique=unique, mssql_include=list(include))
+
+
+def _create_indexes(runner, connection, indexes):
+    for index in indexes:
+        runner.create_index(connection, index)
+
+
+def _text_key(column, length, replacements):
+    """تعبير المفتاح الموحد بقواعد التوحيد المثبتة في الـ migration"""
+    expression = column
+    for old, new in replacements:
+        expression = func.replace(expression, literal(old, Unicode()), literal(new, Unicode()))
+    return cast(func.lower(func.ltrim(func.rtrim(expression))), Unicode(length))
+
+
+def _device_key_columns(replacements):
+    """أعمدة Devices المحسوبة StatusKey و CategoryKey و JobDescriptionKey"""
+    status = Column('Status', String)
+    category_name = Column('CategoryName', String)
+    job_description = Column('JobDescription', String)
+    table = Table(
+        'Devices', MetaData(), status, category_name, job_description,
+        Column('StatusKey', Unicode(100), Computed(_text_key(status, 100, replacements), persisted=True)),
+        Column('CategoryKey', Unicode(200), Computed(_text_key(category_name, 200, replacements), persisted=True)),
+        Column('JobDescriptionKey', Unicode(400),
+               Computed(_text_key(job_description, 400, replacements), persisted=True))
+    )
+    return [table.c.StatusKey, table.c.CategoryKey, table.c.JobDescriptionKey]
+
+
+def _create_service_tables(runner, connection):
+    metadata = MetaData()
+    runner.create_tables(connection, [
+        Table(
+            'UsageCounterDeltas', metadata,
+            Column('Id', Integer, primary_key=True),
+            Column('EntityType', String(20), nullable=False),
+            Column('EntityId', Integer, nullable=False),
+            Column('Hours', Float, nullable=False),
+            Column('Count', Integer, nullable=False),
+            Column('CreatedAt', DateTime, nullable=False)
+        ),
+        Table(
+            'ReservationRejections', metadata,
+            Column('Id', BigInteger, primary_key=True, autoincrement=False),
+            Column('UserId', Integer, nullable=False),
+            Column('LabId', Integer, nullable=True),
+            Column('DeviceId', Integer, nullable=True),
+            Column('DeviceIds', Unicode(1000), nullable=True),
+            Column('ExperimentId', Integer, nullable=True),
+            Column('Date', Date, nullable=False),
+            Column('StartTime', Time, nullable=False),
+            Column('EndTime', Time, nullable=False),
+            Column('Purpose', Unicode, nullable=True),
+            Column('Reason', Unicode(500), nullable=True),
+            Column('CreatedAt', DateTime, nullable=False)
+        )
+    ])
+
+
+def _create_reservation_indexes(runner, connection):
+    _create_indexes(runner, connection, [
+        _index('Reservations', 'IX_Reservations_LabId_Date_IsAllowed', ['LabId', 'Date', 'IsAllowed'],
+               include=['StartTime', 'EndTime', 'UserId']),
+        _index('Reservations', 'IX_Reservations_LabId_Date_StartTime', ['LabId', 'Date', 'StartTime', 'Id']),
+        _index('Reservations', 'IX_Reservations_DeviceId_Date_StartTime', ['DeviceId', 'Date', 'StartTime', 'Id'],
+               include=['EndTime', 'IsAllowed']),
+        _index('Reservations', 'IX_Reservations_UserId_Date_StartTime', ['UserId', 'Date', 'StartTime', 'Id']),
+        _index('Reservations', 'IX_Reservations_Date_StartTime', ['Date', 'StartTime', 'Id']),
+    ])
+
+
+def _create_maintenance_and_parts_indexes(runner, connection):
+    _create_indexes(runner, connection, [
+        _index('Maintenances', 'IX_Maintenances_DeviceId_Type_EndAt', ['DeviceId', 'Type', 'EndAt'],
+               include=['Status', 'StartAt', 'SchedulingAt', 'Cost']),
+        _index('SpareParts', 'IX_SpareParts_DeviceId', ['DeviceId'], include=['Cost', 'Quantity']),
+        _index('ExperimentDevices', 'IX_ExperimentDevices_ExperimentId_DeviceId', ['ExperimentId', 'DeviceId']),
+        _index('ExperimentDevices', 'IX_ExperimentDevices_DeviceId', ['DeviceId'], include=['ExperimentId']),
+    ])
+
+
+def _create_maintenance_status_table(runner, connection):
+    runner.create_tables(connection, [
+        Table(
+            'DeviceMaintenanceStatus', MetaData(),
+            Column('DeviceId', Integer, primary_key=True, autoincrement=False),
+            Column('DeviceStatus', Unicode(50), nullable=True),
+            Column('CategoryName', Unicode(200), nullable=True),
+            Column('CurrentHour', Integer, nullable=True),
+            Column('MaximumHour', Integer, nullable=True),
+            Column('CalibrationInterval', Integer, nullable=True),
+            Column('LastCalibrationAt', DateTime, nullable=True),
+            Column('PeriodicPriority', Unicode(20), nullable=False),
+            Column('CalibrationPriority', Unicode(20), nullable=False),
+            Column('Priority', Unicode(20), nullable=False),
+            Column('PriorityRank', Integer, nullable=False),
+            Column('PeriodicDueDate', DateTime, nullable=True),
+            Column('CalibrationDueDate', DateTime, nullable=True),
+            Column('NextDueDate', DateTime, nullable=True),
+            Column('MaintenanceType', Unicode(50), nullable=True),
+            Column('ExpectedDate', DateTime, nullable=True),
+            Column('Reason', Unicode(500), nullable=True),
+            Column('UpdatedAt', DateTime, nullable=False)
+        )
+    ])
+    _create_indexes(runner, connection, [
+        _index('DeviceMaintenanceStatus', 'IX_DeviceMaintenanceStatus_PriorityRank', ['PriorityRank', 'DeviceId']),
+    ])
+
+
+def _create_analytics_snapshots_table(runner, connection):
+    runner.create_tables(connection, [
+        Table(
+            'AnalyticsSnapshots', MetaData(),
+            Column('Id', BigInteger, primary_key=True),
+            Column('ReportName', Unicode(100), nullable=False),
+            Column('Version', Integer, nullable=False),
+            Column('GeneratedAt', DateTime, nullable=False),
+            Column('DurationMs', Integer, nullable=True),
+            Column('Payload', UnicodeText, nullable=False)
+        )
+    ])
+    _create_indexes(runner, connection, [
+        _index('AnalyticsSnapshots', 'UX_AnalyticsSnapshots_ReportName_Version', ['ReportName', 'Version'],
+               unique=True),
+    ])
+
+
+def _add_device_key_columns(runner, connection):
+    replacements = [
+        ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ى', 'ي'), ('ة', 'ه'), ('ـ', ''), ('  ', ' ')
+    ]
+    for column in _device_key_columns(replacements):
+        runner.add_computed_column(connection, column)
+    _create_indexes(runner, connection, [
+        _index('Devices', 'IX_Devices_StatusKey', ['StatusKey']),
+        _index('Devices', 'IX_Devices_CategoryKey_JobDescriptionKey', ['CategoryKey', 'JobDescriptionKey'],
+               include=['StatusKey']),
+    ])
+
+
+def _create_maintenance_end_index(runner, connection):
+    _create_indexes(runner, connection, [
+        _index('Maintenances', 'IX_Maintenances_EndAt', ['EndAt'], include=['DeviceId']),
+    ])
+
+
+def _rebuild_device_key_columns(runner, connection):
+    """
+    إعادة إنشاء مفاتيح Devices بعد إضافة ؤ/ئ/ٱ والتشكيل إلى قواعد التوحيد
+
+    تعبير العمود المحسوب لا يعدل، لذلك تحذف الفهارس والأعمدة ثم تضاف من جديد.
+    """
+    indexes = [
+        _index('Devices', 'IX_Devices_StatusKey', ['StatusKey']),
+        _index('Devices', 'IX_Devices_CategoryKey_JobDescriptionKey', ['CategoryKey', 'JobDescriptionKey'],
+               include=['StatusKey']),
+    ]
+    replacements = [
+        ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'), ('ى', 'ي'), ('ئ', 'ي'), ('ؤ', 'و'), ('ة', 'ه'),
+        ('ـ', ''),
+        ('\u064b', ''), ('\u064c', ''), ('\u064d', ''), ('\u064e', ''), ('\u064f', ''),
+        ('\u0650', ''), ('\u0651', ''), ('\u0652', ''), ('\u0670', ''),
+        ('  ', ' ')
+    ]
+    for index in indexes:
+        runner.drop_index(connection, 'Devices', index.name)
+    for column in _device_key_columns(replacements):
+        runner.drop_column(connection, 'Devices', column.name)
+        runner.add_computed_column(connection, column)
+    _create_indexes(runner, connection, indexes)
+
+
+def _create_id_ranges_table(runner, connection):
+    """
+    جدول IdRanges لحجز أرقام المحاولات المرفوضة بدلاً من توليدها من الساعة
+
+    السلسلة تبدأ بعد أكبر رقم موجود حتى لا تتكرر الأرقام المبنية على الوقت.
+    """
+    metadata = MetaData()
+    id_ranges = Table(
+        'IdRanges', metadata,
+        Column('Name', Unicode(100), primary_key=True),
+        Column('NextId', BigInteger, nullable=False)
+    )
+    rejections = Table('ReservationRejections', metadata, Column('Id', BigInteger))
+    runner.create_tables(connection, [id_ranges])
+
+    exists = connection.execute(
+        select(id_ranges.c.Name).where(id_ranges.c.Name == 'ReservationRejections')
+    ).first()
+    if exists is None:
+        last_id = connection.execute(select(func.max(rejections.c.Id))).scalar() or 0
+        connection.execute(id_ranges.insert().values(Name='ReservationRejections', NextId=last_id + 1))
+
+
+MIGRATIONS = [
+    (1, "جداول الخدمة: UsageCounterDeltas و ReservationRejections", _create_service_tables),
+    (2, "فهارس Reservations للتحقق من التداخل وقائمة الحجوزات", _create_reservation_indexes),
+    (3, "فهارس Maintenances و SpareParts و ExperimentDevices", _create_maintenance_and_parts_indexes),
+    (4, "جدول حالة صيانة الأجهزة DeviceMaintenanceStatus", _create_maintenance_status_table),
+    (5, "جدول نسخ التقارير التحليلية AnalyticsSnapshots", _create_analytics_snapshots_table),
+    (6, "مفاتيح Devices الموحدة للحالة والفئة والوصف الوظيفي مع فهارسها", _add_device_key_columns),
+    (7, "فهرس Maintenances حسب تاريخ الانتهاء لفحص الصيانات المنتهية", _create_maintenance_end_index),
+    (8, "إعادة إنشاء مفاتيح Devices الموحدة بقواعد التوحيد المشتركة", _rebuild_device_key_columns),
+    (9, "جدول IdRanges لأرقام المحاولات المرفوضة", _create_id_ranges_table),
+]
@@ -1,5 +1,25 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy import cast, func, literal
+
+# توحيد النصوص لمفاتيح الفلترة المحسوبة، ونفس القواعد في catalog.normalization.fold:
+# أشكال الألف والياء والواو والتاء المربوطة، وحذف التطويل والتشكيل والمسافات المكررة.
+# تغيير القواعد يحتاج migration جديدة تعيد إنشاء أعمدة Devices المحسوبة بالقواعد الجديدة
+TEXT_KEY_REPLACEMENTS = [
+    ('أ', 'ا'), ('إ', 'ا'), ('آ', 'ا'), ('ٱ', 'ا'), ('ى', 'ي'), ('ئ', 'ي'), ('ؤ', 'و'), ('ة', 'ه'),
+    ('ـ', ''),
+] + [(chr(mark), '') for mark in list(range(0x064B, 0x0653)) + [0x0670]] + [
+    ('  ', ' ')
+]
+
+
+def text_key(column, length):
+    """تعبير SQL للمفتاح الموحد: استبدال الحروف ثم حذف المسافات الطرفية ثم lower"""
+    expression = column
+    for old, new in TEXT_KEY_REPLACEMENTS:
+        expression = func.replace(expression, literal(old, db.Unicode()), literal(new, db.Unicode()))
+    return cast(func.lower(func.ltrim(func.rtrim(expression))), db.Unicode(length))
+
 
 class Users(db.Model):
     __tablename__ = 'Users'
@@ -26,6 +46,11 @@ class Users(db.Model):
 
 class Devices(db.Model):
     __tablename__ = 'Devices'
+    __table_args__ = (
+        db.Index('IX_Devices_StatusKey', 'StatusKey'),
+        db.Index('IX_Devices_CategoryKey_JobDescriptionKey', 'CategoryKey', 'JobDescriptionKey',
+                 mssql_include=['StatusKey']),
+    )
     
     Id = db.Column(db.Integer, primary_key=True)
     SerialNumber = db.Column(db.String, nullable=False)
@@ -46,6 +71,13 @@ class Devices(db.Model):
     SafetyRecommendations = db.Column(db.String, nullable=False)
     JobDescription = db.Column(db.String, nullable=False)
     
+    # مفاتيح محسوبة ومفهرسة للفلترة بالمساواة (لا تحمل مع الجهاز)
+    StatusKey = db.deferred(db.Column(db.Unicode(100), db.Computed(text_key(Status, 100), persisted=True)))
+    CategoryKey = db.deferred(db.Column(db.Unicode(200), db.Computed(text_key(CategoryName, 200), persisted=True)))
+    JobDescriptionKey = db.deferred(
+        db.Column(db.Unicode(400), db.Computed(text_key(JobDescription, 400), persisted=True))
+    )
+    
     # Relationships
     reservations = db.relationship('Reservations', backref='device', lazy=True)
     maintenances = db.relationship('Maintenances', backref='device', lazy=True)
@@ -102,6 +134,19 @@ class Experiments(db.Model):
 
 class Reservations(db.Model):
     __tablename__ = 'Reservations'
+    # الفهارس تنشأ عن طريق migrations وليس create_all
+    __table_args__ = (
+        # التحقق من تداخل حجوزات المعمل
+        db.Index('IX_Reservations_LabId_Date_IsAllowed', 'LabId', 'Date', 'IsAllowed',
+                 mssql_include=['StartTime', 'EndTime', 'UserId']),
+        # قائمة الحجوزات، نفس ترتيب مفتاح الصفحات (Date, StartTime, Id) بعد عمود الفلتر
+        db.Index('IX_Reservations_LabId_Date_StartTime', 'LabId', 'Date', 'StartTime', 'Id'),
+        # التحقق من تداخل حجوزات الجهاز والقائمة حسب الجهاز
+        db.Index('IX_Reservations_DeviceId_Date_StartTime', 'DeviceId', 'Date', 'StartTime', 'Id',
+                 mssql_include=['EndTime', 'IsAllowed']),
+        db.Index('IX_Reservations_UserId_Date_StartTime', 'UserId', 'Date', 'StartTime', 'Id'),
+        db.Index('IX_Reservations_Date_StartTime', 'Date', 'StartTime', 'Id'),
+    )
     
     Id = db.Column(db.Integer, primary_key=True)
     Date = db.Column(db.Date, nullable=False)
@@ -120,6 +165,12 @@ class Reservations(db.Model):
 
 class Maintenances(db.Model):
     __tablename__ = 'Maintenances'
+    __table_args__ = (
+        db.Index('IX_Maintenances_DeviceId_Type_EndAt', 'DeviceId', 'Type', 'EndAt',
+                 mssql_include=['Status', 'StartAt', 'SchedulingAt', 'Cost']),
+        # فحص الصيانات المنتهية منذ آخر فحص لتحديث حالة صيانة الأجهزة
+        db.Index('IX_Maintenances_EndAt', 'EndAt', mssql_include=['DeviceId']),
+    )
     
     Id = db.Column(db.Integer, primary_key=True)
     Priority = db.Column(db.String, nullable=True)
@@ -171,6 +222,9 @@ class AlertRecipients(db.Model):
 
 class SpareParts(db.Model):
     __tablename__ = 'SpareParts'
+    __table_args__ = (
+        db.Index('IX_SpareParts_DeviceId', 'DeviceId', mssql_include=['Cost', 'Quantity']),
+    )
     
     PartId = db.Column(db.Integer, primary_key=True)
     PartName = db.Column(db.String(100), nullable=False)
@@ -200,7 +254,117 @@ class DeviceLabs(db.Model):
 
 class ExperimentDevices(db.Model):
     __tablename__ = 'ExperimentDevices'
+    __table_args__ = (
+        db.Index('IX_ExperimentDevices_ExperimentId_DeviceId', 'ExperimentId', 'DeviceId'),
+        db.Index('IX_ExperimentDevices_DeviceId', 'DeviceId', mssql_include=['ExperimentId']),
+    )
     
     Id = db.Column(db.Integer, primary_key=True)
     ExperimentId = db.Column(db.Integer, db.ForeignKey('Experiments.ExperimentId', ondelete='CASCADE'), nullable=False)
-    DeviceId = db.Column(db.Integer, db.ForeignKey('Devices.Id', ondelete='CASCADE'), nullable=False) 
\ No newline at end of file
+    DeviceId = db.Column(db.Integer, db.ForeignKey('Devices.Id', ondelete='CASCADE'), nullable=False)
+
+
+# Service-owned Tables
+class UsageCounterDeltas(db.Model):
+    __tablename__ = 'UsageCounterDeltas'
+    
+    Id = db.Column(db.Integer, primary_key=True)
+    EntityType = db.Column(db.String(20), nullable=False)
+    EntityId = db.Column(db.Integer, nullable=False)
+    Hours = db.Column(db.Float, nullable=False, default=0)
+    Count = db.Column(db.Integer, nullable=False, default=0)
+    CreatedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<UsageCounterDelta {self.EntityType} {self.EntityId}>'
+
+
+class ReservationRejections(db.Model):
+    __tablename__ = 'ReservationRejections'
+    
+    # رقم المحاولة يحجزه التطبيق من IdRanges ويعاد للعميل في reservation_id
+    Id = db.Column(db.BigInteger, primary_key=True, autoincrement=False)
+    UserId = db.Column(db.Integer, nullable=False)
+    LabId = db.Column(db.Integer, nullable=True)
+    DeviceId = db.Column(db.Integer, nullable=True)
+    DeviceIds = db.Column(db.Unicode(1000), nullable=True)
+    ExperimentId = db.Column(db.Integer, nullable=True)
+    Date = db.Column(db.Date, nullable=False)
+    StartTime = db.Column(db.Time, nullable=False)
+    EndTime = db.Column(db.Time, nullable=False)
+    Purpose = db.Column(db.Unicode, nullable=True)
+    Reason = db.Column(db.Unicode(500), nullable=True)
+    CreatedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<ReservationRejection {self.Id}>'
+
+
+class IdRanges(db.Model):
+    __tablename__ = 'IdRanges'
+    
+    # الرقم التالي غير المحجوز لكل سلسلة أرقام يولدها التطبيق، تحجز منه مجموعات متتالية
+    Name = db.Column(db.Unicode(100), primary_key=True)
+    NextId = db.Column(db.BigInteger, nullable=False)
+    
+    def __repr__(self):
+        return f'<IdRange {self.Name} {self.NextId}>'
+
+
+class SchemaVersions(db.Model):
+    __tablename__ = 'SchemaVersions'
+    
+    Version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    Description = db.Column(db.Unicode(200), nullable=False)
+    AppliedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.Version}>'
+
+
+class DeviceMaintenanceStatus(db.Model):
+    __tablename__ = 'DeviceMaintenanceStatus'
+    __table_args__ = (
+        db.Index('IX_DeviceMaintenanceStatus_PriorityRank', 'PriorityRank', 'DeviceId'),
+    )
+    
+    # صف لكل جهاز يحدث عند تغير ساعات التشغيل أو الصيانات، وليلياً للتقادم الزمني
+    DeviceId = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    DeviceStatus = db.Column(db.Unicode(50), nullable=True)
+    CategoryName = db.Column(db.Unicode(200), nullable=True)
+    CurrentHour = db.Column(db.Integer, nullable=True)
+    MaximumHour = db.Column(db.Integer, nullable=True)
+    CalibrationInterval = db.Column(db.Integer, nullable=True)
+    LastCalibrationAt = db.Column(db.DateTime, nullable=True)
+    PeriodicPriority = db.Column(db.Unicode(20), nullable=False)
+    CalibrationPriority = db.Column(db.Unicode(20), nullable=False)
+    Priority = db.Column(db.Unicode(20), nullable=False)
+    PriorityRank = db.Column(db.Integer, nullable=False)
+    PeriodicDueDate = db.Column(db.DateTime, nullable=True)
+    CalibrationDueDate = db.Column(db.DateTime, nullable=True)
+    NextDueDate = db.Column(db.DateTime, nullable=True)
+    MaintenanceType = db.Column(db.Unicode(50), nullable=True)
+    ExpectedDate = db.Column(db.DateTime, nullable=True)
+    Reason = db.Column(db.Unicode(500), nullable=True)
+    UpdatedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<DeviceMaintenanceStatus {self.DeviceId} {self.Priority}>'
+
+
+class AnalyticsSnapshots(db.Model):
+    __tablename__ = 'AnalyticsSnapshots'
+    __table_args__ = (
+        db.Index('UX_AnalyticsSnapshots_ReportName_Version', 'ReportName', 'Version', unique=True),
+    )
+    
+    # نسخة محفوظة من نتيجة تقرير تحليلي، النسخة الأعلى هي التي تعرض
+    Id = db.Column(db.BigInteger, primary_key=True)
+    ReportName = db.Column(db.Unicode(100), nullable=False)
+    Version = db.Column(db.Integer, nullable=False)
+    GeneratedAt = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    DurationMs = db.Column(db.Integer, nullable=True)
+    Payload = db.Column(db.UnicodeText, nullable=False)
+    
+    def __repr__(self):
+        return f'<AnalyticsSnapshot {self.ReportName} v{self.Version}>'
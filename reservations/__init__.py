@@ -1,3 +1,4 @@
-from .resources import ReservationListResource
+from .resources import ReservationListResource, BulkReservationResource
+from .rejections import RejectionLog
  
-__all__ = ['ReservationListResource'] 
\ No newline at end of file
+__all__ = ['ReservationListResource', 'BulkReservationResource', 'RejectionLog'] 
\ No newline at end of file
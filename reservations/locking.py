@@ -0,0 +1,89 @@
+from flask import current_app
+from datetime import datetime
+from contextlib import contextmanager
+from extensions import db
+from sqlalchemy import text
+import threading
+import zlib
+
+
+class ReservationLockTimeout(Exception):
+    """تعذر الحصول على قفل الحجز خلال المهلة المحددة"""
+
+
+class ReservationLock:
+    """
+    قفل لكل معمل ويوم ولكل جهاز ويوم يغطي التحقق والإدخال في نفس المعاملة
+
+    داخل العملية يستخدم مجموعة ثابتة من الأقفال، وعلى SQL Server يضاف
+    sp_getapplock بملكية المعاملة حتى يشمل القفل كل نسخ التطبيق، ويتحرر
+    تلقائياً عند commit أو rollback.
+    """
+
+    STRIPES = 256
+    _stripes = [threading.Lock() for _ in range(STRIPES)]
+
+    @staticmethod
+    def _normalize_date(value):
+        if hasattr(value, 'strftime'):
+            return value.strftime("%Y-%m-%d")
+        try:
+            return datetime.strptime(value, "%Y-%m-%d").strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            return str(value)
+
+    @staticmethod
+    def resource_names(lab_ids, device_ids, dates):
+        names = set()
+        for day in {ReservationLock._normalize_date(d) for d in dates}:
+            for lab_id in lab_ids:
+                if lab_id is not None:
+                    names.add(f"lab:{lab_id}:{day}")
+            for device_id in device_ids:
+                if device_id is not None:
+                    names.add(f"device:{device_id}:{day}")
+        return sorted(names)
+
+    @staticmethod
+    @contextmanager
+    def hold(lab_ids, device_ids, dates):
+        """
+        الحصول على الأقفال بترتيب ثابت لتجنب الـ deadlock
+
+        يجب أن يتم commit داخل الكتلة، وأي تغييرات لم يتم حفظها عند الخروج
+        يتم التراجع عنها حتى تتحرر أقفال قاعدة البيانات مع أقفال العملية.
+        """
+        timeout_ms = int(current_app.config.get('RESERVATION_LOCK_TIMEOUT_MS', 10000))
+        names = ReservationLock.resource_names(lab_ids, device_ids, dates)
+        stripe_indexes = sorted({zlib.crc32(name.encode('utf-8')) % ReservationLock.STRIPES for name in names})
+
+        acquired = []
+        try:
+            for index in stripe_indexes:
+                lock = ReservationLock._stripes[index]
+                if not lock.acquire(timeout=timeout_ms / 1000):
+                    raise ReservationLockTimeout()
+                acquired.append(lock)
+
+            if db.engine.dialect.name == 'mssql' and names:
+                # كل الأقفال في طلب واحد إلى قاعدة البيانات، ويتوقف عند أول فشل
+                statements = ["SET NOCOUNT ON; DECLARE @result INT = 0;"]
+                params = {"timeout": timeout_ms}
+                for position, name in enumerate(names):
+                    statements.append(
+                        f"IF @result >= 0 EXEC @result = sp_getapplock @Resource = :resource_{position}, "
+                        f"@LockMode = 'Exclusive', @LockOwner = 'Transaction', @LockTimeout = :timeout;"
+                    )
+                    params[f"resource_{position}"] = f"reservation:{name}"
+                statements.append("SELECT @result;")
+
+                result = db.session.execute(text(" ".join(statements)), params).scalar()
+                if result is None or result < 0:
+                    raise ReservationLockTimeout()
+
+            yield
+        finally:
+            if db.session.in_transaction():
+                db.session.rollback()
+            for lock in reversed(acquired):
+                lock.release()
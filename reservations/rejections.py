@@ -0,0 +1,202 @@
+from model import ReservationRejections, IdRanges
+from datetime import datetime
+from extensions import db
+from flask import current_app
+from sqlalchemy import select
+import threading
+import queue
+import os
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class RejectionLog:
+    """
+    تسجيل محاولات الحجز المرفوضة خارج مسار الطلب
+
+    المحاولة توضع في طابور داخل العملية ويتم الرد على العميل مباشرة، ثم يقوم
+    عامل في الخلفية بكتابة المحاولات على دفعات في جدول ReservationRejections
+    بدلاً من إضافة صفوف IsAllowed=False إلى جدول الحجوزات.
+    """
+
+    _queue = None
+    _worker = None
+    _app = None
+    _stopping = threading.Event()
+    _start_lock = threading.Lock()
+
+    # اسم سلسلة الأرقام في IdRanges
+    ID_RANGE = 'ReservationRejections'
+
+    _id_lock = threading.Lock()
+    # الأرقام المحجوزة لهذه العملية: [_next_id, _end_id)، وتترك بعد الـ fork
+    _next_id = 0
+    _end_id = 0
+    _id_pid = None
+
+    @staticmethod
+    def init_app(app):
+        app.config.setdefault('REJECTION_LOG_QUEUE_SIZE', 10000)
+        app.config.setdefault('REJECTION_LOG_BATCH_SIZE', 500)
+        app.config.setdefault('REJECTION_LOG_FLUSH_SECONDS', 2)
+        app.config.setdefault('REJECTION_LOG_ID_BLOCK_SIZE', 1000)
+
+        RejectionLog._app = app
+        RejectionLog._queue = queue.Queue(maxsize=int(app.config['REJECTION_LOG_QUEUE_SIZE']))
+
+    @staticmethod
+    def _reserve_ids(count):
+        """
+        حجز count رقماً متتالياً من IdRanges في معاملة مستقلة عن جلسة الطلب
+
+        تحديث الصف يقفله حتى نهاية المعاملة، فلا تحجز عمليتان نفس الأرقام.
+        :return: (أول رقم, الرقم بعد آخر رقم)
+        """
+        table = IdRanges.__table__
+        with db.engine.begin() as connection:
+            updated = connection.execute(
+                table.update().where(table.c.Name == RejectionLog.ID_RANGE).values(NextId=table.c.NextId + count)
+            ).rowcount
+            if not updated:
+                raise RuntimeError(f"سلسلة الأرقام {RejectionLog.ID_RANGE} غير موجودة في IdRanges")
+            end_id = connection.execute(
+                select(table.c.NextId).where(table.c.Name == RejectionLog.ID_RANGE)
+            ).scalar()
+        return end_id - count, end_id
+
+    @staticmethod
+    def next_attempt_id():
+        """
+        رقم فريد للمحاولة من مجموعة أرقام محجوزة مسبقاً في قاعدة البيانات
+
+        لا يعتمد على الساعة، فلا يتكرر بعد إعادة التشغيل أو رجوع الوقت، ولا
+        يتكرر بين عمليات gunicorn لأن كل عملية تحجز مجموعتها.
+        """
+        with RejectionLog._id_lock:
+            if RejectionLog._next_id >= RejectionLog._end_id or RejectionLog._id_pid != os.getpid():
+                block_size = max(1, int(current_app.config.get('REJECTION_LOG_ID_BLOCK_SIZE', 1000)))
+                RejectionLog._next_id, RejectionLog._end_id = RejectionLog._reserve_ids(block_size)
+                RejectionLog._id_pid = os.getpid()
+            attempt_id = RejectionLog._next_id
+            RejectionLog._next_id += 1
+            return attempt_id
+
+    @staticmethod
+    def _ensure_worker():
+        # يبدأ العامل عند أول استخدام حتى يعمل بعد الـ fork في gunicorn
+        if RejectionLog._worker is not None and RejectionLog._worker.is_alive():
+            return
+        with RejectionLog._start_lock:
+            if RejectionLog._worker is not None and RejectionLog._worker.is_alive():
+                return
+            RejectionLog._stopping.clear()
+            RejectionLog._worker = threading.Thread(
+                target=RejectionLog._run, name='reservation-rejection-log', daemon=True
+            )
+            RejectionLog._worker.start()
+
+    @staticmethod
+    def record(user_id, lab_id, experiment_id, device_ids, reservation_date, start_time, end_time, purpose, reason):
+        """
+        إضافة محاولة مرفوضة إلى الطابور
+
+        :return: رقم المحاولة، أو None إذا تعذر حجز رقم لها
+        """
+        try:
+            attempt_id = RejectionLog.next_attempt_id()
+        except Exception as e:
+            logger.error(f"تعذر حجز رقم للمحاولة المرفوضة، لم يتم تسجيلها: {str(e)}")
+            return None
+        row = {
+            "Id": attempt_id,
+            "UserId": user_id,
+            "LabId": lab_id,
+            "DeviceId": device_ids[0] if device_ids else None,
+            "DeviceIds": json.dumps(list(device_ids or []))[:1000],
+            "ExperimentId": experiment_id,
+            "Date": reservation_date,
+            "StartTime": start_time,
+            "EndTime": end_time,
+            "Purpose": purpose,
+            "Reason": (reason or "")[:500],
+            "CreatedAt": datetime.utcnow()
+        }
+
+        if RejectionLog._queue is None:
+            logger.warning("سجل المحاولات المرفوضة غير مهيأ، تم تجاهل المحاولة")
+            return attempt_id
+
+        RejectionLog._ensure_worker()
+        try:
+            RejectionLog._queue.put_nowait(row)
+        except queue.Full:
+            # الطابور ممتلئ: لا نؤخر الطلب، فقط نسجل فقدان المحاولة
+            logger.warning(f"طابور المحاولات المرفوضة ممتلئ، لم يتم تسجيل المحاولة {attempt_id}")
+
+        return attempt_id
+
+    @staticmethod
+    def _take_batch(wait_seconds):
+        """انتظار أول عنصر ثم أخذ ما هو متوفر حتى حجم الدفعة"""
+        batch_size = int(RejectionLog._app.config['REJECTION_LOG_BATCH_SIZE'])
+        batch = []
+        try:
+            batch.append(RejectionLog._queue.get(timeout=wait_seconds))
+        except queue.Empty:
+            return batch
+        while len(batch) < batch_size:
+            try:
+                batch.append(RejectionLog._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    @staticmethod
+    def _write_batch(batch):
+        """كتابة الدفعة في معاملة واحدة، وعند فشلها تكتب صفاً صفاً حتى لا تفقد الدفعة كلها"""
+        table = ReservationRejections.__table__
+        with RejectionLog._app.app_context():
+            try:
+                try:
+                    db.session.execute(table.insert(), batch)
+                    db.session.commit()
+                    return
+                except Exception as e:
+                    db.session.rollback()
+                    logger.warning(
+                        f"تعذر حفظ دفعة من {len(batch)} محاولة مرفوضة، تتم المحاولة صفاً صفاً: {str(e)}"
+                    )
+
+                for row in batch:
+                    try:
+                        db.session.execute(table.insert(), [row])
+                        db.session.commit()
+                    except Exception as e:
+                        db.session.rollback()
+                        logger.error(f"خطأ أثناء حفظ المحاولة المرفوضة {row['Id']}: {str(e)}")
+            finally:
+                db.session.remove()
+
+    @staticmethod
+    def _run():
+        wait_seconds = float(RejectionLog._app.config['REJECTION_LOG_FLUSH_SECONDS'])
+        while not RejectionLog._stopping.is_set():
+            batch = RejectionLog._take_batch(wait_seconds)
+            if batch:
+                RejectionLog._write_batch(batch)
+
+    @staticmethod
+    def flush():
+        """كتابة كل ما في الطابور حالاً، تستخدم عند إيقاف التطبيق"""
+        if RejectionLog._queue is None:
+            return
+        RejectionLog._stopping.set()
+        if RejectionLog._worker is not None:
+            RejectionLog._worker.join(timeout=float(RejectionLog._app.config['REJECTION_LOG_FLUSH_SECONDS']) + 5)
+        while True:
+            batch = RejectionLog._take_batch(0)
+            if not batch:
+                break
+            RejectionLog._write_batch(batch)
@@ -1,9 +1,70 @@
+from flask import jsonify, make_response
 from flask_restful import Resource, request
 from .services import ReservationService
-from model import Reservations, Laboratories
+from model import Laboratories
 
 
 class ReservationListResource(Resource):
+    DEFAULT_LIMIT = 50
+    MAX_LIMIT = 200
+
+    def get(self):
+        """
+        قائمة الحجوزات مع فلاتر وترقيم صفحات بالمؤشر
+
+        يعاد ETag لكل صفحة، وإذا أرسل العميل نفس القيمة في If-None-Match
+        ولم تتغير الصفحة يتم الرد بـ 304 بدون محتوى.
+        """
+        try:
+            filters = {}
+            for field in ['lab_id', 'device_id', 'user_id']:
+                value = request.args.get(field)
+                if value is not None:
+                    try:
+                        filters[field] = int(value)
+                    except ValueError:
+                        return {"success": False, "message": f"الحقل {field} يجب أن يكون رقماً"}, 400
+
+            is_allowed = request.args.get('is_allowed')
+            if is_allowed is not None:
+                if is_allowed.lower() not in ['true', 'false', '1', '0']:
+                    return {"success": False, "message": "قيمة is_allowed يجب أن تكون true أو false"}, 400
+                filters['is_allowed'] = is_allowed.lower() in ['true', '1']
+
+            filters['date_from'] = request.args.get('date_from')
+            filters['date_to'] = request.args.get('date_to')
+
+            try:
+                limit = int(request.args.get('limit', self.DEFAULT_LIMIT))
+            except ValueError:
+                return {"success": False, "message": "قيمة limit يجب أن تكون رقماً"}, 400
+            if limit <= 0 or limit > self.MAX_LIMIT:
+                return {"success": False, "message": f"قيمة limit يجب أن تكون بين 1 و {self.MAX_LIMIT}"}, 400
+
+            success, result = ReservationService.list_reservations(
+                filters, limit, request.args.get('cursor')
+            )
+            if not success:
+                return {"success": False, "message": result}, 400
+
+            body = {
+                "success": True,
+                "count": len(result["reservations"]),
+                "next_cursor": result["next_cursor"],
+                "reservations": result["reservations"]
+            }
+
+            response = make_response(jsonify(body))
+            response.set_etag(ReservationService.page_etag(result))
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء جلب الحجوزات: {str(e)}"
+            }, 500
+
     def post(self):
         try:
             data = request.get_json()
@@ -18,7 +79,7 @@ class ReservationListResource(Resource):
                     return {"success": False, "message": f"الحقل {field} مطلوب"}, 400
 
             # إنشاء الحجز
-            reservation_id, message = ReservationService.create_reservation(
+            reservation_id, message, is_allowed = ReservationService.create_reservation(
                 data['user_id'],
                 data['lab_id'],
                 data['experiment_id'],
@@ -33,8 +94,7 @@ class ReservationListResource(Resource):
                 return {"success": False, "message": message}, 400
 
             # التحقق من حالة الحجز
-            reservation = Reservations.query.get(reservation_id)
-            if reservation.IsAllowed:
+            if is_allowed:
                 return {
                     "success": True,
                     "message": "تم إنشاء الحجز بنجاح",
@@ -56,5 +116,75 @@ class ReservationListResource(Resource):
             return {
                 "success": False,
                 "message": f"حدث خطأ أثناء إنشاء الحجز: {str(e)}"
-            }, 500 
+            }, 500
+
+
+class BulkReservationResource(Resource):
+    MAX_OCCURRENCES = 200
+
+    def post(self):
+        try:
+            data = request.get_json()
+
+            # التحقق من البيانات المطلوبة
+            required_fields = ['user_id', 'lab_id', 'experiment_id', 'device_ids', 'purpose']
+            for field in required_fields:
+                if field not in data:
+                    return {"success": False, "message": f"الحقل {field} مطلوب"}, 400
+
+            if not isinstance(data['device_ids'], list) or not data['device_ids']:
+                return {"success": False, "message": "الحقل device_ids يجب أن يكون قائمة غير فارغة"}, 400
+            try:
+                # أرقام الأجهزة قد تصل كنصوص، والتكرار يحذف مع الحفاظ على الترتيب
+                device_ids = list(dict.fromkeys(int(device_id) for device_id in data['device_ids']))
+            except (TypeError, ValueError):
+                return {"success": False, "message": "أرقام الأجهزة يجب أن تكون أرقاماً صحيحة"}, 400
+
+            # المواعيد: قائمة صريحة أو قاعدة تكرار
+            if 'occurrences' in data:
+                occurrences = data['occurrences']
+                if not isinstance(occurrences, list) or not occurrences:
+                    return {"success": False, "message": "الحقل occurrences يجب أن يكون قائمة غير فارغة"}, 400
+                if len(occurrences) > self.MAX_OCCURRENCES:
+                    return {
+                        "success": False,
+                        "message": f"أقصى عدد للمواعيد في الطلب الواحد {self.MAX_OCCURRENCES}"
+                    }, 400
+            elif 'recurrence' in data:
+                valid, occurrences = ReservationService.expand_recurrence(
+                    data['recurrence'], self.MAX_OCCURRENCES
+                )
+                if not valid:
+                    return {"success": False, "message": occurrences}, 400
+                if not occurrences:
+                    return {"success": False, "message": "قاعدة التكرار لا تنتج أي مواعيد"}, 400
+            else:
+                return {"success": False, "message": "الحقل occurrences أو recurrence مطلوب"}, 400
+
+            success, results = ReservationService.create_bulk_reservations(
+                data['user_id'],
+                data['lab_id'],
+                data['experiment_id'],
+                device_ids,
+                occurrences,
+                data['purpose']
+            )
 
+            if not success:
+                return {"success": False, "message": results}, 400
+
+            created_count = sum(1 for result in results if result["success"])
+            response = {
+                "success": created_count > 0,
+                "message": f"تم إنشاء {created_count} من {len(results)} حجز",
+                "created_count": created_count,
+                "conflict_count": len(results) - created_count,
+                "occurrences": results
+            }
+            return response, 201 if created_count else 400
+
+        except Exception as e:
+            return {
+                "success": False,
+                "message": f"حدث خطأ أثناء إنشاء الحجوزات: {str(e)}"
+            }, 500
@@ -1,6 +1,16 @@
 from model import Users, Laboratories, Experiments, Reservations, Devices, ExperimentDevices
+from contextlib import nullcontext
 from datetime import datetime
 from extensions import db
+from .validation import DeviceBatchValidator
+from .locking import ReservationLock, ReservationLockTimeout
+from .rejections import RejectionLog
+from availability import AvailabilityIndex
+from catalog import DeviceStatus
+from usage_counters import UsageCounterService
+import base64
+import hashlib
+import json
 
 
 class ReservationService:
@@ -109,9 +119,7 @@ class ReservationService:
     @staticmethod
     def validate_devices(device_ids, experiment_id, date_str, start_time_str, end_time_str, exclude_reservation_id=None):
         try:
-            valid_devices = []
             from datetime import date
-            from sqlalchemy import or_, and_
             
             # تحويل التاريخ والوقت إلى الصيغة المناسبة
             reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
@@ -127,76 +135,23 @@ class ReservationService:
             if reservation_date < today:
                 return False, "لا يمكن الحجز في تاريخ سابق"
             
-            for device_id in device_ids:
-                device = Devices.query.get(device_id)
-                if not device:
-                    return False, f"الجهاز رقم {device_id} غير موجود"
-                    
-                # التحقق من أن الجهاز تابع للتجربة من خلال جدول ExperimentDevices
-                experiment_device = ExperimentDevices.query.filter_by(
-                    ExperimentId=experiment_id,
-                    DeviceId=device_id
-                ).first()
-                
-                if not experiment_device:
-                    return False, f"الجهاز رقم {device_id} غير مرتبط بهذه التجربة"
-                    
-                if device.Status != "متاح":
-                    return False, f"الجهاز {device.Name} غير متاح حالياً. الحالة: {device.Status}"
-                    
-                # البحث عن الحجوزات المتداخلة
-                overlapping_reservations = db.session.query(Reservations).filter(
-                    Reservations.DeviceId == device_id,
-                    Reservations.Date == reservation_date,
-                    Reservations.IsAllowed == True,
-                    or_(
-                        and_(
-                            Reservations.StartTime <= start_time,
-                            Reservations.EndTime > start_time
-                        ),
-                        and_(
-                            Reservations.StartTime < end_time,
-                            Reservations.EndTime >= end_time
-                        ),
-                        and_(
-                            Reservations.StartTime >= start_time,
-                            Reservations.EndTime <= end_time
-                        )
-                    )
-                )
-                
-                # استثناء الحجز الحالي في حالة التحديث
-                if exclude_reservation_id:
-                    overlapping_reservations = overlapping_reservations.filter(
-                        Reservations.Id != exclude_reservation_id
-                    )
-                
-                if overlapping_reservations.count() > 0:
-                    return False, f"الجهاز {device.Name} محجوز في هذا الوقت"
-                
-                # البحث عن الصيانة المتداخلة - إذا كان جدول Maintenances موجود
-                try:
-                    from model import Maintenances
-                    overlapping_maintenance = db.session.query(Maintenances).filter(
-                        Maintenances.DeviceId == device_id,
-                        or_(
-                            and_(
-                                Maintenances.StartAt <= datetime.combine(reservation_date, datetime.min.time()),
-                                Maintenances.EndAt >= datetime.combine(reservation_date, datetime.min.time())
-                            )
-                        ),
-                        Maintenances.Status != "مكتملة"
-                    ).count()
-                    
-                    if overlapping_maintenance > 0:
-                        return False, f"الجهاز {device.Name} في الصيانة في هذا التاريخ"
-                except ImportError:
-                    # إذا كان جدول الصيانة غير موجود، تجاهل هذا التحقق
-                    pass
-                    
-                valid_devices.append(device)
-                
-            return True, valid_devices
+            # التحقق من كل الأجهزة دفعة واحدة
+            devices_valid, result = DeviceBatchValidator.validate(
+                device_ids, experiment_id, reservation_date, start_time, end_time, exclude_reservation_id
+            )
+            if devices_valid:
+                return True, result
+
+            reason, device_id, device = result
+            if reason == DeviceBatchValidator.NOT_FOUND:
+                return False, f"الجهاز رقم {device_id} غير موجود"
+            if reason == DeviceBatchValidator.NOT_IN_EXPERIMENT:
+                return False, f"الجهاز رقم {device_id} غير مرتبط بهذه التجربة"
+            if reason == DeviceBatchValidator.UNAVAILABLE:
+                return False, f"الجهاز {device.Name} غير متاح حالياً. الحالة: {device.Status}"
+            if reason == DeviceBatchValidator.RESERVED:
+                return False, f"الجهاز {device.Name} محجوز في هذا الوقت"
+            return False, f"الجهاز {device.Name} في الصيانة في هذا التاريخ"
             
         except Exception as e:
             return False, f"حدث خطأ أثناء التحقق من توفر الأجهزة: {str(e)}"
@@ -212,233 +167,678 @@ class ReservationService:
         return (end_datetime - start_datetime).total_seconds() / 3600
 
     @staticmethod
-    def deduct_reservation_hours(reservation):
-        """تقليل ساعات الحجز القديم"""
-        hours = ReservationService.calculate_hours(
-            reservation.StartTime.strftime("%H:%M"),
-            reservation.EndTime.strftime("%H:%M"),
-            reservation.Date.strftime("%Y-%m-%d")
+    def add_reservation_hours(reservation, devices, lab, experiment, hours, completed_count=1):
+        """إضافة ساعات الحجز"""
+        # تسجيل ساعات المعمل والأجهزة وعدد مرات إجراء التجربة في جدول إضافات العدادات
+        UsageCounterService.record_reservation(
+            lab.LabId, [device.Id for device in devices], experiment.ExperimentId, hours,
+            completed_count=completed_count
         )
         
-        # تقليل ساعات المعمل
-        lab = Laboratories.query.get(reservation.LabId)
-        lab.UsageHours -= hours
-        lab.TotalOperatingHours -= hours
-        
-        # تقليل ساعات الأجهزة
-        devices = Devices.query.join(Reservations).filter(
-            Reservations.Id == reservation.Id
-        ).all()
-        
-        for device in devices:
-            device.CurrentHour -= hours
-            device.TotalOperatingHours -= hours
-            
-        # تقليل عدد مرات إجراء التجربة
-        experiment = Experiments.query.get(reservation.ExperimentId)
-        experiment.CompletedCount -= 1
-        
-        db.session.commit()
+        # يتم الحفظ من قبل الدالة المستدعية ضمن نفس المعاملة
 
     @staticmethod
-    def add_reservation_hours(reservation, devices, lab, experiment, hours):
-        """إضافة ساعات الحجز"""
-        # إضافة ساعات المعمل
-        lab.UsageHours += hours
-        lab.TotalOperatingHours += hours
-        
-        # إضافة ساعات الأجهزة
-        for device in devices:
-            device.CurrentHour += hours
-            device.TotalOperatingHours += hours
-            
-        # زيادة عدد مرات إجراء التجربة
-        experiment.CompletedCount += 1
-        
-        db.session.commit()
+    def _as_id(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
 
     @staticmethod
     def update_reservation(reservation_id, update_data):
+        """
+        تحديث الحجز بناءً على الفرق بين القيم القديمة والجديدة
+
+        يتم التحقق فقط مما تغير (المعمل، التجربة، الأجهزة، الموعد)، وتسجل
+        العدادات كفرق صافٍ. إذا لم يتغير إلا الغرض يحفظ مباشرة بدون تحقق أو قفل.
+        """
         try:
             # الحصول على الحجز الحالي
             reservation = Reservations.query.get(reservation_id)
             if not reservation:
                 return False, "الحجز غير موجود"
 
-            # التحقق من نوع المستخدم
-            user_valid, user = ReservationService.validate_user_type(reservation.UserId)
-            if not user_valid:
-                return False, user
-
             # تحديد البيانات المطلوب تحديثها
-            lab_id = update_data.get('lab_id', reservation.LabId)
-            experiment_id = update_data.get('experiment_id', reservation.ExperimentId)
-            device_ids = update_data.get('device_ids', [reservation.DeviceId])
+            lab_id = ReservationService._as_id(update_data.get('lab_id', reservation.LabId))
+            experiment_id = ReservationService._as_id(update_data.get('experiment_id', reservation.ExperimentId))
+            device_ids = [
+                ReservationService._as_id(device_id)
+                for device_id in update_data.get('device_ids', [reservation.DeviceId])
+            ]
             date_str = update_data.get('date', reservation.Date.strftime("%Y-%m-%d"))
             start_time_str = update_data.get('start_time', reservation.StartTime.strftime("%H:%M"))
             end_time_str = update_data.get('end_time', reservation.EndTime.strftime("%H:%M"))
             purpose = update_data.get('purpose', reservation.Purpose)
 
-            # التحقق من توفر المعمل
-            lab_valid, lab = ReservationService.validate_lab_availability(
-                lab_id, user.UserType, date_str, start_time_str, end_time_str, reservation.Id
+            if not device_ids:
+                return False, "يجب تحديد جهاز واحد على الأقل"
+
+            try:
+                new_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                new_start_time = datetime.strptime(start_time_str, "%H:%M").time()
+                new_end_time = datetime.strptime(end_time_str, "%H:%M").time()
+            except (TypeError, ValueError):
+                return False, "صيغة التاريخ أو الوقت غير صحيحة"
+
+            # الحجز المرفوض سابقاً يتم التحقق منه بالكامل ولا يحسب له خصم
+            was_allowed = bool(reservation.IsAllowed)
+            lab_changed = not was_allowed or lab_id != reservation.LabId
+            experiment_changed = not was_allowed or experiment_id != reservation.ExperimentId
+            devices_changed = not was_allowed or set(device_ids) != {reservation.DeviceId}
+            schedule_changed = not was_allowed or (
+                new_date != reservation.Date
+                or new_start_time.strftime("%H:%M") != reservation.StartTime.strftime("%H:%M")
+                or new_end_time.strftime("%H:%M") != reservation.EndTime.strftime("%H:%M")
             )
-            if not lab_valid:
-                return False, lab
+            slots_changed = lab_changed or devices_changed or schedule_changed
 
-            # التحقق من التجربة
-            exp_valid, experiment = ReservationService.validate_experiment(
-                experiment_id, lab_id, user.UserType
-            )
-            if not exp_valid:
-                return False, experiment
+            # تغيير الغرض فقط: لا تحقق ولا عدادات ولا فهرس
+            if not (slots_changed or experiment_changed):
+                if purpose != reservation.Purpose:
+                    reservation.Purpose = purpose
+                    db.session.commit()
+                return True, "تم تحديث الحجز بنجاح"
 
-            # التحقق من الأجهزة
-            devices_valid, devices = ReservationService.validate_devices(
-                device_ids, experiment_id, date_str, start_time_str, end_time_str, reservation.Id
-            )
-            if not devices_valid:
-                return False, devices
+            # التحقق من نوع المستخدم
+            user_valid, user = ReservationService.validate_user_type(reservation.UserId)
+            if not user_valid:
+                return False, user
 
-            # حساب ساعات الحجز الجديد
-            new_hours = ReservationService.calculate_hours(
-                start_time_str, end_time_str, date_str
-            )
+            old_state = None
+            if was_allowed:
+                old_state = (
+                    reservation.LabId,
+                    [reservation.DeviceId],
+                    reservation.ExperimentId,
+                    ReservationService.calculate_hours(
+                        reservation.StartTime.strftime("%H:%M"),
+                        reservation.EndTime.strftime("%H:%M"),
+                        reservation.Date.strftime("%Y-%m-%d")
+                    )
+                )
 
-            # تقليل ساعات الحجز القديم
-            ReservationService.deduct_reservation_hours(reservation)
-
-            # تحديث بيانات الحجز
-            reservation.LabId = lab_id
-            reservation.ExperimentId = experiment_id
-            reservation.Date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            reservation.StartTime = datetime.strptime(start_time_str, "%H:%M").time()
-            reservation.EndTime = datetime.strptime(end_time_str, "%H:%M").time()
-            reservation.Purpose = purpose
-            reservation.IsAllowed = True
-
-            # إضافة ساعات الحجز الجديد
-            ReservationService.add_reservation_hours(
-                reservation, devices, lab, experiment, new_hours
-            )
+            # القفل يشمل الموعد القديم والجديد، ولا حاجة له إذا لم تتغير الفترات المحجوزة
+            lock = ReservationLock.hold(
+                [reservation.LabId, lab_id],
+                [reservation.DeviceId] + list(device_ids),
+                [reservation.Date, new_date]
+            ) if slots_changed else nullcontext()
+
+            with lock:
+                # التحقق من توفر المعمل
+                if lab_changed or schedule_changed:
+                    lab_valid, lab = ReservationService.validate_lab_availability(
+                        lab_id, user.UserType, date_str, start_time_str, end_time_str, reservation.Id
+                    )
+                    if not lab_valid:
+                        return False, lab
+
+                # التحقق من التجربة
+                if experiment_changed or lab_changed:
+                    exp_valid, experiment = ReservationService.validate_experiment(
+                        experiment_id, lab_id, user.UserType
+                    )
+                    if not exp_valid:
+                        return False, experiment
+
+                # التحقق من الأجهزة
+                if devices_changed or schedule_changed or experiment_changed:
+                    devices_valid, devices = ReservationService.validate_devices(
+                        device_ids, experiment_id, date_str, start_time_str, end_time_str, reservation.Id
+                    )
+                    if not devices_valid:
+                        return False, devices
+
+                # تسجيل الفرق الصافي في العدادات
+                new_state = (
+                    lab_id,
+                    device_ids,
+                    experiment_id,
+                    ReservationService.calculate_hours(start_time_str, end_time_str, date_str)
+                )
+                UsageCounterService.record_deltas(
+                    UsageCounterService.reservation_change_deltas(old_state, new_state)
+                )
 
-            # حفظ التغييرات
-            db.session.commit()
+                # تحديث بيانات الحجز
+                reservation.LabId = lab_id
+                reservation.ExperimentId = experiment_id
+                if devices_changed:
+                    reservation.DeviceId = device_ids[0]
+                reservation.Date = new_date
+                reservation.StartTime = new_start_time
+                reservation.EndTime = new_end_time
+                reservation.Purpose = purpose
+                reservation.IsAllowed = True
+
+                # حفظ التغييرات
+                db.session.flush()
+                index_changes = AvailabilityIndex.capture_changes(
+                    [reservation], user.UserType
+                ) if slots_changed else []
+                db.session.commit()
+
+            # تحديث فهرس الإتاحة بالموعد الجديد
+            AvailabilityIndex.apply_changes(index_changes)
             return True, "تم تحديث الحجز بنجاح"
 
+        except ReservationLockTimeout:
+            db.session.rollback()
+            return False, "يتم حالياً معالجة حجز آخر لنفس الموعد، يرجى المحاولة مرة أخرى"
         except Exception as e:
             db.session.rollback()
             return False, f"حدث خطأ أثناء تحديث الحجز: {str(e)}"
 
+    @staticmethod
+    def record_rejected_attempt(user_id, lab_id, experiment_id, device_ids, date_str, start_time_str, end_time_str,
+                                purpose, reason):
+        """تسجيل محاولة حجز مرفوضة في سجل المحاولات بدلاً من جدول الحجوزات"""
+        return RejectionLog.record(
+            user_id,
+            lab_id,
+            experiment_id,
+            device_ids,
+            datetime.strptime(date_str, "%Y-%m-%d").date(),
+            datetime.strptime(start_time_str, "%H:%M").time(),
+            datetime.strptime(end_time_str, "%H:%M").time(),
+            purpose,
+            reason
+        )
+
     @staticmethod
     def create_reservation(user_id, lab_id, experiment_id, device_ids, date_str, start_time_str, end_time_str, purpose):
         try:
             # 1. التحقق من نوع المستخدم
             user_valid, user_result = ReservationService.validate_user_type(user_id)
             if not user_valid:
-                return None, user_result
+                return None, user_result, False
             user = user_result
 
-            # 2. التحقق من المعمل
-            lab_valid, lab_result = ReservationService.validate_lab_availability(
-                lab_id, user.UserType, date_str, start_time_str, end_time_str
-            )
-            if not lab_valid:
-                # إنشاء حجز مرفوض فقط إذا كان المعمل محجوز في هذا الوقت
-                if "محجوز" in lab_result:
-                    reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    start_time = datetime.strptime(start_time_str, "%H:%M").time()
-                    end_time = datetime.strptime(end_time_str, "%H:%M").time()
-                    
+            # القفل يغطي التحقق والإدخال حتى لا ينجح طلبان متزامنان لنفس الوقت
+            with ReservationLock.hold([lab_id], device_ids, [date_str]):
+                # 2. التحقق من المعمل
+                lab_valid, lab_result = ReservationService.validate_lab_availability(
+                    lab_id, user.UserType, date_str, start_time_str, end_time_str
+                )
+                if not lab_valid:
+                    # تسجيل محاولة مرفوضة فقط إذا كان المعمل محجوز في هذا الوقت
+                    if "محجوز" in lab_result:
+                        attempt_id = ReservationService.record_rejected_attempt(
+                            user_id, lab_id, experiment_id, device_ids,
+                            date_str, start_time_str, end_time_str, purpose, lab_result
+                        )
+                        return attempt_id, lab_result, False
+                    return None, lab_result, False
+                lab = lab_result
+
+                # 3. التحقق من التجربة
+                exp_valid, exp_result = ReservationService.validate_experiment(
+                    experiment_id, lab_id, user.UserType
+                )
+                if not exp_valid:
+                    return None, exp_result, False
+                experiment = exp_result
+
+                # 4. التحقق من الأجهزة
+                devices_valid, devices_result = ReservationService.validate_devices(
+                    device_ids, experiment_id, date_str, start_time_str, end_time_str
+                )
+                if not devices_valid:
+                    # تسجيل محاولة مرفوضة فقط إذا كان الجهاز محجوز في هذا الوقت
+                    if "محجوز" in devices_result:
+                        attempt_id = ReservationService.record_rejected_attempt(
+                            user_id, lab_id, experiment_id, device_ids,
+                            date_str, start_time_str, end_time_str, purpose, devices_result
+                        )
+                        return attempt_id, devices_result, False
+                    return None, devices_result, False
+                devices = devices_result
+
+                # حساب عدد ساعات الحجز
+                hours_count = ReservationService.calculate_hours(
+                    start_time_str, end_time_str, date_str
+                )
+
+                # إنشاء الحجوزات وتحديث الإحصائيات
+                reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
+                start_time = datetime.strptime(start_time_str, "%H:%M").time()
+                end_time = datetime.strptime(end_time_str, "%H:%M").time()
+
+                reservations = []
+                for device in devices:
                     reservation = Reservations(
                         UserId=user_id,
-                        DeviceId=device_ids[0],
+                        DeviceId=device.Id,
                         LabId=lab_id,
                         ExperimentId=experiment_id,
                         Date=reservation_date,
                         StartTime=start_time,
                         EndTime=end_time,
                         Purpose=purpose,
-                        IsAllowed=False
+                        IsAllowed=True
                     )
-                    db.session.add(reservation)
-                    db.session.commit()
-                    return reservation.Id, lab_result
-                return None, lab_result
-            lab = lab_result
+                    reservations.append(reservation)
+
+                # حفظ الحجوزات وتحديث الإحصائيات في معاملة واحدة
+                db.session.add_all(reservations)
+                ReservationService.add_reservation_hours(
+                    reservations[0], devices, lab, experiment, hours_count
+                )
+                db.session.flush()
+                reservation_id = reservations[0].Id
+                index_changes = AvailabilityIndex.capture_changes(reservations, user.UserType)
+                db.session.commit()
+
+            # تحديث فهرس الإتاحة بالحجوزات الجديدة
+            AvailabilityIndex.apply_changes(index_changes)
+
+            return reservation_id, "تم إنشاء الحجز بنجاح", True
+
+        except ReservationLockTimeout:
+            db.session.rollback()
+            return None, "يتم حالياً معالجة حجز آخر لنفس الموعد، يرجى المحاولة مرة أخرى", False
+        except Exception as e:
+            db.session.rollback()
+            return None, f"حدث خطأ أثناء إنشاء الحجز: {str(e)}", False
+
+    @staticmethod
+    def encode_cursor(reservation):
+        """مؤشر الصفحة التالية من مفتاح الترتيب (التاريخ، وقت البداية، الرقم)"""
+        key = [
+            reservation.Date.strftime("%Y-%m-%d"),
+            reservation.StartTime.strftime("%H:%M:%S"),
+            reservation.Id
+        ]
+        return base64.urlsafe_b64encode(json.dumps(key).encode('utf-8')).decode('ascii')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            date_str, time_str, reservation_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+            return (
+                datetime.strptime(date_str, "%Y-%m-%d").date(),
+                datetime.strptime(time_str, "%H:%M:%S").time(),
+                int(reservation_id)
+            )
+        except (ValueError, TypeError, UnicodeError):
+            return None
+
+    @staticmethod
+    def page_etag(page):
+        """قيمة ETag لصفحة من القائمة، تتغير بتغير أي حجز فيها أو بداية الصفحة التالية"""
+        payload = json.dumps(page, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def list_reservations(filters, limit=50, cursor=None):
+        """
+        قائمة الحجوزات مرتبة حسب (Date, StartTime, Id) مع ترقيم صفحات بالمفتاح
+
+        لا يتم استخدام OFFSET، الصفحة التالية تبدأ بعد آخر مفتاح في الصفحة الحالية
+        لذلك تبقى تكلفة الصفحات البعيدة ثابتة.
+        """
+        from sqlalchemy import or_, and_
+
+        try:
+            query = Reservations.query
+
+            if filters.get('lab_id') is not None:
+                query = query.filter(Reservations.LabId == filters['lab_id'])
+            if filters.get('device_id') is not None:
+                query = query.filter(Reservations.DeviceId == filters['device_id'])
+            if filters.get('user_id') is not None:
+                query = query.filter(Reservations.UserId == filters['user_id'])
+            if filters.get('is_allowed') is not None:
+                query = query.filter(Reservations.IsAllowed == filters['is_allowed'])
+
+            try:
+                if filters.get('date_from'):
+                    query = query.filter(
+                        Reservations.Date >= datetime.strptime(filters['date_from'], "%Y-%m-%d").date()
+                    )
+                if filters.get('date_to'):
+                    query = query.filter(
+                        Reservations.Date <= datetime.strptime(filters['date_to'], "%Y-%m-%d").date()
+                    )
+            except ValueError:
+                return False, "صيغة التاريخ غير صحيحة"
+
+            if cursor:
+                key = ReservationService.decode_cursor(cursor)
+                if not key:
+                    return False, "مؤشر الصفحة غير صالح"
+                last_date, last_start_time, last_id = key
+                query = query.filter(
+                    or_(
+                        Reservations.Date > last_date,
+                        and_(
+                            Reservations.Date == last_date,
+                            Reservations.StartTime > last_start_time
+                        ),
+                        and_(
+                            Reservations.Date == last_date,
+                            Reservations.StartTime == last_start_time,
+                            Reservations.Id > last_id
+                        )
+                    )
+                )
+
+            # نجلب صفاً إضافياً لمعرفة وجود صفحة تالية
+            rows = query.order_by(
+                Reservations.Date, Reservations.StartTime, Reservations.Id
+            ).limit(limit + 1).all()
+
+            has_more = len(rows) > limit
+            rows = rows[:limit]
+
+            return True, {
+                "reservations": [
+                    {
+                        "id": reservation.Id,
+                        "date": reservation.Date.strftime("%Y-%m-%d"),
+                        "start_time": reservation.StartTime.strftime("%H:%M"),
+                        "end_time": reservation.EndTime.strftime("%H:%M"),
+                        "purpose": reservation.Purpose,
+                        "device_id": reservation.DeviceId,
+                        "user_id": reservation.UserId,
+                        "experiment_id": reservation.ExperimentId,
+                        "lab_id": reservation.LabId,
+                        "is_allowed": reservation.IsAllowed
+                    }
+                    for reservation in rows
+                ],
+                "next_cursor": ReservationService.encode_cursor(rows[-1]) if has_more else None
+            }
+
+        except Exception as e:
+            return False, f"حدث خطأ أثناء جلب الحجوزات: {str(e)}"
+
+    @staticmethod
+    def expand_recurrence(rule, max_occurrences):
+        """
+        توليد مواعيد الحجز من قاعدة تكرار
+
+        القاعدة: start_date، و until أو count، و frequency (daily أو weekly)،
+        و interval، و weekdays (0 = الاثنين) للتكرار الأسبوعي، و start_time و end_time.
+        """
+        from datetime import timedelta
+
+        for field in ['start_date', 'start_time', 'end_time']:
+            if field not in rule:
+                return False, f"الحقل {field} مطلوب في قاعدة التكرار"
+
+        try:
+            start_date = datetime.strptime(rule['start_date'], "%Y-%m-%d").date()
+            until = datetime.strptime(rule['until'], "%Y-%m-%d").date() if rule.get('until') else None
+            count = int(rule['count']) if rule.get('count') else None
+            interval = int(rule.get('interval', 1))
+        except (TypeError, ValueError):
+            return False, "صيغة قاعدة التكرار غير صحيحة"
+
+        if not until and not count:
+            return False, "يجب تحديد until أو count في قاعدة التكرار"
+        if interval < 1:
+            return False, "قيمة interval يجب أن تكون 1 أو أكثر"
+
+        frequency = rule.get('frequency', 'weekly')
+        if frequency == 'daily':
+            step_days = interval
+        elif frequency == 'weekly':
+            weekdays = sorted(set(rule.get('weekdays') or [start_date.weekday()]))
+            if any(day not in range(7) for day in weekdays):
+                return False, "أيام الأسبوع يجب أن تكون بين 0 و 6"
+            step_days = 7 * interval
+        else:
+            return False, "نوع التكرار غير مدعوم"
+
+        # نولد موعداً زائداً عن الحد الأقصى لمعرفة ما إذا تم تجاوزه
+        cap = max_occurrences + 1
+        limit = min(count, cap) if count else cap
+        occurrences = []
+        if frequency == 'daily':
+            current = start_date
+            while len(occurrences) < limit and (not until or current <= until):
+                occurrences.append(current)
+                current += timedelta(days=step_days)
+        else:
+            week_start = start_date - timedelta(days=start_date.weekday())
+            while len(occurrences) < limit and (not until or week_start <= until):
+                for weekday in weekdays:
+                    current = week_start + timedelta(days=weekday)
+                    if current < start_date:
+                        continue
+                    if (until and current > until) or len(occurrences) >= limit:
+                        break
+                    occurrences.append(current)
+                week_start += timedelta(days=step_days)
+
+        if len(occurrences) > max_occurrences:
+            return False, f"أقصى عدد للمواعيد في الطلب الواحد {max_occurrences}"
+
+        return True, [
+            {
+                "date": occurrence.strftime("%Y-%m-%d"),
+                "start_time": rule['start_time'],
+                "end_time": rule['end_time']
+            }
+            for occurrence in occurrences
+        ]
+
+    @staticmethod
+    def create_bulk_reservations(user_id, lab_id, experiment_id, device_ids, occurrences, purpose):
+        """
+        إنشاء مجموعة حجوزات دفعة واحدة
+
+        يتم التحقق من المستخدم والمعمل والتجربة والأجهزة مرة واحدة، ثم تقارن كل
+        المواعيد بلقطة واحدة من الحجوزات والصيانات الموجودة (وبالمواعيد المقبولة
+        قبلها في نفس الطلب)، وتحفظ المواعيد المقبولة في commit واحد.
+
+        :return: (True, نتيجة كل موعد) أو (False, رسالة الخطأ)
+        """
+        try:
+            from datetime import date
+            from sqlalchemy import or_
+            from model import Maintenances
+
+            # 1. التحقق من نوع المستخدم
+            user_valid, user_result = ReservationService.validate_user_type(user_id)
+            if not user_valid:
+                return False, user_result
+            user = user_result
+
+            # 2. التحقق من المعمل (الحالة والنوع)
+            lab = Laboratories.query.get(lab_id)
+            if not lab:
+                return False, "المعمل غير موجود"
+            if lab.Status != "متاح":
+                return False, f"المعمل غير متاح حالياً. الحالة: {lab.Status}"
+            if user.UserType == "دكتور" and lab.Type != "أكاديمي":
+                return False, "هذا المعمل مخصص للأبحاث فقط"
+            elif user.UserType == "باحث" and lab.Type != "بحثي":
+                return False, "هذا المعمل مخصص للتدريس فقط"
 
             # 3. التحقق من التجربة
             exp_valid, exp_result = ReservationService.validate_experiment(
                 experiment_id, lab_id, user.UserType
             )
             if not exp_valid:
-                return None, exp_result
+                return False, exp_result
             experiment = exp_result
 
-            # 4. التحقق من الأجهزة
-            devices_valid, devices_result = ReservationService.validate_devices(
-                device_ids, experiment_id, date_str, start_time_str, end_time_str
-            )
-            if not devices_valid:
-                # إنشاء حجز مرفوض فقط إذا كان الجهاز محجوز في هذا الوقت
-                if "محجوز" in devices_result:
-                    reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-                    start_time = datetime.strptime(start_time_str, "%H:%M").time()
-                    end_time = datetime.strptime(end_time_str, "%H:%M").time()
-                    
-                    reservation = Reservations(
-                        UserId=user_id,
-                        DeviceId=device_ids[0],
-                        LabId=lab_id,
-                        ExperimentId=experiment_id,
-                        Date=reservation_date,
-                        StartTime=start_time,
-                        EndTime=end_time,
-                        Purpose=purpose,
-                        IsAllowed=False
-                    )
-                    db.session.add(reservation)
-                    db.session.commit()
-                    return reservation.Id, devices_result
-                return None, devices_result
-            devices = devices_result
+            # 4. التحقق من الأجهزة (الوجود والارتباط بالتجربة والحالة)
+            devices_by_id = {
+                device.Id: device
+                for device in Devices.query.filter(Devices.Id.in_(device_ids)).all()
+            }
+            experiment_device_ids = {
+                row[0] for row in db.session.query(ExperimentDevices.DeviceId).filter(
+                    ExperimentDevices.ExperimentId == experiment_id,
+                    ExperimentDevices.DeviceId.in_(device_ids)
+                ).all()
+            }
+            devices = []
+            for device_id in device_ids:
+                device = devices_by_id.get(device_id)
+                if not device:
+                    return False, f"الجهاز رقم {device_id} غير موجود"
+                if device_id not in experiment_device_ids:
+                    return False, f"الجهاز رقم {device_id} غير مرتبط بهذه التجربة"
+                if not DeviceStatus.is_available(device.Status):
+                    return False, f"الجهاز {device.Name} غير متاح حالياً. الحالة: {device.Status}"
+                devices.append(device)
 
-            # حساب عدد ساعات الحجز
-            hours_count = ReservationService.calculate_hours(
-                start_time_str, end_time_str, date_str
-            )
+            # 5. تجهيز المواعيد
+            results = []
+            parsed_occurrences = []
+            today = date.today()
+            for occurrence in occurrences:
+                result = {
+                    "date": occurrence.get('date'),
+                    "start_time": occurrence.get('start_time'),
+                    "end_time": occurrence.get('end_time'),
+                    "success": False
+                }
+                results.append(result)
+                try:
+                    reservation_date = datetime.strptime(occurrence['date'], "%Y-%m-%d").date()
+                    start_time = datetime.strptime(occurrence['start_time'], "%H:%M").time()
+                    end_time = datetime.strptime(occurrence['end_time'], "%H:%M").time()
+                except (KeyError, TypeError, ValueError):
+                    result["message"] = "صيغة التاريخ أو الوقت غير صحيحة"
+                    continue
+                if start_time >= end_time:
+                    result["message"] = "وقت البداية يجب أن يكون قبل وقت النهاية"
+                    continue
+                if reservation_date < today:
+                    result["message"] = "لا يمكن الحجز في تاريخ سابق"
+                    continue
+                parsed_occurrences.append((result, reservation_date, start_time, end_time))
+
+            dates = sorted({item[1] for item in parsed_occurrences})
+            new_reservations = []
+            accepted = []
+            index_changes = []
+
+            # القفل يغطي كل التواريخ حتى تكون اللقطة والإدخال ذريين
+            with ReservationLock.hold([lab_id], device_ids, dates):
+                # 6. لقطة واحدة من الحجوزات والصيانات في كل التواريخ المطلوبة
+                existing_by_date = {}
+                maintenance_windows = []
+                if dates:
+                    existing_reservations = db.session.query(
+                        Reservations.LabId,
+                        Reservations.DeviceId,
+                        Reservations.Date,
+                        Reservations.StartTime,
+                        Reservations.EndTime,
+                        Users.UserType
+                    ).join(Users, Users.Id == Reservations.UserId).filter(
+                        Reservations.Date.in_(dates),
+                        Reservations.IsAllowed == True,
+                        or_(
+                            Reservations.LabId == lab_id,
+                            Reservations.DeviceId.in_(device_ids)
+                        )
+                    ).all()
+                    for row in existing_reservations:
+                        existing_by_date.setdefault(row.Date, []).append(
+                            (row.LabId, row.DeviceId, row.StartTime, row.EndTime, row.UserType)
+                        )
 
-            # إنشاء الحجوزات وتحديث الإحصائيات
-            reservation_date = datetime.strptime(date_str, "%Y-%m-%d").date()
-            start_time = datetime.strptime(start_time_str, "%H:%M").time()
-            end_time = datetime.strptime(end_time_str, "%H:%M").time()
+                    maintenance_windows = db.session.query(
+                        Maintenances.DeviceId,
+                        Maintenances.StartAt,
+                        Maintenances.EndAt
+                    ).filter(
+                        Maintenances.DeviceId.in_(device_ids),
+                        Maintenances.StartAt <= datetime.combine(dates[-1], datetime.min.time()),
+                        Maintenances.EndAt >= datetime.combine(dates[0], datetime.min.time()),
+                        Maintenances.Status != "مكتملة"
+                    ).all()
+
+                # 7. فحص كل موعد مقابل اللقطة والمواعيد المقبولة قبله
+                total_hours = 0
+                for result, reservation_date, start_time, end_time in parsed_occurrences:
+                    day_reservations = existing_by_date.setdefault(reservation_date, [])
+                    day_start = datetime.combine(reservation_date, datetime.min.time())
+
+                    conflict = None
+                    for res_lab_id, res_device_id, res_start, res_end, res_user_type in day_reservations:
+                        if not (res_start < end_time and res_end > start_time):
+                            continue
+                        if res_lab_id == lab_id:
+                            if res_user_type == "دكتور":
+                                conflict = f"المعمل {lab.LabName} محجوز من قبل دكتور في هذا الوقت"
+                            elif user.UserType == "دكتور" and res_user_type == "باحث":
+                                conflict = f"المعمل {lab.LabName} محجوز من قبل باحث في هذا الوقت"
+                            else:
+                                conflict = f"المعمل {lab.LabName} محجوز بالفعل في هذا الوقت"
+                            break
+
+                    if not conflict:
+                        for device in devices:
+                            if any(
+                                res_device_id == device.Id and res_start < end_time and res_end > start_time
+                                for _, res_device_id, res_start, res_end, _ in day_reservations
+                            ):
+                                conflict = f"الجهاز {device.Name} محجوز في هذا الوقت"
+                                break
+                            if any(
+                                window.DeviceId == device.Id and window.StartAt <= day_start <= window.EndAt
+                                for window in maintenance_windows
+                            ):
+                                conflict = f"الجهاز {device.Name} في الصيانة في هذا التاريخ"
+                                break
+
+                    if conflict:
+                        result["message"] = conflict
+                        continue
+
+                    occurrence_reservations = []
+                    for device in devices:
+                        reservation = Reservations(
+                            UserId=user_id,
+                            DeviceId=device.Id,
+                            LabId=lab_id,
+                            ExperimentId=experiment_id,
+                            Date=reservation_date,
+                            StartTime=start_time,
+                            EndTime=end_time,
+                            Purpose=purpose,
+                            IsAllowed=True
+                        )
+                        occurrence_reservations.append(reservation)
+                        day_reservations.append((lab_id, device.Id, start_time, end_time, user.UserType))
 
-            reservations = []
-            for device in devices:
-                reservation = Reservations(
-                    UserId=user_id,
-                    DeviceId=device.Id,
-                    LabId=lab_id,
-                    ExperimentId=experiment_id,
-                    Date=reservation_date,
-                    StartTime=start_time,
-                    EndTime=end_time,
-                    Purpose=purpose,
-                    IsAllowed=True
-                )
-                reservations.append(reservation)
+                    new_reservations.extend(occurrence_reservations)
+                    accepted.append((result, occurrence_reservations))
+                    total_hours += ReservationService.calculate_hours(
+                        start_time.strftime("%H:%M"), end_time.strftime("%H:%M"), reservation_date.strftime("%Y-%m-%d")
+                    )
 
-            # حفظ الحجوزات
-            db.session.add_all(reservations)
-            db.session.commit()
+                # 8. حفظ كل المواعيد المقبولة وتحديث الإحصائيات في commit واحد
+                if new_reservations:
+                    db.session.add_all(new_reservations)
+                    ReservationService.add_reservation_hours(
+                        new_reservations[0], devices, lab, experiment, total_hours,
+                        completed_count=len(accepted)
+                    )
+                    db.session.flush()
+                    for result, occurrence_reservations in accepted:
+                        result["success"] = True
+                        result["message"] = "تم إنشاء الحجز بنجاح"
+                        result["reservation_ids"] = [reservation.Id for reservation in occurrence_reservations]
+                    index_changes = AvailabilityIndex.capture_changes(new_reservations, user.UserType)
+                    db.session.commit()
 
-            # إضافة ساعات الحجز
-            ReservationService.add_reservation_hours(
-                reservations[0], devices, lab, experiment, hours_count
-            )
+            # تحديث فهرس الإتاحة بالحجوزات الجديدة
+            AvailabilityIndex.apply_changes(index_changes)
 
-            return reservations[0].Id, "تم إنشاء الحجز بنجاح"
+            return True, results
 
+        except ReservationLockTimeout:
+            db.session.rollback()
+            return False, "يتم حالياً معالجة حجز آخر لنفس الموعد، يرجى المحاولة مرة أخرى"
         except Exception as e:
             db.session.rollback()
-            return None, f"حدث خطأ أثناء إنشاء الحجز: {str(e)}" 
\ No newline at end of file
+            return False, f"حدث خطأ أثناء إنشاء الحجوزات: {str(e)}"
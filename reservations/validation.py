@@ -0,0 +1,143 @@
+from model import Devices, ExperimentDevices, Reservations, Maintenances
+from datetime import datetime
+from extensions import db
+from catalog import DeviceStatus
+from sqlalchemy import or_, and_, func, literal_column
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def overlapping_time_filter(start_column, end_column, start_time, end_time):
+    """شرط التداخل الزمني بين فترة محفوظة وفترة الحجز المطلوبة"""
+    return or_(
+        and_(
+            start_column <= start_time,
+            end_column > start_time
+        ),
+        and_(
+            start_column < end_time,
+            end_column >= end_time
+        ),
+        and_(
+            start_column >= start_time,
+            end_column <= end_time
+        )
+    )
+
+
+def reservation_minutes(start_column=Reservations.StartTime, end_column=Reservations.EndTime):
+    """مدة الحجز بالدقائق حسب نوع قاعدة البيانات"""
+    if db.engine.dialect.name == 'mssql':
+        return func.datediff(literal_column('minute'), start_column, end_column)
+    return (func.strftime('%s', end_column) - func.strftime('%s', start_column)) / 60
+
+
+class DeviceBatchValidator:
+    """
+    التحقق من مجموعة أجهزة دفعة واحدة بعدد ثابت من الاستعلامات
+
+    يتم جلب الأجهزة وارتباطها بالتجربة والحجوزات المتداخلة والصيانات المفتوحة
+    لكل الأجهزة مرة واحدة، ثم تطبق الفحوصات في الذاكرة بنفس ترتيب الفحص القديم
+    بحيث يعاد أول خطأ لأول جهاز مخالف كما كان سابقاً.
+    """
+
+    NOT_FOUND = "not_found"
+    NOT_IN_EXPERIMENT = "not_in_experiment"
+    UNAVAILABLE = "unavailable"
+    RESERVED = "reserved"
+    IN_MAINTENANCE = "in_maintenance"
+
+    @staticmethod
+    def load_snapshot(device_ids, experiment_id, reservation_date, start_time, end_time, exclude_reservation_id=None):
+        """جلب كل البيانات اللازمة للتحقق من الأجهزة في أربعة استعلامات على الأكثر"""
+        unique_ids = list(set(device_ids))
+
+        # 1. الأجهزة نفسها
+        # تستخدم المفاتيح كنصوص لأن أرقام الأجهزة قد تصل من الطلب كنصوص
+        devices = {
+            str(device.Id): device
+            for device in Devices.query.filter(Devices.Id.in_(unique_ids)).all()
+        }
+
+        # 2. الأجهزة المرتبطة بالتجربة
+        # من قاعدة البيانات دائماً: فهرس التجارب لا يرى ارتباطات التطبيقات الأخرى فوراً
+        experiment_device_ids = {
+            str(row[0]) for row in db.session.query(ExperimentDevices.DeviceId).filter(
+                ExperimentDevices.ExperimentId == experiment_id,
+                ExperimentDevices.DeviceId.in_(unique_ids)
+            ).all()
+        }
+
+        # 3. الأجهزة المحجوزة في نفس الوقت
+        # من قاعدة البيانات دائماً: فهرس الإتاحة لا يرى حجوزات التطبيقات الأخرى فوراً
+        overlapping_reservations = db.session.query(Reservations.DeviceId).filter(
+            Reservations.DeviceId.in_(unique_ids),
+            Reservations.Date == reservation_date,
+            Reservations.IsAllowed == True,
+            overlapping_time_filter(Reservations.StartTime, Reservations.EndTime, start_time, end_time)
+        )
+
+        # استثناء الحجز الحالي في حالة التحديث
+        if exclude_reservation_id:
+            overlapping_reservations = overlapping_reservations.filter(
+                Reservations.Id != exclude_reservation_id
+            )
+
+        reserved_device_ids = {str(row[0]) for row in overlapping_reservations.distinct().all()}
+
+        # 4. الأجهزة التي لديها صيانة مفتوحة في هذا التاريخ
+        maintenance_device_ids = set()
+        try:
+            day_start = datetime.combine(reservation_date, datetime.min.time())
+            maintenance_device_ids = {
+                str(row[0]) for row in db.session.query(Maintenances.DeviceId).filter(
+                    Maintenances.DeviceId.in_(unique_ids),
+                    Maintenances.StartAt <= day_start,
+                    Maintenances.EndAt >= day_start,
+                    Maintenances.Status != "مكتملة"
+                ).distinct().all()
+            }
+        except Exception as e:
+            logger.warning(f"خطأ أثناء التحقق من جدول الصيانة: {str(e)}")
+
+        return {
+            "devices": devices,
+            "experiment_device_ids": experiment_device_ids,
+            "reserved_device_ids": reserved_device_ids,
+            "maintenance_device_ids": maintenance_device_ids
+        }
+
+    @staticmethod
+    def validate(device_ids, experiment_id, reservation_date, start_time, end_time, exclude_reservation_id=None):
+        """
+        التحقق من الأجهزة المطلوبة
+
+        :return: (True, قائمة الأجهزة) أو (False, (سبب الرفض, رقم الجهاز, الجهاز))
+        """
+        snapshot = DeviceBatchValidator.load_snapshot(
+            device_ids, experiment_id, reservation_date, start_time, end_time, exclude_reservation_id
+        )
+
+        valid_devices = []
+        for device_id in device_ids:
+            key = str(device_id)
+            device = snapshot["devices"].get(key)
+            if not device:
+                return False, (DeviceBatchValidator.NOT_FOUND, device_id, None)
+
+            if key not in snapshot["experiment_device_ids"]:
+                return False, (DeviceBatchValidator.NOT_IN_EXPERIMENT, device_id, device)
+
+            if not DeviceStatus.is_available(device.Status):
+                return False, (DeviceBatchValidator.UNAVAILABLE, device_id, device)
+
+            if key in snapshot["reserved_device_ids"]:
+                return False, (DeviceBatchValidator.RESERVED, device_id, device)
+
+            if key in snapshot["maintenance_device_ids"]:
+                return False, (DeviceBatchValidator.IN_MAINTENANCE, device_id, device)
+
+            valid_devices.append(device)
+
+        return True, valid_devices
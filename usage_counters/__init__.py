@@ -0,0 +1,3 @@
+from .services import UsageCounterService
+
+__all__ = ['UsageCounterService']
@@ -0,0 +1,235 @@
+from model import Laboratories, Devices, Experiments, UsageCounterDeltas
+from datetime import datetime
+from extensions import db, scheduler
+from sqlalchemy import func, text
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class UsageCounterService:
+    """
+    تجميع عدادات الاستخدام في جدول إضافات بدلاً من تحديث الصفوف الساخنة
+
+    كل حجز يضيف صفوفاً إلى UsageCounterDeltas ضمن نفس معاملة الحجز، ومهمة
+    مجدولة تدمج هذه الإضافات في جداول المعامل والأجهزة والتجارب كل بضع ثوان.
+    للحصول على القيم الدقيقة الحالية تستخدم current_values التي تجمع القيمة
+    المحفوظة مع الإضافات التي لم تدمج بعد.
+    """
+
+    LAB = "lab"
+    DEVICE = "device"
+    EXPERIMENT = "experiment"
+
+    FOLD_BATCH_SIZE = 5000
+
+    _fold_lock = threading.Lock()
+    _fold_listeners = []
+
+    @staticmethod
+    def init_app(app):
+        """تسجيل مهمة دمج العدادات"""
+        app.config.setdefault('USAGE_COUNTER_FOLD_SECONDS', 5)
+
+        fold_seconds = int(app.config['USAGE_COUNTER_FOLD_SECONDS'])
+        if fold_seconds > 0:
+            scheduler.add_job(
+                id='fold_usage_counters',
+                func=_fold_job,
+                trigger='interval',
+                seconds=fold_seconds,
+                max_instances=1,
+                coalesce=True,
+                replace_existing=True
+            )
+
+    @staticmethod
+    def on_fold(listener):
+        """تسجيل دالة تستدعى بعد كل دمج بقائمة (نوع الكيان, رقمه) التي تغيرت"""
+        UsageCounterService._fold_listeners.append(listener)
+        return listener
+
+    @staticmethod
+    def record_reservation(lab_id, device_ids, experiment_id, hours, completed_count=1):
+        """
+        تسجيل إضافات حجز (أو خصمها بقيم سالبة) ضمن المعاملة الحالية
+
+        لا يتم الحفظ هنا، الدالة المستدعية تقوم بـ commit مع الحجز نفسه.
+        """
+        deltas = [(UsageCounterService.LAB, lab_id, hours, 0)]
+        deltas.extend((UsageCounterService.DEVICE, device_id, hours, 0) for device_id in device_ids)
+        deltas.append((UsageCounterService.EXPERIMENT, experiment_id, 0, completed_count))
+        return UsageCounterService.record_deltas(deltas)
+
+    @staticmethod
+    def record_deltas(deltas):
+        """تسجيل إضافات محسوبة مسبقاً [(نوع الكيان, رقمه, ساعات, عدد)] ضمن المعاملة الحالية"""
+        now = datetime.utcnow()
+        rows = [
+            UsageCounterDeltas(EntityType=entity_type, EntityId=entity_id, Hours=hours, Count=count, CreatedAt=now)
+            for entity_type, entity_id, hours, count in deltas
+            if entity_id is not None and (hours or count)
+        ]
+        db.session.add_all(rows)
+        return rows
+
+    @staticmethod
+    def reservation_change_deltas(old_state, new_state):
+        """
+        صافي التغيير في العدادات عند تعديل حجز
+
+        كل حالة (lab_id, device_ids, experiment_id, hours) أو None إذا لم يكن الحجز
+        محسوباً. الكيانات التي لم يتغير نصيبها لا تظهر في النتيجة.
+        """
+        totals = {}
+        for state, sign in ((old_state, -1), (new_state, 1)):
+            if state is None:
+                continue
+            lab_id, device_ids, experiment_id, hours = state
+            entries = [((UsageCounterService.LAB, lab_id), hours, 0)]
+            entries.extend(((UsageCounterService.DEVICE, device_id), hours, 0) for device_id in set(device_ids))
+            entries.append(((UsageCounterService.EXPERIMENT, experiment_id), 0, 1))
+            for key, entry_hours, entry_count in entries:
+                if key[1] is None:
+                    continue
+                total = totals.setdefault(key, [0.0, 0])
+                total[0] += sign * entry_hours
+                total[1] += sign * entry_count
+
+        return [
+            (entity_type, entity_id, hours, count)
+            for (entity_type, entity_id), (hours, count) in totals.items()
+            if abs(hours) > 1e-9 or count
+        ]
+
+    @staticmethod
+    def pending_deltas(entity_type, entity_ids):
+        """الإضافات التي لم تدمج بعد لكل كيان: {id: (hours, count)}"""
+        rows = db.session.query(
+            UsageCounterDeltas.EntityId,
+            func.sum(UsageCounterDeltas.Hours),
+            func.sum(UsageCounterDeltas.Count)
+        ).filter(
+            UsageCounterDeltas.EntityType == entity_type,
+            UsageCounterDeltas.EntityId.in_(list(entity_ids))
+        ).group_by(UsageCounterDeltas.EntityId).all()
+        return {row[0]: (float(row[1] or 0), int(row[2] or 0)) for row in rows}
+
+    @staticmethod
+    def current_values(entity_type, entity_id):
+        """القيم الدقيقة الحالية للعدادات (المحفوظة + غير المدموجة)"""
+        hours, count = UsageCounterService.pending_deltas(entity_type, [entity_id]).get(entity_id, (0, 0))
+
+        if entity_type == UsageCounterService.LAB:
+            lab = Laboratories.query.get(entity_id)
+            if not lab:
+                return None
+            return {
+                "UsageHours": lab.UsageHours + hours,
+                "TotalOperatingHours": lab.TotalOperatingHours + hours
+            }
+
+        if entity_type == UsageCounterService.DEVICE:
+            device = Devices.query.get(entity_id)
+            if not device:
+                return None
+            return {
+                "CurrentHour": device.CurrentHour + hours,
+                "TotalOperatingHours": device.TotalOperatingHours + hours
+            }
+
+        if entity_type == UsageCounterService.EXPERIMENT:
+            experiment = Experiments.query.get(entity_id)
+            if not experiment:
+                return None
+            return {"CompletedCount": experiment.CompletedCount + count}
+
+        return None
+
+    @staticmethod
+    def fold():
+        """
+        دمج دفعة من الإضافات في الجداول الرئيسية وحذفها في معاملة واحدة
+
+        :return: قائمة (نوع الكيان, رقمه) التي تم تحديثها
+        """
+        with UsageCounterService._fold_lock:
+            try:
+                # على SQL Server نمنع نسختين من التطبيق من الدمج في نفس الوقت
+                if db.engine.dialect.name == 'mssql':
+                    result = db.session.execute(text(
+                        "SET NOCOUNT ON; DECLARE @result INT; "
+                        "EXEC @result = sp_getapplock @Resource = 'usage_counters:fold', @LockMode = 'Exclusive', "
+                        "@LockOwner = 'Transaction', @LockTimeout = 0; "
+                        "SELECT @result"
+                    )).scalar()
+                    if result is None or result < 0:
+                        db.session.rollback()
+                        return []
+
+                # نقرأ الصفوف نفسها ونحذفها بأرقامها حتى لا يحذف صف لم يتم جمعه
+                rows = db.session.query(
+                    UsageCounterDeltas.Id,
+                    UsageCounterDeltas.EntityType,
+                    UsageCounterDeltas.EntityId,
+                    UsageCounterDeltas.Hours,
+                    UsageCounterDeltas.Count
+                ).order_by(UsageCounterDeltas.Id).limit(UsageCounterService.FOLD_BATCH_SIZE).all()
+                if not rows:
+                    db.session.rollback()
+                    return []
+
+                totals = {}
+                for _, entity_type, entity_id, hours, count in rows:
+                    entry = totals.setdefault((entity_type, entity_id), [0.0, 0])
+                    entry[0] += float(hours or 0)
+                    entry[1] += int(count or 0)
+
+                changed = []
+                for (entity_type, entity_id), (hours, count) in totals.items():
+                    if entity_type == UsageCounterService.LAB and hours:
+                        Laboratories.query.filter(Laboratories.LabId == entity_id).update({
+                            Laboratories.UsageHours: Laboratories.UsageHours + hours,
+                            Laboratories.TotalOperatingHours: Laboratories.TotalOperatingHours + hours
+                        }, synchronize_session=False)
+                    elif entity_type == UsageCounterService.DEVICE and hours:
+                        Devices.query.filter(Devices.Id == entity_id).update({
+                            Devices.CurrentHour: Devices.CurrentHour + hours,
+                            Devices.TotalOperatingHours: Devices.TotalOperatingHours + hours
+                        }, synchronize_session=False)
+                    elif entity_type == UsageCounterService.EXPERIMENT and count:
+                        Experiments.query.filter(Experiments.ExperimentId == entity_id).update({
+                            Experiments.CompletedCount: Experiments.CompletedCount + count
+                        }, synchronize_session=False)
+                    else:
+                        continue
+                    changed.append((entity_type, entity_id))
+
+                row_ids = [row[0] for row in rows]
+                for position in range(0, len(row_ids), 1000):
+                    UsageCounterDeltas.query.filter(
+                        UsageCounterDeltas.Id.in_(row_ids[position:position + 1000])
+                    ).delete(synchronize_session=False)
+
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+
+        for listener in UsageCounterService._fold_listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                logger.error(f"خطأ أثناء معالجة نتيجة دمج العدادات: {str(e)}")
+
+        return changed
+
+
+def _fold_job():
+    """مهمة الجدولة لدمج عدادات الاستخدام"""
+    with scheduler.app.app_context():
+        try:
+            UsageCounterService.fold()
+        except Exception as e:
+            logger.error(f"خطأ أثناء دمج عدادات الاستخدام: {str(e)}")